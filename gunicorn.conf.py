@@ -0,0 +1,32 @@
+"""
+gunicorn settings, read from the working directory by a plain `gunicorn`.
+
+SERVER_MODE picks how the site is served:
+
+- 'wsgi' (default): mysite.wsgi on gunicorn's sync workers, one request per
+  worker at a time.
+- 'asgi': mysite.asgi on uvicorn workers. The hot read endpoints run as async
+  views (see main/async_views.py) and the live listing feed can stream.
+
+ASGI pays for its thread hops with CPU time on every request, so it only
+wins when requests spend their time waiting on the database: compare both
+with `python manage.py run_load_benchmark`. Each in-flight ASGI request
+holds its own database connection (mysite/asgi.py turns persistent
+connections off); put a connection pooler in front of PostgreSQL before
+raising the client count.
+
+Workers and the bind address follow gunicorn's own WEB_CONCURRENCY and PORT
+environment variables in both modes.
+"""
+# gunicorn reads module-level names as settings, and `config` is one
+import decouple
+
+SERVER_MODE = decouple.config('SERVER_MODE', default='wsgi')
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'mysite.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+elif SERVER_MODE == 'wsgi':
+    wsgi_app = 'mysite.wsgi:application'
+else:
+    raise ValueError(f"SERVER_MODE must be 'wsgi' or 'asgi', not {SERVER_MODE!r}")
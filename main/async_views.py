@@ -0,0 +1,89 @@
+"""
+Async dispatch for DRF viewsets under an ASGI server.
+
+With ASYNC_VIEWS on (mysite/asgi.py turns it on), AsyncViewSetMixin makes
+a viewset's views coroutines. An action with an `a<action>` coroutine
+method (e.g. `alist`) runs on the event loop and reads through the async
+ORM; every other action, and the parts DRF only offers synchronously
+(authentication, permissions, throttling), runs in a worker thread through
+sync_to_async. Under WSGI the viewset stays fully synchronous.
+
+Django 5.0's async ORM still runs each query in a thread, so a single
+request is no faster, and the thread hops cost CPU. What changes is that a
+request waiting on the database no longer holds a gunicorn worker: one
+worker serves many concurrent clients (see gunicorn.conf.py).
+"""
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+
+
+class AsyncViewSetMixin:
+    # Set for views built while ASYNC_VIEWS is on
+    async_dispatch = False
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        if not settings.ASYNC_VIEWS:
+            return super().as_view(actions, **initkwargs)
+        view = super().as_view(actions, async_dispatch=True, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            # dispatch() returns the adispatch() coroutine
+            return await view(request, *args, **kwargs)
+
+        # Keeps cls, initkwargs, actions and csrf_exempt for the router
+        return update_wrapper(async_view, view)
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.async_dispatch:
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """APIView.dispatch(), awaiting the handler."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication may load the user from the database
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = None
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, f'a{self.action}', None)
+            if handler is not None:
+                response = await handler(request, *args, **kwargs)
+            else:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        """get_object() through the async ORM."""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        """paginate_queryset(), async when the paginator supports it."""
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
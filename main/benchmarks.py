@@ -0,0 +1,327 @@
+"""
+Scripted API benchmarks (python manage.py run_benchmarks).
+
+Each scenario sends one kind of request through the full middleware stack
+with Django's test client against the configured database, normally
+filled by `generate_synthetic_data`. Latency percentiles and the SQL
+statement count are compared with a stored baseline.
+
+The load benchmark (python manage.py run_load_benchmark) instead runs real
+gunicorn servers, sync WSGI and uvicorn ASGI, and measures throughput under
+many concurrent clients.
+"""
+import json
+import math
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+
+from .metrics import QueryTracker
+from .models import ActiveScanner, Keyword, Listing, ListingFacet, ListingKeywordMatch, Location
+from .pagination import StandardResultsSetPagination
+
+# A scenario regresses when its p95 grows by more than the threshold (and
+# by more than this, so sub-millisecond noise doesn't count) or when it runs
+# more queries than in the baseline
+MIN_REGRESSION_MS = 1.0
+
+# ?fields= for the scenario that reads descriptions
+FULL_FIELDS = ['listing_idx', 'title', 'price', 'description', 'url', 'img', 'created_at']
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: str
+    params: dict = field(default_factory=dict)
+    method: str = 'get'
+    # Called before every request to produce the POST body
+    body: object = None
+    # Called once afterwards to undo the scenario's writes
+    teardown: object = None
+
+
+def sample_values():
+    """Real filter values from the data, so filtered scenarios return rows."""
+    # Most common value per facet: later (larger) rows win
+    facets = dict(ListingFacet.objects.filter(listing_count__gt=0).order_by('listing_count').values_list('facet', 'value'))
+    keyword = ListingKeywordMatch.objects.values_list('keyword__keyword', flat=True).first()
+    latest = Listing.objects.order_by('-created_at').values('listing_idx', 'title').first() or {}
+    title = latest.get('title') or ''
+    centre = Location.objects.filter(name=facets.get('search_location'), latitude__isnull=False).first()
+    return {
+        'query': facets.get('query', ''),
+        'category': facets.get('category', ''),
+        'search_location': facets.get('search_location', ''),
+        'keyword': keyword or '',
+        'word': (title.split() or [''])[0],
+        'listing_idx': latest.get('listing_idx'),
+        'scanner_id': benchmark_scanner_id(),
+        'near': f'{centre.latitude},{centre.longitude}' if centre else '39.74,-104.99',
+    }
+
+
+def benchmark_scanner_id():
+    """
+    The synthetic scanner whose keywords the bulk update scenario rewrites,
+    or None. Never a real scanner: deleting its keywords would also delete
+    their stored listing matches, which restoring the keywords can't undo.
+    """
+    return ActiveScanner.objects.filter(
+        scannerlocationmapping__location__marketplace_url_slug__startswith='synthetic-'
+    ).order_by('id').values_list('id', flat=True).first()
+
+
+def build_scenarios(client, page_depth=20):
+    values = sample_values()
+    pages = math.ceil(Listing.objects.count() / StandardResultsSetPagination.page_size)
+    page_depth = max(1, min(page_depth, pages))
+    scenarios = [
+        Scenario('listings_first_page', '/api/listings/'),
+        Scenario('listings_query', '/api/listings/', {'query': values['query']}),
+        Scenario('listings_query_location', '/api/listings/', {
+            'query': values['query'], 'search_location': values['search_location'],
+        }),
+        Scenario('listings_category', '/api/listings/', {'category': values['category']}),
+        Scenario('listings_price_range', '/api/listings/', {'min_price': '50', 'max_price': '500'}),
+        Scenario('listings_distance', '/api/listings/', {
+            'search_location': values['search_location'], 'max_distance': '25',
+        }),
+        Scenario('listings_near', '/api/listings/', {'near': values['near'], 'radius_km': '25'}),
+        Scenario('listings_watchlist', '/api/listings/', {'watchlist': 'true'}),
+        Scenario('listings_price_dropped', '/api/listings/', {'price_dropped': 'true'}),
+        Scenario('listings_collapse_duplicates', '/api/listings/', {'collapse_duplicates': 'true'}),
+        Scenario('listings_keyword', '/api/listings/', {'keyword': values['keyword']}),
+        Scenario('listings_search', '/api/listings/', {'q': values['word']}),
+        Scenario('listings_full_fields', '/api/listings/', {'limit': '100', 'fields': ','.join(FULL_FIELDS)}),
+        Scenario('listings_deep_page', '/api/listings/', {'page': str(page_depth)}),
+        Scenario('listings_deep_cursor', '/api/listings/', {'cursor': deep_cursor(client, page_depth)}),
+        Scenario('filter_options', '/api/listings/filter_options/'),
+        Scenario('scanners_list', '/api/scanners/'),
+    ]
+    if values['listing_idx'] is not None:
+        scenarios.append(Scenario('listing_detail', f"/api/listings/{values['listing_idx']}/"))
+    if values['scanner_id'] is not None:
+        scenarios.append(keyword_update_scenario(values['scanner_id']))
+    return scenarios
+
+
+def deep_cursor(client, depth):
+    """Cursor for page `depth` of the default listing order, found by walking there."""
+    url = '/api/listings/?pagination=cursor'
+    cursor = ''
+    for _ in range(depth - 1):
+        next_url = client.get(url).json().get('next')
+        if not next_url:
+            break
+        url = next_url
+        cursor = parse_qs(urlsplit(next_url).query)['cursor'][0]
+    return cursor
+
+
+def keyword_update_scenario(scanner_id):
+    """Alternate a scanner's keywords between two overlapping sets, then restore them."""
+    sets = [['mint', 'bundle', 'warranty'], ['mint', 'receipt', 'oak', 'leather']]
+    original = list(Keyword.objects.filter(filterID=scanner_id).order_by('id').values_list('keyword', flat=True))
+    state = {'calls': 0}
+
+    def body():
+        state['calls'] += 1
+        return {'scannerId': scanner_id, 'keywords': sets[state['calls'] % 2]}
+
+    def teardown(client):
+        client.post(
+            '/api/keywords/bulk-update/',
+            json.dumps({'scannerId': scanner_id, 'keywords': [text for text in original if text]}),
+            content_type='application/json',
+        )
+
+    return Scenario(
+        'keywords_bulk_update', '/api/keywords/bulk-update/', method='post', body=body, teardown=teardown
+    )
+
+
+def benchmark_host():
+    """A host ALLOWED_HOSTS accepts, or None when the default one will do."""
+    hosts = [host for host in settings.ALLOWED_HOSTS if host and not host.startswith(('.', '*'))]
+    if '*' in settings.ALLOWED_HOSTS or not hosts:
+        return None
+    return hosts[0]
+
+
+def benchmark_client():
+    host = benchmark_host()
+    return Client(HTTP_HOST=host) if host else Client()
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def run_scenario(client, scenario, iterations, warmup):
+    try:
+        return measure(client, scenario, iterations, warmup)
+    finally:
+        if scenario.teardown is not None:
+            scenario.teardown(client)
+
+
+def measure(client, scenario, iterations, warmup):
+    timings = []
+    queries = []
+    for run in range(warmup + iterations):
+        if scenario.body is not None:
+            kwargs = {'data': json.dumps(scenario.body()), 'content_type': 'application/json'}
+        else:
+            kwargs = {'data': scenario.params}
+        tracker = QueryTracker()
+        with connection.execute_wrapper(tracker):
+            start = time.perf_counter()
+            response = getattr(client, scenario.method)(scenario.path, **kwargs)
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise RuntimeError(f'{scenario.name}: HTTP {response.status_code}')
+        if run >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(tracker.count)
+    timings.sort()
+    return {
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'queries': int(statistics.median(queries)),
+    }
+
+
+def regressions(results, baseline, threshold):
+    """Messages for every scenario slower or chattier than its baseline."""
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        limit = before['p95_ms'] * (1 + threshold)
+        if result['p95_ms'] > limit and result['p95_ms'] - before['p95_ms'] > MIN_REGRESSION_MS:
+            found.append(f"{name}: p95 {result['p95_ms']:.1f} ms, baseline {before['p95_ms']:.1f} ms")
+        if result['queries'] > before['queries']:
+            found.append(f"{name}: {result['queries']} queries, baseline {before['queries']}")
+    return found
+
+
+# Load benchmark (python manage.py run_load_benchmark): the same concurrent
+# clients against real gunicorn servers in each SERVER_MODE (gunicorn.conf.py)
+
+LOAD_SCENARIOS = (
+    'listings_first_page', 'listings_query', 'listings_search', 'listings_deep_page',
+    'listing_detail', 'filter_options', 'scanners_list',
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def gunicorn_server(mode, workers, ready_path, timeout=30):
+    """Run gunicorn in `mode` on a free local port and yield its base URL once it answers."""
+    port = free_port()
+    env = dict(os.environ, SERVER_MODE=mode)
+    # Workers read ASYNC_VIEWS on their own: mysite/asgi.py turns it on
+    env.pop('ASYNC_VIEWS', None)
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--log-level', 'warning'],
+        cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                log.seek(0)
+                raise RuntimeError(f'{mode} server exited:\n{log.read().decode(errors="replace")}')
+            try:
+                if requests.get(base_url + ready_path, headers=load_headers(), timeout=2).ok:
+                    break
+            except requests.ConnectionError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'{mode} server did not answer within {timeout} s')
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+def load_headers():
+    host = benchmark_host()
+    return {'Host': host} if host else {}
+
+
+def load_urls(scenarios):
+    return [scenario.path + ('?' + urlencode(scenario.params) if scenario.params else '') for scenario in scenarios]
+
+
+def run_load(base_url, urls, clients, duration):
+    """
+    `clients` keep-alive clients each request `urls` round robin, without
+    think time, for `duration` seconds.
+    """
+    headers = load_headers()
+    deadline = time.monotonic() + duration
+
+    def client(offset):
+        timings = []
+        errors = 0
+        with requests.Session() as session:
+            index = offset
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok = session.get(base_url + urls[index % len(urls)], headers=headers, timeout=60).ok
+                except requests.RequestException:
+                    ok = False
+                timings.append((time.perf_counter() - start) * 1000)
+                errors += not ok
+                index += 1
+        return timings, errors
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(clients) as executor:
+        results = list(executor.map(client, range(clients)))
+    elapsed = time.monotonic() - started
+
+    timings = sorted(timing for client_timings, _ in results for timing in client_timings)
+    if not timings:
+        raise RuntimeError('No requests completed')
+    return {
+        'requests': len(timings),
+        'errors': sum(errors for _, errors in results),
+        'rps': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+    }
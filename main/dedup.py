@@ -0,0 +1,101 @@
+"""
+Near-duplicate listing detection.
+
+Sellers repost the same item under new URLs and in several search
+locations. Each listing gets a 64-bit SimHash of its normalized title,
+description and price bucket (Listing.simhash); listings whose hashes differ
+in at most MAX_DISTANCE bits are treated as the same item.
+
+Candidates come from an index lookup rather than a pairwise scan: the hash is
+split into BANDS 16-bit bands stored in ListingFingerprintBand, indexed on
+(band, value). Two hashes within MAX_DISTANCE < BANDS bits of each other
+agree exactly on at least one band, so every near duplicate shares a band
+row with its match.
+
+The oldest listing of a cluster is its canonical listing; later members
+point at it through Listing.duplicate_of.
+"""
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Listing, ListingFingerprintBand
+from .simhash import MAX_DISTANCE, fingerprint_bands, hamming_distance
+
+
+def canonical_ids(fingerprints, band_model):
+    """
+    Find the canonical listing for each of `fingerprints`, (listing_idx,
+    simhash) pairs in ascending listing_idx order.
+
+    Candidates are stored listings sharing a band row, plus earlier entries
+    of `fingerprints` itself. A listing only ever points at an older one, so
+    clusters can't form cycles. Returns {listing_idx: canonical id or None}.
+    """
+    wanted = defaultdict(set)
+    for _, value in fingerprints:
+        if value is not None:
+            for band, band_value in fingerprint_bands(value):
+                wanted[band].add(band_value)
+    if not wanted:
+        return {listing_id: None for listing_id, _ in fingerprints}
+
+    lookup = Q()
+    for band, values in wanted.items():
+        lookup |= Q(band=band, value__in=values)
+    # (band, value) -> [(listing_idx, simhash, duplicate_of_id)]
+    candidates = defaultdict(list)
+    rows = band_model.objects.filter(lookup).values_list(
+        'band', 'value', 'listing_id', 'listing__simhash', 'listing__duplicate_of_id'
+    )
+    for band, band_value, *candidate in rows:
+        candidates[band, band_value].append(tuple(candidate))
+
+    result = {}
+    for listing_id, value in fingerprints:
+        if value is None:
+            result[listing_id] = None
+            continue
+        canonical = None
+        pairs = fingerprint_bands(value)
+        for pair in pairs:
+            for other_id, other_value, other_canonical in candidates[pair]:
+                if other_id >= listing_id or other_value is None:
+                    continue
+                if hamming_distance(value, other_value) <= MAX_DISTANCE:
+                    other_canonical = other_canonical or other_id
+                    canonical = other_canonical if canonical is None else min(canonical, other_canonical)
+        result[listing_id] = canonical
+        # Later listings in the same batch can match this one
+        for pair in pairs:
+            candidates[pair].append((listing_id, value, canonical))
+    return result
+
+
+def store_fingerprints(listings, replace=False):
+    """
+    Store the band rows of saved listings and link each to its cluster's
+    canonical listing.
+
+    With `replace`, the listings' previous band rows are removed first (used
+    when re-scanned listings changed).
+    """
+    listings = sorted((listing for listing in listings if listing.pk is not None), key=lambda listing: listing.pk)
+    if replace:
+        ListingFingerprintBand.objects.filter(listing_id__in=[listing.pk for listing in listings]).delete()
+
+    canonical = canonical_ids([(listing.pk, listing.simhash) for listing in listings], ListingFingerprintBand)
+    moved = []
+    for listing in listings:
+        if listing.duplicate_of_id != canonical[listing.pk]:
+            listing.duplicate_of_id = canonical[listing.pk]
+            moved.append(listing)
+    Listing.objects.bulk_update(moved, ['duplicate_of'], batch_size=1000)
+    ListingFingerprintBand.objects.bulk_create(
+        [
+            ListingFingerprintBand(listing_id=listing.pk, band=band, value=value)
+            for listing in listings if listing.simhash is not None
+            for band, value in fingerprint_bands(listing.simhash)
+        ],
+        batch_size=1000,
+    )
@@ -0,0 +1,26 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class Echo:
+    """File-like object whose write() hands the written line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def stream_ndjson(fields, rows):
+    """Yield one JSON object per row, newline delimited."""
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def stream_csv(fields, rows):
+    """Yield a CSV header line followed by one line per row."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
@@ -0,0 +1,78 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Listing, ListingFacet
+
+# Facet name -> Listing column it is taken from
+FACET_FIELDS = {
+    'query': 'query',
+    'category': 'search_title',
+    'search_location': 'search_location',
+}
+
+
+def facet_values(values):
+    """
+    Return the (facet, value) pairs for a mapping of Listing column values.
+
+    Columns missing from `values` (e.g. deferred) and empty values are skipped.
+    """
+    pairs = []
+    for facet, field in FACET_FIELDS.items():
+        value = values.get(field)
+        if value:
+            pairs.append((facet, value))
+    return pairs
+
+
+def listing_facet_values(listing):
+    # Read from __dict__ so deferred fields are never loaded as a side effect
+    return facet_values(listing.__dict__)
+
+
+def facet_deltas(old_pairs, new_pairs):
+    """Counter of (facet, value) -> change in listing count."""
+    deltas = Counter(new_pairs)
+    deltas.subtract(Counter(old_pairs))
+    return deltas
+
+
+def apply_facet_deltas(deltas):
+    """Apply listing count changes to the facet table, creating rows as needed."""
+    # Sorted so concurrent writers lock facet rows in the same order
+    for (facet, value), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        rows = ListingFacet.objects.filter(facet=facet, value=value)
+        if rows.update(listing_count=F('listing_count') + delta) or delta < 0:
+            continue
+        try:
+            with transaction.atomic():
+                ListingFacet.objects.create(facet=facet, value=value, listing_count=delta)
+        except IntegrityError:
+            # Created concurrently; fall back to incrementing it
+            rows.update(listing_count=F('listing_count') + delta)
+
+
+def rebuild_facets():
+    """Recompute the facet table from the listings table."""
+    facets = []
+    for facet, field in FACET_FIELDS.items():
+        counts = (
+            Listing.objects.exclude(**{f'{field}__isnull': True})
+            .exclude(**{field: ''})
+            .order_by()
+            .values(field)
+            .annotate(listing_count=Count('pk'))
+        )
+        facets.extend(
+            ListingFacet(facet=facet, value=row[field], listing_count=row['listing_count'])
+            for row in counts
+        )
+
+    with transaction.atomic():
+        ListingFacet.objects.all().delete()
+        ListingFacet.objects.bulk_create(facets, batch_size=1000)
+    return len(facets)
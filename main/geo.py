@@ -0,0 +1,144 @@
+"""
+Radius search over listing coordinates.
+
+Listings carry latitude/longitude and a geohash of them (Listing.geohash,
+indexed). A `near` query covers the circle's bounding box with a handful of
+geohash cells, probes the index with one range per cell, and then keeps the
+rows whose great-circle distance is within the radius.
+
+Geohash prefixes are compared as ranges rather than LIKE patterns so the
+plain btree index serves them under any database collation.
+"""
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5 m cells
+# Largest number of cells a bounding box is covered with; coarser cells mean
+# fewer index ranges but more rows for the exact check
+MAX_COVERING_CELLS = 16
+# ?near= without ?radius_km=
+DEFAULT_RADIUS_KM = 25.0
+
+
+def parse_point(text):
+    """(latitude, longitude) from "lat,lon"; raises ValueError."""
+    latitude, longitude = (float(part) for part in text.split(','))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError(text)
+    return latitude, longitude
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(degrees latitude, degrees longitude) spanned by a geohash cell."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) around a circle; longitudes may pass +/-180."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    min_lat, max_lat = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    if min_lat == -90.0 or max_lat == 90.0:
+        # The circle contains a pole: every longitude is in range
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = min(180.0, radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(latitude))))
+    return min_lat, max_lat, longitude - dlon, longitude + dlon
+
+
+def wrap_longitude(longitude):
+    return (longitude + 180.0) % 360.0 - 180.0
+
+
+def steps(start, stop, step):
+    value = start
+    while value < stop:
+        yield value
+        value += step
+    yield stop
+
+
+def covering_cells(min_lat, max_lat, min_lon, max_lon):
+    """The geohash cells, as few as MAX_COVERING_CELLS allows, covering a bounding box."""
+    precision = GEOHASH_PRECISION
+    while precision > 1:
+        cell_lat, cell_lon = cell_size(precision)
+        count = (math.ceil((max_lat - min_lat) / cell_lat) + 1) * (math.ceil((max_lon - min_lon) / cell_lon) + 1)
+        if count <= MAX_COVERING_CELLS:
+            break
+        precision -= 1
+    cell_lat, cell_lon = cell_size(precision)
+    return sorted({
+        encode_geohash(latitude, wrap_longitude(longitude), precision)
+        for latitude in steps(min_lat, max_lat, cell_lat)
+        for longitude in steps(min_lon, max_lon, cell_lon)
+    })
+
+
+def distance_km_expression(latitude, longitude):
+    """Haversine distance from a point to each row's coordinates, in km."""
+    dlat = Radians(F('latitude') - latitude)
+    dlon = Radians(F('longitude') - longitude)
+    a = Power(Sin(dlat / 2), 2) + math.cos(math.radians(latitude)) * Cos(Radians(F('latitude'))) * Power(Sin(dlon / 2), 2)
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
+
+
+def filter_near(queryset, latitude, longitude, radius_km):
+    """Listings within `radius_km` of a point: geohash index probe, then an exact check."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+
+    cells = Q()
+    for cell in covering_cells(min_lat, max_lat, min_lon, max_lon):
+        # Every geohash starting with `cell`; 'z' is the alphabet's last letter
+        cells |= Q(geohash__gte=cell, geohash__lte=cell + 'z' * (GEOHASH_PRECISION - len(cell)))
+
+    if min_lon < -180.0 or max_lon > 180.0:
+        # The box crosses the antimeridian
+        longitudes = Q(longitude__gte=wrap_longitude(min_lon)) | Q(longitude__lte=wrap_longitude(max_lon))
+    else:
+        longitudes = Q(longitude__gte=min_lon, longitude__lte=max_lon)
+
+    return (
+        queryset.filter(cells, longitudes, latitude__gte=min_lat, latitude__lte=max_lat)
+        .alias(distance_km=distance_km_expression(latitude, longitude))
+        .filter(distance_km__lte=radius_km)
+    )
+
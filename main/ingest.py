@@ -0,0 +1,186 @@
+from zlib import crc32
+
+from django.db import connection, transaction
+
+from .dedup import store_fingerprints
+from .facets import apply_facet_deltas, facet_deltas, facet_values, listing_facet_values
+from .geo import encode_geohash
+from .live import publish_new_listings
+from .matching import store_matches
+from .models import Listing, ListingPriceHistory, Location
+from .pricing import is_price_change
+from .versions import bump_versions
+
+# Scraped columns that a re-scan overwrites on an existing listing. created_at
+# and watchlist are deliberately left alone.
+SCRAPED_FIELDS = [
+    'price', 'title', 'location', 'description', 'distance', 'latitude', 'longitude', 'url', 'img',
+    'query', 'search_title', 'scanner_id', 'search_location',
+]
+UPSERT_FIELDS = SCRAPED_FIELDS + [field for field in Listing.DERIVED_FIELDS if field != 'url_key'] + ['previous_price_cents']
+
+# Keeps parameter counts well under every backend's limit
+BATCH_SIZE = 500
+
+# Advisory lock namespace and bucket count for new url_keys (see
+# lock_new_listings); the buckets bound how many locks one ingest holds
+NEW_LISTING_LOCK_NAMESPACE = 0x4c535447
+NEW_LISTING_LOCK_BUCKETS = 256
+
+
+def ingest_listings(rows):
+    """
+    Insert or update validated listing dicts, deduplicated on Listing.url_key.
+
+    Rows are upserted with one INSERT ... ON CONFLICT per batch inside a single
+    transaction. Rows without coordinates are geocoded from their `location`
+    text (see geocode_listings). Rows without a usable URL, and all but the last row for a
+    URL repeated within `rows`, are skipped. Existing listings whose content
+    hash (price, title, description, img) is unchanged are not written at
+    all; price changes are appended to ListingPriceHistory. Concurrent
+    ingests of the same new URL are serialized (see lock_new_listings), so
+    only one of them counts it as new, adds it to the facet counts and
+    publishes it to the live feed.
+
+    Returns a dict with 'inserted', 'updated', 'unchanged' and 'skipped' counts.
+    """
+    listings = {}
+    skipped = 0
+    for row in rows:
+        listing = Listing(**row)
+        listing.refresh_derived_fields()
+        if not listing.url_key:
+            skipped += 1
+            continue
+        if listing.url_key in listings:
+            skipped += 1
+        listings[listing.url_key] = listing
+
+    if not listings:
+        return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': skipped}
+    geocode_listings(listings.values())
+
+    with transaction.atomic():
+        existing = existing_listings(listings.keys())
+        new_keys = [key for key in listings if key not in existing]
+        if new_keys:
+            lock_new_listings(new_keys)
+            # Another ingest may have committed some of them meanwhile
+            existing.update(existing_listings(new_keys))
+        changed = {}
+        price_changes = []
+        for key, listing in listings.items():
+            old = existing.get(key)
+            if old is None:
+                changed[key] = listing
+                continue
+            if old['content_hash'] == listing.content_hash:
+                continue
+            changed[key] = listing
+            listing.duplicate_of_id = old['duplicate_of_id']
+            listing.previous_price_cents = old['previous_price_cents']
+            if is_price_change(old['price_cents'], listing.price_cents):
+                listing.previous_price_cents = old['price_cents']
+                price_changes.append(ListingPriceHistory(
+                    listing_id=old['listing_idx'],
+                    old_price_cents=old['price_cents'],
+                    new_price_cents=listing.price_cents,
+                    price_currency=listing.price_currency,
+                ))
+
+        if changed:
+            Listing.objects.bulk_create(
+                list(changed.values()),
+                batch_size=BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['url_key'],
+                update_fields=UPSERT_FIELDS,
+            )
+            ListingPriceHistory.objects.bulk_create(price_changes, batch_size=BATCH_SIZE)
+
+            deltas = facet_deltas(
+                [pair for key in changed if key in existing for pair in facet_values(existing[key])],
+                [pair for listing in changed.values() for pair in listing_facet_values(listing)],
+            )
+            apply_facet_deltas(deltas)
+
+            if any(listing.pk is None for listing in changed.values()):
+                # Backends that can't return ids from an upsert
+                assign_primary_keys(changed)
+            new_listings = [listing for key, listing in changed.items() if key not in existing]
+            updated_listings = [listing for key, listing in changed.items() if key in existing]
+            store_matches(new_listings)
+            store_matches(updated_listings, replace=True)
+            store_fingerprints(new_listings)
+            store_fingerprints(updated_listings, replace=True)
+            bump_versions(Listing)
+            publish_new_listings(listing.pk for listing in new_listings)
+
+    updated = sum(1 for key in changed if key in existing)
+    return {
+        'inserted': len(changed) - updated,
+        'updated': updated,
+        'unchanged': len(existing) - updated,
+        'skipped': skipped,
+    }
+
+
+def geocode_listings(listings):
+    """
+    Give listings without coordinates the centre of the Location their
+    `location` text names ("Denver, CO" -> Location "Denver"), if it has one.
+    """
+    pending = [listing for listing in listings if listing.latitude is None and listing.location]
+    if not pending:
+        return
+    centres = {
+        name.strip().lower(): (latitude, longitude)
+        for name, latitude, longitude in Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .values_list('name', 'latitude', 'longitude')
+    }
+    for listing in pending:
+        centre = centres.get(listing.location.split(',')[0].strip().lower())
+        if centre is not None:
+            listing.latitude, listing.longitude = centre
+            listing.geohash = encode_geohash(*centre)
+
+
+def lock_new_listings(url_keys):
+    """
+    Hold, until the transaction ends, the advisory locks of the buckets
+    `url_keys` hash to, so no other ingest can be inserting them too. Only
+    PostgreSQL needs them; SQLite already serializes writing transactions.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    # Taken in one order everywhere, so ingests can't deadlock on them
+    buckets = sorted({crc32(key.encode()) % NEW_LISTING_LOCK_BUCKETS for key in url_keys})
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, bucket) FROM unnest(%s::int[]) WITH ORDINALITY AS b(bucket, n) '
+            'ORDER BY n',
+            [NEW_LISTING_LOCK_NAMESPACE, buckets],
+        )
+
+
+def existing_listings(url_keys):
+    """Map url_key -> stored column values for the listings that already exist."""
+    url_keys = list(url_keys)
+    existing = {}
+    for start in range(0, len(url_keys), BATCH_SIZE):
+        rows = (
+            Listing.objects.filter(url_key__in=url_keys[start:start + BATCH_SIZE])
+            .order_by()
+            .values('listing_idx', 'url_key', 'duplicate_of_id', *Listing.TRACKED_FIELDS)
+        )
+        existing.update((row['url_key'], row) for row in rows)
+    return existing
+
+
+def assign_primary_keys(listings):
+    """Set listing_idx on upserted listings (a url_key -> Listing dict)."""
+    url_keys = list(listings)
+    for start in range(0, len(url_keys), BATCH_SIZE):
+        rows = Listing.objects.filter(url_key__in=url_keys[start:start + BATCH_SIZE]).values_list('url_key', 'listing_idx')
+        for url_key, listing_idx in rows:
+            listings[url_key].listing_idx = listing_idx
@@ -0,0 +1,275 @@
+"""
+Live feed of newly ingested listings, served as Server-Sent Events by the
+async view at /api/listings/stream/.
+
+New listings are announced by id once their transaction commits (see
+publish_new_listings). The backend decides how the ids reach the web
+processes:
+
+- 'local': straight to this process's hub. Only listings ingested by this
+  process (e.g. through the bulk endpoint) are seen.
+- 'postgres': NOTIFY on a channel every web process LISTENs on, so listings
+  ingested by run_scanners workers or other web workers are seen as well.
+
+'auto' (the default) picks 'postgres' on PostgreSQL and 'local' elsewhere.
+
+Each process's Hub turns ids into events with one query and hands them to
+the subscribers whose filters match. Every subscriber has a bounded queue;
+a client that falls behind loses events and is sent a `resync` event
+telling it to reload through the REST API.
+"""
+import asyncio
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+from .models import Listing, ListingKeywordMatch
+from .renderers import FastJSONRenderer
+from .serializers import ListingRowSerializer
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'listing_feed'
+# NOTIFY payloads must stay under 8000 bytes
+NOTIFY_PAYLOAD_SIZE = 7000
+
+FILTERS = ('scanner_id', 'query', 'search_location', 'keyword')
+
+
+@dataclass
+class ListingEvent:
+    listing_idx: int
+    scanner_id: int
+    query: str
+    search_location: str
+    keywords: list
+    data: bytes  # JSON of the listing's list representation plus its keywords
+
+    def encode(self):
+        return b'id: %d\nevent: listing\ndata: %s\n\n' % (self.listing_idx, self.data)
+
+
+def listing_events(listing_ids):
+    """Events for the listings with `listing_ids`, oldest first."""
+    row_serializer = ListingRowSerializer()
+    columns = list(dict.fromkeys(row_serializer.columns + ['listing_idx', 'scanner_id', 'query', 'search_location']))
+    rows = list(Listing.objects.filter(pk__in=listing_ids).order_by('created_at', 'listing_idx').values(*columns))
+    keywords = defaultdict(list)
+    matches = ListingKeywordMatch.objects.filter(listing_id__in=listing_ids).values_list('listing_id', 'keyword__keyword')
+    for listing_id, keyword in matches:
+        keywords[listing_id].append(keyword)
+
+    renderer = FastJSONRenderer()
+    events = []
+    for row, representation in zip(rows, row_serializer.to_representation(rows)):
+        representation['keywords'] = keywords[row['listing_idx']]
+        events.append(ListingEvent(
+            listing_idx=row['listing_idx'],
+            scanner_id=row['scanner_id'],
+            query=row['query'],
+            search_location=row['search_location'],
+            keywords=[keyword.lower() for keyword in representation['keywords'] if keyword],
+            data=renderer.render(representation),
+        ))
+    return events
+
+
+class Subscription:
+    """One connected client: its filters and a bounded queue on its event loop."""
+
+    def __init__(self, filters, loop, queue_size):
+        self.filters = filters
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def matches(self, event):
+        filters = self.filters
+        return (
+            ('scanner_id' not in filters or filters['scanner_id'] == event.scanner_id)
+            and ('query' not in filters or filters['query'] == event.query)
+            and ('search_location' not in filters or filters['search_location'] == event.search_location)
+            and ('keyword' not in filters or filters['keyword'] in event.keywords)
+        )
+
+    def offer(self, events):
+        """Queue events from any thread."""
+        self.loop.call_soon_threadsafe(self.put, events)
+
+    def put(self, events):
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+
+class Hub:
+    """This process's subscribers, fed by the configured backend."""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, filters):
+        """Subscribe from a running event loop; returns None when the hub is full."""
+        with self.lock:
+            if len(self.subscriptions) >= settings.LIVE_FEED_MAX_CLIENTS:
+                return None
+            subscription = Subscription(filters, asyncio.get_running_loop(), settings.LIVE_FEED_QUEUE_SIZE)
+            self.subscriptions.add(subscription)
+        get_backend().start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def has_subscriptions(self):
+        return bool(self.subscriptions)
+
+    def full(self):
+        return len(self.subscriptions) >= settings.LIVE_FEED_MAX_CLIENTS
+
+    def deliver(self, events):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            matching = [event for event in events if subscription.matches(event)]
+            if not matching:
+                continue
+            try:
+                subscription.offer(matching)
+            except RuntimeError:
+                # Its event loop is gone
+                self.unsubscribe(subscription)
+
+
+hub = Hub()
+
+
+class LocalBackend:
+    """Delivers ids published in this process to this process's hub."""
+
+    def start(self):
+        pass
+
+    def publish(self, listing_ids):
+        if hub.has_subscriptions():
+            hub.deliver(listing_events(listing_ids))
+
+
+class PostgresBackend:
+    """Fans ids out to every process through PostgreSQL LISTEN/NOTIFY."""
+
+    def __init__(self):
+        self.listener = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen_forever, name='listing-feed', daemon=True)
+                self.listener.start()
+
+    def publish(self, listing_ids):
+        chunks = []
+        chunk = ''
+        for listing_id in listing_ids:
+            text = str(listing_id)
+            if len(chunk) + len(text) + 1 > NOTIFY_PAYLOAD_SIZE:
+                chunks.append(chunk)
+                chunk = ''
+            chunk = f'{chunk},{text}' if chunk else text
+        if chunk:
+            chunks.append(chunk)
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            for chunk in chunks:
+                cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, chunk])
+
+    def listen_forever(self):
+        while True:
+            try:
+                self.listen()
+            except Exception:
+                logger.exception('Listing feed listener failed, reconnecting')
+                time.sleep(5)
+
+    def listen(self):
+        wrapper = connections[DEFAULT_DB_ALIAS]
+        raw = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            while True:
+                if select.select([raw], [], [], 30) == ([], [], []):
+                    continue
+                raw.poll()
+                listing_ids = []
+                while raw.notifies:
+                    listing_ids.extend(int(text) for text in raw.notifies.pop(0).payload.split(','))
+                if listing_ids and hub.has_subscriptions():
+                    close_old_connections()
+                    hub.deliver(listing_events(listing_ids))
+        finally:
+            raw.close()
+
+
+BACKENDS = {'local': LocalBackend, 'postgres': PostgresBackend}
+backends = {}
+
+
+def get_backend():
+    name = settings.LIVE_FEED_BACKEND
+    if name == 'auto':
+        name = 'postgres' if connections[DEFAULT_DB_ALIAS].vendor == 'postgresql' else 'local'
+    if name not in backends:
+        backends[name] = BACKENDS[name]()
+    return backends[name]
+
+
+def publish_new_listings(listing_ids):
+    """Announce new listings to live feed clients once the transaction commits."""
+    listing_ids = list(listing_ids)
+    if listing_ids:
+        transaction.on_commit(lambda: get_backend().publish(listing_ids))
+
+
+def parse_filters(params):
+    """Subscription filters from query parameters; raises ValueError."""
+    filters = {name: params[name] for name in FILTERS if params.get(name)}
+    if 'scanner_id' in filters:
+        filters['scanner_id'] = int(filters['scanner_id'])
+    if 'keyword' in filters:
+        filters['keyword'] = filters['keyword'].lower()
+    return filters
+
+
+async def event_stream(filters):
+    """SSE bytes for a new subscription until the client disconnects."""
+    subscription = hub.subscribe(filters)
+    if subscription is None:
+        return
+    try:
+        # Reconnect after 3 s; the comment flushes the headers to the client
+        yield b'retry: 3000\n: connected\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), settings.LIVE_FEED_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield b': keep-alive\n\n'
+                continue
+            if subscription.dropped:
+                yield b'event: resync\ndata: {"dropped": %d}\n\n' % subscription.dropped
+                subscription.dropped = 0
+            yield event.encode()
+    finally:
+        hub.unsubscribe(subscription)
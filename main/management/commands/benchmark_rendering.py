@@ -0,0 +1,85 @@
+import gzip
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from main.middleware import brotli
+from main.models import Listing
+from main.renderers import FastJSONRenderer, orjson
+from main.serializers import ListingRowSerializer, ListingSerializer
+
+WORDS = (
+    'ps5 xbox desk chair sofa bike couch table lamp dresser queen iphone camera lens oak walnut leather '
+    'used new mint condition box controller games bundle pickup only cash firm obo delivery available'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Measure JSON render time and bytes on the wire for a listing page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='Listings per page')
+        parser.add_argument('--iterations', type=int, default=200, help='Renders timed per renderer')
+
+    def handle(self, *args, **options):
+        listings = self.sample_listings(options['rows'])
+        full = ListingSerializer(listings, many=True).data
+        row_serializer = ListingRowSerializer()
+        slim = [{name: row[name] for name in row_serializer.fields} for row in full]
+
+        renderers = [('stdlib', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('orjson', FastJSONRenderer()))
+        else:
+            self.stdout.write('orjson is not installed; FastJSONRenderer uses the stdlib encoder')
+
+        self.stdout.write(f"{options['rows']}-row listing page, median of {options['iterations']} renders")
+        for label, page in (('full', full), ('list', slim)):
+            data = {'count': len(page), 'next': None, 'previous': None, 'results': page}
+            for name, renderer in renderers:
+                timings = []
+                for _ in range(options['iterations']):
+                    start = time.perf_counter()
+                    body = renderer.render(data)
+                    timings.append(time.perf_counter() - start)
+                self.stdout.write(
+                    f'{label:>4} {name:>6}: {statistics.median(timings) * 1000:7.3f} ms render, '
+                    f'{self.wire_sizes(body)}'
+                )
+
+    def wire_sizes(self, body):
+        sizes = [f'{len(body):,} B raw', f'{len(gzip.compress(body, 6)):,} B gzip']
+        if brotli is not None:
+            sizes.append(f'{len(brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)):,} B brotli')
+        return ', '.join(sizes)
+
+    def sample_listings(self, count):
+        """Unsaved listings shaped like scraped ones; nothing touches the database."""
+        rng = random.Random(0)
+        now = timezone.now()
+        listings = []
+        for index in range(count):
+            listing = Listing(
+                listing_idx=index + 1,
+                price=f'${rng.randint(5, 2000)}',
+                title=' '.join(rng.choices(WORDS, k=5)).title(),
+                location='Denver, CO',
+                description=' '.join(rng.choices(WORDS, k=rng.randint(40, 160))),
+                distance=rng.randint(1, 60),
+                url=f'https://www.facebook.com/marketplace/item/{10 ** 15 + index}/',
+                img=f'https://scontent.xx.fbcdn.net/v/t45.5328-4/{10 ** 17 + index}_n.jpg?stp=dst-jpg_s960x960',
+                query='ps5',
+                search_title='Video Games',
+                scanner_id=1,
+                search_location='Denver',
+                created_at=now - timedelta(minutes=index),
+            )
+            listing.refresh_derived_fields()
+            listings.append(listing)
+        return listings
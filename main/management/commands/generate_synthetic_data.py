@@ -0,0 +1,195 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.ingest import ingest_listings
+from main.models import ActiveScanner, Keyword, Listing, Location, ScannerLocationMapping
+from main.normalization import normalize_listing_url
+from main.versions import bump_versions
+
+# Synthetic rows are recognisable by these markers, so --clear only ever
+# removes what this command created
+LOCATION_SLUG_PREFIX = 'synthetic-'
+URL_HOST = 'www.synthetic.example'
+URL_KEY_PREFIX = 'synthetic.example/'
+
+CATEGORIES = {
+    'Video Games': ['ps5', 'xbox series x', 'nintendo switch', 'steam deck'],
+    'Furniture': ['standing desk', 'sofa', 'dresser', 'dining table'],
+    'Bikes': ['road bike', 'mountain bike', 'e-bike'],
+    'Electronics': ['iphone', 'macbook', 'camera', 'tv'],
+}
+CITIES = [
+    ('Denver', 39.74, -104.99), ('Boulder', 40.01, -105.27), ('Austin', 30.27, -97.74),
+    ('Seattle', 47.61, -122.33), ('Portland', 45.52, -122.68), ('Chicago', 41.88, -87.63),
+    ('Phoenix', 33.45, -112.07), ('Dallas', 32.78, -96.80), ('Atlanta', 33.75, -84.39),
+    ('Boston', 42.36, -71.06), ('Miami', 25.76, -80.19), ('Salt Lake City', 40.76, -111.89),
+    ('San Diego', 32.72, -117.16), ('Minneapolis', 44.98, -93.27), ('Nashville', 36.16, -86.78),
+    ('Raleigh', 35.78, -78.64),
+]
+# Share of listings scraped with their own coordinates; the rest are geocoded
+# from their location's name
+COORDINATES_RATE = 0.7
+WORDS = (
+    'used new mint condition box controller games bundle pickup only cash firm obo delivery available '
+    'black white blue red oak walnut leather large small works great barely moving sale must go today '
+    'original owner receipt warranty scratches clean smoke free home pet'
+).split()
+KEYWORDS = ['mint', 'bundle', 'warranty', 'receipt', 'oak', 'leather', 'firm', 'obo', 'delivery', 'original']
+
+
+def price_string(rng):
+    """A price as sellers write them, including ones that don't parse."""
+    amount = round(rng.lognormvariate(5, 1.2))
+    style = rng.random()
+    if style < 0.45:
+        return f'${amount:,}'
+    if style < 0.6:
+        return f'{amount}'
+    if style < 0.7:
+        return f'${amount}.{rng.randint(0, 99):02d}'
+    if style < 0.78:
+        return f'${amount} obo'
+    if style < 0.83:
+        return rng.choice(['CA$', '€', '£']) + str(amount)
+    if style < 0.9:
+        return 'Free'
+    if style < 0.95:
+        return rng.choice(['Contact for price', 'Trade', ''])
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic locations, scanners, keywords and listings for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=10000)
+        parser.add_argument('--locations', type=int, default=10)
+        parser.add_argument('--scanners', type=int, default=10)
+        parser.add_argument('--keywords', type=int, default=5, help='Keywords per scanner')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Listings per ingest transaction')
+        parser.add_argument('--repost-rate', type=float, default=0.03, help='Share of listings that are reposts')
+        parser.add_argument('--watchlist-rate', type=float, default=0.02, help='Share of listings on the watchlist')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Remove earlier synthetic data first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['clear']:
+            self.clear()
+            if not options['listings']:
+                return
+
+        with transaction.atomic():
+            locations = self.create_locations(options['locations'])
+            mappings = self.create_scanners(rng, options['scanners'], locations, options['keywords'])
+
+        start = Listing.objects.filter(url_key__startswith=URL_KEY_PREFIX).count()
+        totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        recent = []
+        for offset in range(0, options['listings'], options['batch_size']):
+            count = min(options['batch_size'], options['listings'] - offset)
+            rows = [
+                self.listing_row(rng, start + offset + index, rng.choice(mappings), recent, options['repost_rate'])
+                for index in range(count)
+            ]
+            for key, value in ingest_listings(rows).items():
+                totals[key] += value
+            watched = [normalize_listing_url(row['url']) for row in rows if rng.random() < options['watchlist_rate']]
+            Listing.objects.filter(url_key__in=watched).update(watchlist=True)
+            bump_versions(Listing)
+            self.stdout.write(f'{offset + count}/{options["listings"]} listings')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(locations)} locations, {len(mappings)} scanner locations, '
+            '{inserted} listings inserted ({skipped} skipped)'.format_map(totals)
+        ))
+
+    def clear(self):
+        scanner_ids = set(
+            ScannerLocationMapping.objects.filter(location__marketplace_url_slug__startswith=LOCATION_SLUG_PREFIX)
+            .values_list('scanner_id', flat=True)
+        )
+        Keyword.objects.filter(filterID__in=scanner_ids).delete()
+        ActiveScanner.objects.filter(id__in=scanner_ids).delete()
+        Location.objects.filter(marketplace_url_slug__startswith=LOCATION_SLUG_PREFIX).delete()
+        deleted = 0
+        while True:
+            # Deleted through the ORM in batches so facets and related rows stay consistent
+            ids = list(Listing.objects.filter(url_key__startswith=URL_KEY_PREFIX).values_list('pk', flat=True)[:5000])
+            if not ids:
+                break
+            Listing.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+        self.stdout.write(f'Removed {len(scanner_ids)} synthetic scanners and {deleted} listings')
+
+    def create_locations(self, count):
+        locations = []
+        for index in range(count):
+            city, latitude, longitude = CITIES[index % len(CITIES)]
+            if index >= len(CITIES):
+                # Another town a little further out
+                city = f'{city} {index // len(CITIES) + 1}'
+                latitude += 0.5 * (index // len(CITIES))
+            slug = LOCATION_SLUG_PREFIX + city.lower().replace(' ', '-')
+            location, _ = Location.objects.get_or_create(
+                marketplace_url_slug=slug, defaults={'name': city, 'latitude': latitude, 'longitude': longitude}
+            )
+            locations.append(location)
+        return locations
+
+    def create_scanners(self, rng, count, locations, keywords_per_scanner):
+        """Stopped scanners, so run_scanners never sends their queries anywhere."""
+        mappings = []
+        for _ in range(count):
+            category = rng.choice(list(CATEGORIES))
+            scanner = ActiveScanner.objects.create(
+                category=category, query=rng.choice(CATEGORIES[category]), status='stopped'
+            )
+            chosen = rng.sample(locations, rng.randint(1, min(5, len(locations))))
+            mappings.extend(ScannerLocationMapping.objects.bulk_create([
+                ScannerLocationMapping(scanner=scanner, location=location) for location in chosen
+            ]))
+            Keyword.objects.bulk_create([
+                Keyword(keyword=keyword, filterID=scanner.id)
+                for keyword in rng.sample(KEYWORDS, min(keywords_per_scanner, len(KEYWORDS)))
+            ])
+        bump_versions(ScannerLocationMapping, Keyword)
+        # Listings need the scanner's query and category and the location's name
+        return list(
+            ScannerLocationMapping.objects.filter(id__in=[mapping.id for mapping in mappings])
+            .select_related('scanner', 'location')
+        )
+
+    def listing_row(self, rng, number, mapping, recent, repost_rate):
+        scanner, location = mapping.scanner, mapping.location
+        if recent and rng.random() < repost_rate:
+            # The same item again under a new URL, usually somewhere else
+            original = rng.choice(recent)
+            title, description, price = original['title'], original['description'], original['price']
+        else:
+            title = f"{scanner.query.title()} {' '.join(rng.sample(WORDS, rng.randint(1, 4)))}"
+            description = ' '.join(rng.choices(WORDS, k=rng.randint(10, 120)))
+            price = price_string(rng)
+        row = {
+            'price': price,
+            'title': title,
+            'location': f'{location.name}, XX',
+            'description': description,
+            'distance': rng.randint(0, 100),
+            'url': f'https://{URL_HOST}/marketplace/item/{number}/',
+            'img': f'https://{URL_HOST}/img/{number}.jpg',
+            'query': scanner.query,
+            'search_title': scanner.category,
+            'scanner_id': scanner.id,
+            'search_location': location.name,
+        }
+        if location.latitude is not None and rng.random() < COORDINATES_RATE:
+            # Somewhere within roughly 50 km of the location's centre
+            row['latitude'] = round(location.latitude + rng.uniform(-0.45, 0.45), 5)
+            row['longitude'] = round(location.longitude + rng.uniform(-0.6, 0.6), 5)
+        recent.append(row)
+        if len(recent) > 1000:
+            del recent[:500]
+        return row
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from main.ingest import geocode_listings
+from main.models import Listing
+from main.versions import bump_versions
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = 'Give listings without coordinates the coordinates of the location they name'
+
+    def handle(self, *args, **options):
+        pending = Listing.objects.filter(latitude__isnull=True, location__isnull=False).order_by('pk')
+        last_pk = 0
+        geocoded = 0
+        while True:
+            listings = list(pending.filter(pk__gt=last_pk).only('pk', 'location', 'latitude')[:BATCH_SIZE])
+            if not listings:
+                break
+            last_pk = listings[-1].pk
+            geocode_listings(listings)
+            found = [listing for listing in listings if listing.latitude is not None]
+            Listing.objects.bulk_update(found, ['latitude', 'longitude', 'geohash'])
+            geocoded += len(found)
+        if geocoded:
+            bump_versions(Listing)
+        self.stdout.write(self.style.SUCCESS(f'Geocoded {geocoded} listings'))
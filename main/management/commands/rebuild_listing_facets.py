@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.facets import rebuild_facets
+from main.models import Listing
+from main.versions import bump_versions
+
+
+class Command(BaseCommand):
+    help = 'Recompute the listing_facets table from the listings table'
+
+    def handle(self, *args, **options):
+        count = rebuild_facets()
+        bump_versions(Listing)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} listing facets'))
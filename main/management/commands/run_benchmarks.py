@@ -0,0 +1,76 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmarks import benchmark_client, build_scenarios, regressions, run_scenario
+from main.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Run the API benchmark scenarios and compare them with a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario')
+        parser.add_argument('--scenario', action='append', help='Only run these scenarios (repeatable)')
+        parser.add_argument('--page-depth', type=int, default=20, help='Page reached by the deep pagination scenarios')
+        parser.add_argument(
+            '--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'),
+            help='Baseline results file',
+        )
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+        parser.add_argument(
+            '--threshold', type=float, default=0.25, help='Allowed p95 slowdown before flagging, as a fraction'
+        )
+
+    def handle(self, *args, **options):
+        client = benchmark_client()
+        scenarios = build_scenarios(client, options['page_depth'])
+        if options['scenario']:
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['scenario']]
+            if not scenarios:
+                raise CommandError('No matching scenarios')
+
+        listing_count = Listing.objects.count()
+        self.stdout.write(f'{listing_count} listings, {options["iterations"]} requests per scenario')
+        self.stdout.write(f"{'scenario':<30} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+        results = {}
+        for scenario in scenarios:
+            try:
+                result = run_scenario(client, scenario, options['iterations'], options['warmup'])
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            results[scenario.name] = result
+            self.stdout.write(
+                f"{scenario.name:<30} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                f"{result['p99_ms']:>9.2f} {result['queries']:>8}"
+            )
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({
+                'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                'listings': listing_count,
+                'scenarios': results,
+            }, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Saved baseline to {baseline_path}'))
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write('No baseline yet; store one with --save-baseline')
+            return
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get('listings') != listing_count:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded with {baseline.get('listings')} listings; timings may not compare"
+            ))
+        found = regressions(results, baseline['scenarios'], options['threshold'])
+        if found:
+            for message in found:
+                self.stdout.write(self.style.ERROR(message))
+            raise CommandError(f'{len(found)} regressions against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,61 @@
+import importlib.util
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmarks import (
+    LOAD_SCENARIOS, benchmark_client, build_scenarios, gunicorn_server, load_urls, run_load,
+)
+from main.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent-client throughput of the sync WSGI and the ASGI server setups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=32, help='Concurrent clients')
+        parser.add_argument('--duration', type=float, default=15, help='Seconds of load per server mode')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers in every mode')
+        parser.add_argument(
+            '--mode', action='append', choices=['wsgi', 'asgi'], help='Only run these modes (repeatable)'
+        )
+        parser.add_argument(
+            '--scenario', action='append',
+            help=f"Only request these scenarios (repeatable, default: {', '.join(LOAD_SCENARIOS)})",
+        )
+
+    def handle(self, *args, **options):
+        modes = options['mode'] or ['wsgi', 'asgi']
+        if 'asgi' in modes and importlib.util.find_spec('uvicorn_worker') is None:
+            raise CommandError('ASGI mode needs uvicorn and uvicorn-worker (see requirements.txt)')
+
+        names = options['scenario'] or LOAD_SCENARIOS
+        scenarios = [
+            scenario for scenario in build_scenarios(benchmark_client())
+            if scenario.name in names and scenario.method == 'get'
+        ]
+        if not scenarios:
+            raise CommandError('No matching scenarios')
+        urls = load_urls(scenarios)
+
+        self.stdout.write(
+            f"{Listing.objects.count()} listings, {options['clients']} clients, "
+            f"{options['workers']} workers, {options['duration']:g} s per mode"
+        )
+        self.stdout.write(
+            f"{'mode':<6} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+        )
+        results = {}
+        for mode in modes:
+            try:
+                with gunicorn_server(mode, options['workers'], urls[0]) as base_url:
+                    result = run_load(base_url, urls, options['clients'], options['duration'])
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            results[mode] = result
+            self.stdout.write(
+                f"{mode:<6} {result['requests']:>9} {result['rps']:>9.1f} {result['p50_ms']:>9.2f} "
+                f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>7}"
+            )
+
+        if len(results) == 2:
+            self.stdout.write(f"asgi/wsgi throughput: {results['asgi']['rps'] / results['wsgi']['rps']:.2f}x")
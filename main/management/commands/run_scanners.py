@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from main.scanner import ScanEngine, active_targets
+from main.workqueue import run_worker, worker_id
+
+
+class Command(BaseCommand):
+    help = (
+        'Scan every active scanner x location pair once and store the listings found, '
+        'or with --worker claim due pairs from the shared work queue until stopped'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scanner', type=int, action='append', dest='scanner_ids',
+                            help='Only scan this scanner id (repeatable, not with --worker)')
+        parser.add_argument('--concurrency', type=int, help='Maximum in-flight requests overall')
+        parser.add_argument('--per-host', type=int, help='Maximum in-flight requests per host')
+        parser.add_argument('--max-pages', type=int, help='Result pages to fetch per scanner and location')
+        parser.add_argument('--no-details', action='store_true', help="Don't fetch item pages for descriptions")
+        parser.add_argument('--worker', action='store_true',
+                            help='Claim due work units with leases; safe to run on many processes and nodes')
+        parser.add_argument('--once', action='store_true', help='With --worker, exit when nothing is due')
+
+    def handle(self, *args, **options):
+        engine = ScanEngine(
+            concurrency=options['concurrency'],
+            per_host=options['per_host'],
+            max_pages=options['max_pages'],
+            fetch_details=False if options['no_details'] else None,
+        )
+        try:
+            if options['worker']:
+                owner = worker_id()
+                self.stdout.write(f'Scan worker {owner} started')
+                try:
+                    summary = run_worker(engine, owner=owner, once=options['once'])
+                except KeyboardInterrupt:
+                    self.stdout.write(f'Scan worker {owner} stopped')
+                    return
+            else:
+                targets = active_targets(options['scanner_ids'])
+                if not targets:
+                    self.stdout.write('No active scanner locations to scan')
+                    return
+                summary = engine.run(targets)
+        finally:
+            engine.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Scanned {targets} targets ({failed} failed): {requests} requests, {pages} pages, '
+            '{known} already known, {inserted} inserted, {updated} updated, {unchanged} unchanged, {skipped} skipped'.format_map(summary)
+        ))
@@ -0,0 +1,170 @@
+"""
+Server-side keyword matching for listings.
+
+Each scanner's keywords (Keyword rows grouped by filterID) are compiled into
+one Aho-Corasick automaton, so a listing is matched against all of them in a
+single pass over its text. Compiled matchers are cached per process under
+the Keyword model version (main/versions.py) they were built at and rebuilt
+once it moves, so keyword edits made in the web processes reach the
+run_scanners workers within MODEL_VERSION_CACHE_TTL. Edits made in this
+process also drop the matcher at once (see main/signals.py and
+KeywordViewSet.bulk_update).
+
+Keywords match whole words only: "oak" matches "Oak desk" but not "soak" or
+"cloak".
+"""
+import threading
+from collections import deque
+
+from .models import Keyword, ListingKeywordMatch
+from .versions import model_versions
+
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over case-insensitive, whole-word keywords."""
+
+    def __init__(self, keywords):
+        # keywords: iterable of (keyword_id, text)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for keyword_id, text in keywords:
+            text = (text or '').strip().lower()
+            if not text:
+                continue
+            node = 0
+            for char in text:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                node = child
+            # Only edges that are word characters need a word boundary
+            # next to them, so "4k" and "c++" still match where they should
+            self.output[node] = self.output[node] + (
+                (keyword_id, len(text), is_word_char(text[0]), is_word_char(text[-1])),
+            )
+
+        # Breadth-first, so every node's failure link points at a shallower,
+        # already finished node
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def __bool__(self):
+        return len(self.goto) > 1
+
+    def match(self, text):
+        """Return the ids of every keyword occurring as whole words in `text`."""
+        found = set()
+        if not text:
+            return found
+        goto, fail, output = self.goto, self.fail, self.output
+        text = text.lower()
+        last = len(text) - 1
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword_id, length, word_start, word_end in output[node]:
+                start = end - length + 1
+                if word_start and start > 0 and is_word_char(text[start - 1]):
+                    continue
+                if word_end and end < last and is_word_char(text[end + 1]):
+                    continue
+                found.add(keyword_id)
+        return found
+
+
+_matchers = {}
+# Bumped by invalidate_matcher(), so a matcher built from keywords read
+# before an invalidation is never cached after it
+_generations = {}
+_lock = threading.Lock()
+
+
+def keyword_version():
+    """The Keyword model version cached matchers are keyed on."""
+    return model_versions((Keyword,))[0][1]
+
+
+def get_matcher(scanner_id, version=None):
+    """
+    Return the compiled matcher for a scanner's keywords, rebuilding it when
+    the Keyword version moved. Pass `version` to reuse one keyword_version()
+    lookup for many listings.
+    """
+    if version is None:
+        version = keyword_version()
+    with _lock:
+        cached = _matchers.get(scanner_id)
+        generation = _generations.get(scanner_id, 0)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    keywords = Keyword.objects.filter(filterID=scanner_id).values_list('id', 'keyword')
+    matcher = KeywordMatcher(keywords)
+    with _lock:
+        if _generations.get(scanner_id, 0) == generation:
+            _matchers[scanner_id] = (version, matcher)
+    return matcher
+
+
+def invalidate_matcher(scanner_id):
+    with _lock:
+        _matchers.pop(scanner_id, None)
+        _generations[scanner_id] = _generations.get(scanner_id, 0) + 1
+
+
+def listing_text(listing):
+    return f"{listing.title or ''}\n{listing.description or ''}"
+
+
+def find_matches(listings):
+    """Build (unsaved) ListingKeywordMatch rows for saved listings."""
+    matches = []
+    version = None
+    for listing in listings:
+        if listing.scanner_id is None or listing.pk is None:
+            continue
+        if version is None:
+            version = keyword_version()
+        matcher = get_matcher(listing.scanner_id, version)
+        if not matcher:
+            continue
+        matches.extend(
+            ListingKeywordMatch(listing_id=listing.pk, keyword_id=keyword_id)
+            for keyword_id in matcher.match(listing_text(listing))
+        )
+    return matches
+
+
+def store_matches(listings, replace=False):
+    """
+    Match `listings` against their scanner's keywords and store the results.
+
+    With `replace`, previously stored matches for these listings are removed
+    first (used when re-scanned listings are updated).
+    """
+    if replace:
+        ListingKeywordMatch.objects.filter(listing_id__in=[listing.pk for listing in listings]).delete()
+    matches = find_matches(listings)
+    ListingKeywordMatch.objects.bulk_create(matches, batch_size=1000, ignore_conflicts=True)
+    return len(matches)
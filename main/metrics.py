@@ -0,0 +1,165 @@
+"""
+In-process request metrics in the Prometheus text format.
+
+MetricsMiddleware times every routed request and counts the SQL it runs
+through a database execute wrapper. The observations are kept in
+histograms labelled by route (the DRF view name, which includes the action),
+method and status, and served at /metrics. Each server process keeps its
+own histograms, so scrape every worker (or run one per pod). Streaming
+responses are measured up to the point their stream starts.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((labels, list(values)) for labels, values in self.series.items())
+        for labels, values in series:
+            label_text = ','.join(
+                f'{name}="{escape_label(value)}"' for name, value in zip(self.label_names, labels)
+            )
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {values[-2]}')
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LABELS = ('route', 'method', 'status')
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request.', LABELS, LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements run while handling a request.', LABELS, QUERY_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in SQL while handling a request.', LABELS, LATENCY_BUCKETS
+)
+HISTOGRAMS = [REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_DURATION]
+
+
+def exposition():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.exposition())
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTracker:
+    """Database execute wrapper counting statements and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Records latency, query count and SQL time for every routed request, and
+    logs a warning when a request goes over METRICS_QUERY_BUDGET queries or
+    METRICS_LATENCY_BUDGET_MS milliseconds.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        with self.track_queries(tracker):
+            response = self.get_response(request)
+        self.record(request, response, tracker, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        # Database connections follow the request's context into the
+        # sync_to_async threads that run ORM code, and so do their wrappers
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        with self.track_queries(tracker):
+            response = await self.get_response(request)
+        self.record(request, response, tracker, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def track_queries(tracker):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(tracker))
+        return stack
+
+    def record(self, request, response, tracker, duration):
+        match = request.resolver_match
+        if match is None:
+            # Unrouted (404) requests would only add noise
+            return
+        route = match.view_name or match.route
+        labels = (route, request.method, str(response.status_code))
+        REQUEST_DURATION.observe(labels, duration)
+        REQUEST_QUERIES.observe(labels, tracker.count)
+        REQUEST_DB_DURATION.observe(labels, tracker.duration)
+
+        if tracker.count > settings.METRICS_QUERY_BUDGET or duration * 1000 > settings.METRICS_LATENCY_BUDGET_MS:
+            logger.warning(
+                '%s %s (%s) over budget: %.0f ms, %d queries, %.0f ms in SQL',
+                request.method, request.path, route, duration * 1000, tracker.count, tracker.duration * 1000,
+            )
@@ -0,0 +1,109 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:54
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+# main.pricing.parse_price as of this migration, frozen so later parser
+# changes don't change what the migration does
+
+CURRENCY_MARKERS = [
+    ('CA$', 'CAD'),
+    ('C$', 'CAD'),
+    ('A$', 'AUD'),
+    ('US$', 'USD'),
+    ('USD', 'USD'),
+    ('CAD', 'CAD'),
+    ('EUR', 'EUR'),
+    ('GBP', 'GBP'),
+    ('$', 'USD'),
+    ('€', 'EUR'),
+    ('£', 'GBP'),
+]
+
+FREE_WORDS = ('free', 'gratis')
+
+NUMBER_RE = re.compile(r'\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?')
+
+
+def parse_price(raw):
+    if raw is None:
+        return None, None, False
+
+    text = str(raw).strip()
+    if not text:
+        return None, None, False
+
+    lowered = text.lower()
+    if any(word in lowered for word in FREE_WORDS):
+        return 0, None, True
+
+    currency = None
+    upper = text.upper()
+    for marker, code in CURRENCY_MARKERS:
+        if marker in upper:
+            currency = code
+            break
+
+    match = NUMBER_RE.search(text)
+    if not match:
+        return None, currency, False
+
+    try:
+        amount = Decimal(match.group(0).replace(',', ''))
+    except InvalidOperation:
+        return None, currency, False
+
+    cents = int((amount * 100).to_integral_value())
+    return cents, currency, cents == 0
+
+
+def backfill_price_cents(apps, schema_editor):
+    """Parse the existing price strings in primary-key batches."""
+    Listing = apps.get_model('main', 'Listing')
+    last_pk = 0
+    while True:
+        batch = list(
+            Listing.objects.filter(listing_idx__gt=last_pk)
+            .order_by('listing_idx')
+            .only('listing_idx', 'price')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for listing in batch:
+            listing.price_cents, listing.price_currency, listing.price_is_free = parse_price(listing.price)
+        Listing.objects.bulk_update(batch, ['price_cents', 'price_currency', 'price_is_free'])
+        last_pk = batch[-1].listing_idx
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_rename_search_locations_listing_search_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='price_cents',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='price_currency',
+            field=models.CharField(editable=False, max_length=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='price_is_free',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(backfill_price_cents, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['price_cents'], name='listings_price_cents_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_listing_price_cents'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['created_at', 'listing_idx'], name='listings_created_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_listing_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['query', 'created_at'], name='listings_query_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['query', 'search_location', 'created_at'], name='listings_query_loc_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['search_title', 'created_at'], name='listings_title_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['search_location', 'created_at'], name='listings_loc_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['search_location', 'distance'], name='listings_loc_distance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('watchlist', True)), fields=['created_at'], name='listings_watchlist_created_idx'),
+        ),
+    ]
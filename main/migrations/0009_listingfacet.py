@@ -0,0 +1,55 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+FACET_FIELDS = {
+    'query': 'query',
+    'category': 'search_title',
+    'search_location': 'search_location',
+}
+
+
+def populate_listing_facets(apps, schema_editor):
+    Listing = apps.get_model('main', 'Listing')
+    ListingFacet = apps.get_model('main', 'ListingFacet')
+    facets = []
+    for facet, field in FACET_FIELDS.items():
+        counts = (
+            Listing.objects.exclude(**{f'{field}__isnull': True})
+            .exclude(**{field: ''})
+            .order_by()
+            .values(field)
+            .annotate(listing_count=Count('pk'))
+        )
+        facets.extend(
+            ListingFacet(facet=facet, value=row[field], listing_count=row['listing_count'])
+            for row in counts
+        )
+    ListingFacet.objects.bulk_create(facets, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_listing_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingFacet',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('facet', models.CharField(choices=[('query', 'Query'), ('category', 'Category'), ('search_location', 'Search location')], max_length=20)),
+                ('value', models.TextField()),
+                ('listing_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Listing Facet',
+                'verbose_name_plural': 'Listing Facets',
+                'db_table': 'listing_facets',
+                'unique_together': {('facet', 'value')},
+            },
+        ),
+        migrations.RunPython(populate_listing_facets, migrations.RunPython.noop),
+    ]
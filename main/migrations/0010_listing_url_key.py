@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+from main.normalization import normalize_listing_url
+
+BATCH_SIZE = 2000
+
+
+def backfill_url_keys(apps, schema_editor):
+    """
+    Compute url_key for existing listings in primary-key batches.
+
+    Only the oldest listing for each URL gets the key; later duplicates keep
+    a NULL key so the unique constraint can be added.
+    """
+    Listing = apps.get_model('main', 'Listing')
+    seen = set()
+    last_pk = 0
+    while True:
+        batch = list(
+            Listing.objects.filter(listing_idx__gt=last_pk)
+            .order_by('listing_idx')
+            .only('listing_idx', 'url')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        changed = []
+        for listing in batch:
+            url_key = normalize_listing_url(listing.url)
+            if url_key and url_key not in seen:
+                seen.add(url_key)
+                listing.url_key = url_key
+                changed.append(listing)
+        Listing.objects.bulk_update(changed, ['url_key'])
+        last_pk = batch[-1].listing_idx
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_listingfacet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='url_key',
+            field=models.TextField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_url_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='listing',
+            name='url_key',
+            field=models.TextField(editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:58
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from main.search import install_search, uninstall_search
+
+
+def create_search_support(apps, schema_editor):
+    install_search(schema_editor.connection)
+
+
+def drop_search_support(apps, schema_editor):
+    uninstall_search(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_listing_url_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_support, drop_search_support),
+    ]
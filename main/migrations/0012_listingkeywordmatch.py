@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_listing_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingKeywordMatch',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('keyword', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_matches', to='main.keyword')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_matches', to='main.listing')),
+            ],
+            options={
+                'verbose_name': 'Listing Keyword Match',
+                'verbose_name_plural': 'Listing Keyword Matches',
+                'db_table': 'listing_keyword_matches',
+                'indexes': [models.Index(fields=['keyword', 'listing'], name='listing_kw_matches_kw_idx')],
+                'unique_together': {('listing', 'keyword')},
+            },
+        ),
+    ]
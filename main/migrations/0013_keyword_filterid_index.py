@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_listingkeywordmatch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='keyword',
+            name='filterID',
+            field=models.IntegerField(db_index=True),
+        ),
+    ]
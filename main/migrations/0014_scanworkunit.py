@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_keyword_filterid_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanWorkUnit',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('next_due_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lease_owner', models.CharField(max_length=100, null=True)),
+                ('lease_expires_at', models.DateTimeField(null=True)),
+                ('last_started_at', models.DateTimeField(null=True)),
+                ('last_finished_at', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(null=True)),
+                ('mapping', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='work_unit', to='main.scannerlocationmapping')),
+            ],
+            options={
+                'verbose_name': 'Scan Work Unit',
+                'verbose_name_plural': 'Scan Work Units',
+                'db_table': 'scan_work_units',
+                'indexes': [models.Index(fields=['next_due_at'], name='scan_work_units_due_idx')],
+            },
+        ),
+    ]
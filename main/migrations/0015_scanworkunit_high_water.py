@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_scanworkunit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanworkunit',
+            name='high_water_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='scanworkunit',
+            name='high_water_keys',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='scanworkunit',
+            name='last_full_scan_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
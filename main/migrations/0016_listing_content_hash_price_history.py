@@ -0,0 +1,76 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+from main.normalization import listing_content_hash
+
+BATCH_SIZE = 2000
+
+
+def backfill_content_hash(apps, schema_editor):
+    """Hash the existing listings in primary-key batches."""
+    Listing = apps.get_model('main', 'Listing')
+    last_pk = 0
+    while True:
+        batch = list(
+            Listing.objects.filter(listing_idx__gt=last_pk)
+            .order_by('listing_idx')
+            .only('listing_idx', 'price', 'title', 'description', 'img')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for listing in batch:
+            listing.content_hash = listing_content_hash(listing.price, listing.title, listing.description, listing.img)
+        Listing.objects.bulk_update(batch, ['content_hash'])
+        last_pk = batch[-1].listing_idx
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_scanworkunit_high_water'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('old_price_cents', models.BigIntegerField()),
+                ('new_price_cents', models.BigIntegerField()),
+                ('price_currency', models.CharField(max_length=3, null=True)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Listing Price Change',
+                'verbose_name_plural': 'Listing Price History',
+                'db_table': 'listing_price_history',
+            },
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='previous_price_cents',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('price_cents__lt', models.F('previous_price_cents'))), fields=['created_at'], name='listings_price_dropped_idx'),
+        ),
+        migrations.AddField(
+            model_name='listingpricehistory',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='main.listing'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpricehistory',
+            index=models.Index(fields=['listing', 'changed_at'], name='listing_price_history_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from main.dedup import canonical_ids
+from main.simhash import fingerprint_bands, simhash
+
+BATCH_SIZE = 2000
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """Fingerprint the existing listings and cluster them, oldest first."""
+    Listing = apps.get_model('main', 'Listing')
+    ListingFingerprintBand = apps.get_model('main', 'ListingFingerprintBand')
+    last_pk = 0
+    while True:
+        batch = list(
+            Listing.objects.filter(listing_idx__gt=last_pk)
+            .order_by('listing_idx')
+            .only('listing_idx', 'title', 'description', 'price_cents')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for listing in batch:
+            listing.simhash = simhash(listing.title, listing.description, listing.price_cents)
+        canonical = canonical_ids([(listing.pk, listing.simhash) for listing in batch], ListingFingerprintBand)
+        for listing in batch:
+            listing.duplicate_of_id = canonical[listing.pk]
+        Listing.objects.bulk_update(batch, ['simhash', 'duplicate_of'])
+        ListingFingerprintBand.objects.bulk_create([
+            ListingFingerprintBand(listing_id=listing.pk, band=band, value=value)
+            for listing in batch if listing.simhash is not None
+            for band, value in fingerprint_bands(listing.simhash)
+        ])
+        last_pk = batch[-1].listing_idx
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_listing_content_hash_price_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='duplicate_of',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='main.listing'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='simhash',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ListingFingerprintBand',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('band', models.SmallIntegerField()),
+                ('value', models.IntegerField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint_bands', to='main.listing')),
+            ],
+            options={
+                'verbose_name': 'Listing Fingerprint Band',
+                'verbose_name_plural': 'Listing Fingerprint Bands',
+                'db_table': 'listing_fingerprint_bands',
+                'indexes': [models.Index(fields=['band', 'value'], name='listing_fp_bands_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.0.1 on 2026-10-18 22:10
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations
+from django.db.models import Q
+
+from main.dedup import canonical_ids
+from main.simhash import fingerprint_bands, simhash
+
+BATCH_SIZE = 2000
+
+# main.pricing.parse_price as of this migration, frozen so later parser
+# changes don't change what the migration does
+
+CURRENCY_MARKERS = [
+    ('CA$', 'CAD'),
+    ('C$', 'CAD'),
+    ('A$', 'AUD'),
+    ('US$', 'USD'),
+    ('USD', 'USD'),
+    ('CAD', 'CAD'),
+    ('EUR', 'EUR'),
+    ('GBP', 'GBP'),
+    ('$', 'USD'),
+    ('€', 'EUR'),
+    ('£', 'GBP'),
+]
+
+FREE_RE = re.compile(r'\b(?:free|gratis)\b', re.IGNORECASE)
+
+NUMBER_RE = re.compile(r'(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)(\s*[kK]\b)?')
+
+
+def parse_price(raw):
+    if raw is None:
+        return None, None, False
+
+    text = str(raw).strip()
+    if not text:
+        return None, None, False
+
+    match = NUMBER_RE.search(text)
+    if not match and FREE_RE.search(text):
+        return 0, None, True
+
+    currency = None
+    upper = text.upper()
+    for marker, code in CURRENCY_MARKERS:
+        if marker in upper:
+            currency = code
+            break
+
+    if not match:
+        return None, currency, False
+
+    try:
+        amount = Decimal(match.group(1).replace(',', ''))
+    except InvalidOperation:
+        return None, currency, False
+    if match.group(2):
+        amount *= 1000
+
+    cents = int((amount * 100).to_integral_value())
+    return cents, currency, cents == 0
+
+
+def reparse_prices(apps, schema_editor):
+    """
+    Re-parse the prices the old parser got wrong: "free" inside other words
+    or next to an amount, and amounts with a "k" suffix.
+
+    The SimHash includes the price, so re-parsed listings are fingerprinted
+    and clustered again. content_hash is computed from the raw price string
+    and doesn't change.
+    """
+    Listing = apps.get_model('main', 'Listing')
+    ListingFingerprintBand = apps.get_model('main', 'ListingFingerprintBand')
+    candidates = Listing.objects.filter(
+        Q(price__icontains='free') | Q(price__icontains='gratis') | Q(price__icontains='k')
+    )
+    last_pk = 0
+    while True:
+        batch = list(
+            candidates.filter(listing_idx__gt=last_pk)
+            .order_by('listing_idx')
+            .only(
+                'listing_idx', 'price', 'title', 'description', 'price_cents', 'price_currency', 'price_is_free',
+                'simhash', 'duplicate_of',
+            )[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        changed = []
+        for listing in batch:
+            parsed = parse_price(listing.price)
+            if parsed != (listing.price_cents, listing.price_currency, listing.price_is_free):
+                listing.price_cents, listing.price_currency, listing.price_is_free = parsed
+                listing.simhash = simhash(listing.title, listing.description, listing.price_cents)
+                changed.append(listing)
+
+        ListingFingerprintBand.objects.filter(listing_id__in=[listing.pk for listing in changed]).delete()
+        canonical = canonical_ids([(listing.pk, listing.simhash) for listing in changed], ListingFingerprintBand)
+        for listing in changed:
+            listing.duplicate_of_id = canonical[listing.pk]
+        Listing.objects.bulk_update(
+            changed, ['price_cents', 'price_currency', 'price_is_free', 'simhash', 'duplicate_of']
+        )
+        ListingFingerprintBand.objects.bulk_create([
+            ListingFingerprintBand(listing_id=listing.pk, band=band, value=value)
+            for listing in changed if listing.simhash is not None
+            for band, value in fingerprint_bands(listing.simhash)
+        ])
+        last_pk = batch[-1].listing_idx
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_modelversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(reparse_prices, migrations.RunPython.noop),
+    ]
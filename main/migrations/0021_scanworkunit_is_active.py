@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_reparse_free_and_k_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanworkunit',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -1,9 +1,20 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
+
+from .geo import encode_geohash
+from .normalization import listing_content_hash, normalize_listing_url
+from .pricing import is_price_change, parse_price
+from .simhash import simhash
 
 class Location(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
     marketplace_url_slug = models.CharField(max_length=100)
+    # Centre of the location; listings scraped without coordinates get these
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
     
     class Meta:
         db_table = 'locations'
@@ -48,7 +59,7 @@ class ScannerLocationMapping(models.Model):
 class Keyword(models.Model):
     id = models.AutoField(primary_key=True)
     keyword = models.CharField(max_length=50, null=True)
-    filterID = models.IntegerField()
+    filterID = models.IntegerField(db_index=True)  # ID of the scanner the keyword belongs to
 
     class Meta:
         db_table = 'keywords'
@@ -62,11 +73,32 @@ class Keyword(models.Model):
 class Listing(models.Model):
     listing_idx = models.AutoField(primary_key=True)
     price = models.CharField(max_length=50, null=True)
+    # Parsed from `price` on write (see refresh_derived_fields)
+    price_cents = models.BigIntegerField(null=True, editable=False)
+    price_currency = models.CharField(max_length=3, null=True, editable=False)
+    price_is_free = models.BooleanField(default=False, editable=False)
+    # price_cents before the most recent price change (see ListingPriceHistory)
+    previous_price_cents = models.BigIntegerField(null=True, editable=False)
     title = models.TextField(null=True)
     location = models.CharField(max_length=50, null=True)  # This is the listing's location (e.g., "Denver, CO")
     description = models.TextField(null=True)
     distance = models.IntegerField(null=True)
+    # Where the item is, scraped or geocoded from `location` (see main/ingest.py)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Geohash of the coordinates, the index for radius queries (see main/geo.py)
+    geohash = models.CharField(max_length=12, null=True, editable=False)
     url = models.TextField(null=True)
+    # Normalized `url`, the dedup key for bulk ingestion (see main/ingest.py)
+    url_key = models.TextField(null=True, unique=True, editable=False)
+    # listing_content_hash() of price, title, description and img
+    content_hash = models.CharField(max_length=32, null=True, editable=False)
+    # Near-duplicate detection (see main/dedup.py): the listing's SimHash and,
+    # for a repost, the oldest listing of its cluster
+    simhash = models.BigIntegerField(null=True, editable=False)
+    duplicate_of = models.ForeignKey(
+        'self', null=True, on_delete=models.SET_NULL, related_name='duplicates', editable=False
+    )
     img = models.TextField(null=True)
     query = models.CharField(max_length=50, null=True)
     search_title = models.TextField(null=True)
@@ -75,12 +107,229 @@ class Listing(models.Model):
     search_location = models.CharField(max_length=100, null=True)  # Location where the search was performed
     watchlist = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by a database trigger on PostgreSQL (see main/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         db_table = 'listings'
         verbose_name = 'Listing'
         verbose_name_plural = 'Listings'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['price_cents'], name='listings_price_cents_idx'),
+            # Default ordering and keyset pagination (ListingCursorPagination)
+            models.Index(fields=['created_at', 'listing_idx'], name='listings_created_idx'),
+            # ListingViewSet filter combinations, all ordered by -created_at
+            models.Index(fields=['query', 'created_at'], name='listings_query_created_idx'),
+            models.Index(fields=['query', 'search_location', 'created_at'], name='listings_query_loc_created_idx'),
+            models.Index(fields=['search_title', 'created_at'], name='listings_title_created_idx'),
+            models.Index(fields=['search_location', 'created_at'], name='listings_loc_created_idx'),
+            models.Index(fields=['search_location', 'distance'], name='listings_loc_distance_idx'),
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(watchlist=True),
+                name='listings_watchlist_created_idx',
+            ),
+            # ?near= bounding-box probe
+            models.Index(fields=['geohash', 'created_at'], name='listings_geohash_created_idx'),
+            # ?price_dropped=true
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(price_cents__lt=models.F('previous_price_cents')),
+                name='listings_price_dropped_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.title} - {self.price}"
+
+    # Columns that are never exposed through the API
+    INTERNAL_FIELDS = ['search_vector', 'url_key', 'content_hash', 'simhash', 'geohash']
+
+    # Columns computed from other columns, kept in sync on every write
+    DERIVED_FIELDS = ['price_cents', 'price_currency', 'price_is_free', 'url_key', 'content_hash', 'simhash', 'geohash']
+
+    # Columns whose values as loaded from the database are remembered, so
+    # signal handlers can tell what changed on save (see main/signals.py)
+    TRACKED_FIELDS = [
+        'query', 'search_title', 'search_location', 'price_cents', 'previous_price_cents', 'content_hash', 'simhash',
+    ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def remember_loaded_values(self):
+        self._loaded_values = {
+            field: self.__dict__[field] for field in self.TRACKED_FIELDS if field in self.__dict__
+        }
+
+    def refresh_derived_fields(self):
+        """Recompute the columns derived from the raw scraped values."""
+        self.price_cents, self.price_currency, self.price_is_free = parse_price(self.price)
+        self.url_key = normalize_listing_url(self.url)
+        self.content_hash = listing_content_hash(self.price, self.title, self.description, self.img)
+        self.simhash = simhash(self.title, self.description, self.price_cents)
+        has_coordinates = self.latitude is not None and self.longitude is not None
+        self.geohash = encode_geohash(self.latitude, self.longitude) if has_coordinates else None
+
+    def loaded_value(self, field):
+        """A tracked column's value as last loaded or saved, or None if unknown."""
+        return getattr(self, '_loaded_values', {}).get(field)
+
+    def save(self, *args, **kwargs):
+        self.refresh_derived_fields()
+        if is_price_change(self.loaded_value('price_cents'), self.price_cents):
+            self.previous_price_cents = self.loaded_value('price_cents')
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.DERIVED_FIELDS) | {'previous_price_cents'}
+        super().save(*args, **kwargs)
+
+
+class ListingFacet(models.Model):
+    """
+    Distinct filter values across listings with how many listings carry each.
+
+    Maintained incrementally by the Listing signal handlers and the bulk
+    ingestion path (see main/facets.py); `rebuild_listing_facets` recomputes
+    it from scratch.
+    """
+    FACET_CHOICES = [
+        ('query', 'Query'),
+        ('category', 'Category'),
+        ('search_location', 'Search location'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.TextField()
+    listing_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'listing_facets'
+        unique_together = ('facet', 'value')
+        verbose_name = 'Listing Facet'
+        verbose_name_plural = 'Listing Facets'
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({self.listing_count})"
+
+
+class ListingKeywordMatch(models.Model):
+    """A scanner keyword found in a listing's title or description at ingest time."""
+    id = models.BigAutoField(primary_key=True)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='keyword_matches')
+    keyword = models.ForeignKey(Keyword, on_delete=models.CASCADE, related_name='listing_matches')
+
+    class Meta:
+        db_table = 'listing_keyword_matches'
+        unique_together = ('listing', 'keyword')
+        indexes = [
+            models.Index(fields=['keyword', 'listing'], name='listing_kw_matches_kw_idx'),
+        ]
+        verbose_name = 'Listing Keyword Match'
+        verbose_name_plural = 'Listing Keyword Matches'
+
+    def __str__(self):
+        return f"{self.keyword} in listing {self.listing_id}"
+
+
+class ListingPriceHistory(models.Model):
+    """
+    One price change of a listing, appended when a save or re-scan moves its
+    parsed price (see main/ingest.py and main/signals.py).
+    """
+    id = models.BigAutoField(primary_key=True)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='price_history')
+    old_price_cents = models.BigIntegerField()
+    new_price_cents = models.BigIntegerField()
+    price_currency = models.CharField(max_length=3, null=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'listing_price_history'
+        indexes = [
+            models.Index(fields=['listing', 'changed_at'], name='listing_price_history_idx'),
+        ]
+        verbose_name = 'Listing Price Change'
+        verbose_name_plural = 'Listing Price History'
+
+    def __str__(self):
+        return f"Listing {self.listing_id}: {self.old_price_cents} -> {self.new_price_cents}"
+
+
+class ListingFingerprintBand(models.Model):
+    """One 16-bit band of a listing's SimHash, the lookup key for near duplicates."""
+    id = models.BigAutoField(primary_key=True)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='fingerprint_bands')
+    band = models.SmallIntegerField()
+    value = models.IntegerField()
+
+    class Meta:
+        db_table = 'listing_fingerprint_bands'
+        indexes = [
+            models.Index(fields=['band', 'value'], name='listing_fp_bands_lookup_idx'),
+        ]
+        verbose_name = 'Listing Fingerprint Band'
+        verbose_name_plural = 'Listing Fingerprint Bands'
+
+    def __str__(self):
+        return f"Listing {self.listing_id} band {self.band}={self.value}"
+
+
+class ScanWorkUnit(models.Model):
+    """
+    One schedulable scan of an active scanner x location mapping.
+
+    run_scanners workers claim due units with SELECT ... FOR UPDATE SKIP
+    LOCKED and hold them under a lease they keep extending while scanning;
+    a unit whose lease expired (its worker died) is claimable again. Units
+    of mappings that stop being active are deactivated rather than deleted,
+    so their high-water marks survive until the mapping is active again.
+    """
+    id = models.AutoField(primary_key=True)
+    mapping = models.OneToOneField(ScannerLocationMapping, on_delete=models.CASCADE, related_name='work_unit')
+    is_active = models.BooleanField(default=True)
+    next_due_at = models.DateTimeField(default=timezone.now)
+    lease_owner = models.CharField(max_length=100, null=True)
+    lease_expires_at = models.DateTimeField(null=True)
+    last_started_at = models.DateTimeField(null=True)
+    last_finished_at = models.DateTimeField(null=True)
+    last_error = models.TextField(null=True)
+    # High-water mark for incremental scans (see main/scanner.py)
+    high_water_keys = models.JSONField(default=list)  # Newest listing url_keys seen, newest first
+    high_water_at = models.DateTimeField(null=True)  # When a new newest listing was last seen
+    last_full_scan_at = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = 'scan_work_units'
+        indexes = [
+            models.Index(fields=['next_due_at'], name='scan_work_units_due_idx'),
+        ]
+        verbose_name = 'Scan Work Unit'
+        verbose_name_plural = 'Scan Work Units'
+
+    def __str__(self):
+        return f"Scan of mapping {self.mapping_id} due {self.next_due_at}"
+
+
+class ModelVersion(models.Model):
+    """
+    A per-model change counter, bumped after every committed write (see
+    main/versions.py). Read endpoints build their ETags from it.
+    """
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)  # Model label, e.g. "main.listing"
+    version = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'model_versions'
+        verbose_name = 'Model Version'
+        verbose_name_plural = 'Model Versions'
 
     def __str__(self):
-        return f"{self.title} - {self.price}"
\ No newline at end of file
+        return f"{self.name} v{self.version}"
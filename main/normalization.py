@@ -0,0 +1,63 @@
+import hashlib
+import json
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    'ref', 'referral_code', 'referral_story_type', 'tracking', 'fbclid',
+    '__tn__', '__cft__', 'mibextid', 'rdid', 'share_url', 'gclid',
+}
+
+HOST_PREFIXES = ('www.', 'm.', 'mobile.', 'web.')
+
+MARKETPLACE_ITEM_RE = re.compile(r'^/marketplace/item/(\d+)')
+
+
+def normalize_listing_url(url):
+    """
+    Reduce a listing URL to a stable key identifying the item.
+
+    Scheme, "www."/"m." host prefixes, fragments, trailing slashes and
+    tracking parameters are dropped, so the same item scraped from different
+    searches maps to the same key. Returns None for empty URLs.
+    """
+    if not url:
+        return None
+    url = url.strip()
+    if not url:
+        return None
+
+    parts = urlsplit(url if '//' in url else f'//{url}')
+    host = (parts.hostname or '').lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+
+    path = re.sub(r'/{2,}', '/', parts.path).rstrip('/')
+
+    # Marketplace items are identified by their numeric id alone
+    item = MARKETPLACE_ITEM_RE.match(path)
+    if item:
+        return f'{host}/marketplace/item/{item.group(1)}'
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')
+    )
+    key = f'{host}{path}'
+    if query:
+        key = f'{key}?{urlencode(query)}'
+    return key
+
+
+def listing_content_hash(price, title, description, img):
+    """
+    Fingerprint of the listing columns a re-scan can meaningfully change.
+
+    Ingestion compares it with the stored hash to skip rewriting listings
+    that are unchanged since they were last seen.
+    """
+    payload = json.dumps([price, title, description, img], ensure_ascii=False)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
@@ -0,0 +1,81 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+# Currency symbols/codes we see in marketplace price strings, longest first so
+# "CA$" wins over "$".
+CURRENCY_MARKERS = [
+    ('CA$', 'CAD'),
+    ('C$', 'CAD'),
+    ('A$', 'AUD'),
+    ('US$', 'USD'),
+    ('USD', 'USD'),
+    ('CAD', 'CAD'),
+    ('EUR', 'EUR'),
+    ('GBP', 'GBP'),
+    ('$', 'USD'),
+    ('€', 'EUR'),
+    ('£', 'GBP'),
+]
+
+# Whole words only, so "Freezer" or "carefree" aren't free
+FREE_RE = re.compile(r'\b(?:free|gratis)\b', re.IGNORECASE)
+
+# First number in the string, allowing thousands separators, cents and a
+# thousands suffix, e.g. "$1,250", "1250.00", "$ 40 obo", "1.5k"
+NUMBER_RE = re.compile(r'(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)(\s*[kK]\b)?')
+
+
+def parse_price(raw):
+    """
+    Parse a scraped price string into (cents, currency, is_free).
+
+    Returns (None, None, False) when no price can be found, so callers can
+    store the result directly on the Listing columns.
+    """
+    if raw is None:
+        return None, None, False
+
+    text = str(raw).strip()
+    if not text:
+        return None, None, False
+
+    match = NUMBER_RE.search(text)
+    # "Free" alone; with an amount ("$50 free delivery") the amount wins
+    if not match and FREE_RE.search(text):
+        return 0, None, True
+
+    currency = None
+    upper = text.upper()
+    for marker, code in CURRENCY_MARKERS:
+        if marker in upper:
+            currency = code
+            break
+
+    if not match:
+        return None, currency, False
+
+    try:
+        amount = Decimal(match.group(1).replace(',', ''))
+    except InvalidOperation:
+        return None, currency, False
+    if match.group(2):
+        amount *= 1000
+
+    cents = int((amount * 100).to_integral_value())
+    return cents, currency, cents == 0
+
+
+def to_cents(value):
+    """Convert a query-string amount like "150" or "99.5" to integer cents."""
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'Invalid price: {value!r}')
+    if not amount.is_finite():
+        raise ValueError(f'Invalid price: {value!r}')
+    return int((amount * 100).to_integral_value())
+
+
+def is_price_change(old_cents, new_cents):
+    """Whether a parsed price moved between two known values."""
+    return old_cents is not None and new_cents is not None and old_cents != new_cents
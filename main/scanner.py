@@ -0,0 +1,390 @@
+"""
+Scan engine behind the `run_scanners` management command.
+
+Every active ActiveScanner x active ScannerLocationMapping pair is a
+ScanTarget. Targets are fetched concurrently on a thread pool with:
+
+- a global bound (the pool size) and a per-host bound on in-flight requests,
+- one pooled, keep-alive requests.Session shared by all threads,
+- retries with exponential backoff and jitter on connection errors,
+  timeouts, 429 and 5xx responses (honouring Retry-After), never waiting
+  longer than SCANNER_MAX_BACKOFF.
+
+Scans are incremental: each pair's ScanWorkUnit keeps a high-water mark of
+the newest listing URL keys seen. Results are requested newest first, so
+once a page reaches a known listing the scan stops paging, and known
+listings are neither re-fetched nor re-stored. Every
+SCANNER_FULL_RESCAN_INTERVAL seconds a pair gets a full re-scan instead.
+
+Worker threads only do HTTP and parsing; all database access (loading
+targets, validating rows, ingest_listings batches, high-water marks)
+happens on the calling thread.
+"""
+import logging
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from urllib.parse import quote_plus, urljoin, urlsplit
+
+import requests
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from rest_framework.exceptions import ValidationError
+
+from .ingest import ingest_listings
+from .models import ScannerLocationMapping, ScanWorkUnit
+from .normalization import normalize_listing_url
+from .serializers import ListingIngestSerializer
+
+logger = logging.getLogger(__name__)
+
+# ActiveScanner.status values that mean "scan this"
+ACTIVE_STATUSES = ('active', 'running')
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+LISTING_KEYS = ('price', 'title', 'location', 'description', 'distance', 'latitude', 'longitude', 'url', 'img')
+
+
+@dataclass
+class ScanTarget:
+    mapping_id: int
+    scanner_id: int
+    query: str
+    category: str
+    location_name: str
+    location_slug: str
+    work_unit_id: int = None
+    # High-water mark: newest listing url_keys seen, newest first
+    known_keys: tuple = ()
+    full_scan: bool = True
+
+    def search_url(self, template):
+        return template.format(query=quote_plus(self.query), location=self.location_slug)
+
+
+@dataclass
+class ScanResult:
+    target: ScanTarget
+    rows: list = field(default_factory=list)
+    pages: int = 0
+    requests: int = 0
+    known: int = 0
+    # url_keys in the order the results listed them
+    seen_keys: list = field(default_factory=list)
+    error: str = None
+
+
+class RetryableResponse(Exception):
+    def __init__(self, response):
+        super().__init__(f'HTTP {response.status_code} for {response.url}')
+        self.response = response
+
+
+def active_targets(scanner_ids=None):
+    """Load every active scanner x active location pair as ScanTargets."""
+    mappings = ScannerLocationMapping.objects.filter(
+        is_active=True, scanner__status__in=ACTIVE_STATUSES
+    ).order_by('id')
+    if scanner_ids:
+        mappings = mappings.filter(scanner_id__in=scanner_ids)
+
+    # Every pair needs a work unit to carry its high-water mark
+    missing = mappings.filter(work_unit__isnull=True).values_list('id', flat=True)
+    ScanWorkUnit.objects.bulk_create([ScanWorkUnit(mapping_id=mapping_id) for mapping_id in missing], ignore_conflicts=True)
+    return [
+        target_for_mapping(mapping, mapping.work_unit)
+        for mapping in mappings.select_related('scanner', 'location', 'work_unit')
+    ]
+
+
+def target_for_mapping(mapping, unit=None):
+    target = ScanTarget(
+        mapping_id=mapping.id,
+        scanner_id=mapping.scanner_id,
+        query=mapping.scanner.query,
+        category=mapping.scanner.category,
+        location_name=mapping.location.name,
+        location_slug=mapping.location.marketplace_url_slug,
+    )
+    if unit is not None:
+        target.work_unit_id = unit.id
+        target.known_keys = tuple(unit.high_water_keys)
+        target.full_scan = unit.last_full_scan_at is None or (
+            timezone.now() - unit.last_full_scan_at >= timedelta(seconds=settings.SCANNER_FULL_RESCAN_INTERVAL)
+        )
+    return target
+
+
+def save_high_water_mark(result):
+    """Advance a finished scan's high-water mark on its work unit."""
+    target = result.target
+    if result.error or target.work_unit_id is None:
+        # A failed scan may have missed listings; keep the old mark
+        return
+    now = timezone.now()
+    keys = list(dict.fromkeys(result.seen_keys + list(target.known_keys)))[:settings.SCANNER_HIGH_WATER_KEYS]
+    changes = {'high_water_keys': keys}
+    if result.seen_keys and result.seen_keys[0] not in target.known_keys[:1]:
+        changes['high_water_at'] = now
+    if target.full_scan:
+        changes['last_full_scan_at'] = now
+    ScanWorkUnit.objects.filter(id=target.work_unit_id).update(**changes)
+
+
+class Fetcher:
+    """Thread-safe HTTP client with per-host concurrency limits and retries."""
+
+    def __init__(self, concurrency, per_host, retries, backoff, timeout, session=None, max_backoff=None):
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = settings.SCANNER_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.setdefault('User-Agent', settings.SCANNER_USER_AGENT)
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._host_lock = threading.Lock()
+
+    @contextmanager
+    def host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            slot = self._host_slots[host]
+        with slot:
+            yield
+
+    def get(self, url):
+        """GET `url`, retrying transient failures; raises after the last attempt."""
+        attempt = 0
+        while True:
+            try:
+                with self.host_slot(url):
+                    response = self.session.get(url, timeout=self.timeout)
+                if response.status_code in RETRY_STATUSES:
+                    raise RetryableResponse(response)
+                response.raise_for_status()
+                return response
+            except (requests.ConnectionError, requests.Timeout, RetryableResponse) as exc:
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.retry_delay(attempt, exc))
+                attempt += 1
+
+    def retry_delay(self, attempt, exc):
+        """Seconds to wait before retrying, never more than max_backoff."""
+        if isinstance(exc, RetryableResponse):
+            # Only delay-seconds; a malformed, negative or non-finite value
+            # (or an HTTP date) falls back to our own backoff
+            try:
+                retry_after = float(exc.response.headers.get('Retry-After', ''))
+            except ValueError:
+                retry_after = None
+            if retry_after is not None and math.isfinite(retry_after) and retry_after >= 0:
+                return min(retry_after, self.max_backoff)
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff * (2 ** attempt), self.max_backoff))
+
+    def close(self):
+        self.session.close()
+
+
+def parse_search_page(response):
+    """
+    Return (items, next_url) for a search results page.
+
+    JSON responses are {"listings": [...], "next": url} (or a bare list);
+    HTML responses are scraped for marketplace item links. Raises ValueError
+    for JSON of any other shape.
+    """
+    if 'json' in response.headers.get('Content-Type', ''):
+        data = response.json()
+        if isinstance(data, list):
+            return [item for item in data if isinstance(item, dict)], None
+        if not isinstance(data, dict):
+            raise ValueError(f'Unexpected search page from {response.url}: {type(data).__name__}')
+        listings = data.get('listings', [])
+        next_url = data.get('next')
+        if not isinstance(listings, list) or not isinstance(next_url, (str, type(None))):
+            raise ValueError(f'Unexpected search page from {response.url}')
+        items = [item for item in listings if isinstance(item, dict)]
+        return items, urljoin(response.url, next_url) if next_url else None
+
+    soup = BeautifulSoup(response.text, 'html.parser')
+    items = []
+    seen = set()
+    for link in soup.select('a[href*="/marketplace/item/"]'):
+        url = urljoin(response.url, link['href'])
+        if url in seen:
+            continue
+        seen.add(url)
+        texts = list(link.stripped_strings)
+        item = {'url': url}
+        if texts and (texts[0].startswith(('$', '€', '£')) or texts[0].lower() == 'free'):
+            item['price'] = texts.pop(0)
+        if texts:
+            item['title'] = texts.pop(0)
+        if texts:
+            item['location'] = texts.pop(0)
+        image = link.find('img')
+        if image and image.get('src'):
+            item['img'] = image['src']
+        items.append(item)
+
+    next_link = soup.find('a', rel='next')
+    next_url = urljoin(response.url, next_link['href']) if next_link and next_link.get('href') else None
+    return items, next_url
+
+
+def parse_detail_page(response):
+    """Return the listing fields found on an item's own page."""
+    if 'json' in response.headers.get('Content-Type', ''):
+        data = response.json()
+        return data if isinstance(data, dict) else {}
+
+    soup = BeautifulSoup(response.text, 'html.parser')
+    details = {}
+    for name, key in (
+        ('og:description', 'description'), ('og:title', 'title'), ('og:image', 'img'),
+        ('place:location:latitude', 'latitude'), ('place:location:longitude', 'longitude'),
+    ):
+        tag = soup.find('meta', property=name)
+        if tag and tag.get('content'):
+            details[key] = tag['content']
+    return details
+
+
+class ScanEngine:
+    """Fans ScanTargets out over a thread pool and stores what they find in batches."""
+
+    def __init__(self, concurrency=None, per_host=None, retries=None, backoff=None, timeout=None,
+                 max_pages=None, fetch_details=None, batch_size=None, search_url=None, session=None):
+        self.concurrency = concurrency or settings.SCANNER_CONCURRENCY
+        self.max_pages = max_pages or settings.SCANNER_MAX_PAGES
+        self.fetch_details = settings.SCANNER_FETCH_DETAILS if fetch_details is None else fetch_details
+        self.batch_size = batch_size or settings.SCANNER_BATCH_SIZE
+        self.search_url = search_url or settings.SCANNER_SEARCH_URL
+        self.fetcher = Fetcher(
+            concurrency=self.concurrency,
+            per_host=per_host or settings.SCANNER_PER_HOST_CONCURRENCY,
+            retries=settings.SCANNER_MAX_RETRIES if retries is None else retries,
+            backoff=settings.SCANNER_BACKOFF if backoff is None else backoff,
+            timeout=timeout or settings.SCANNER_TIMEOUT,
+            session=session,
+        )
+        self.serializer = ListingIngestSerializer()
+
+    def run(self, targets):
+        """Scan every target once; returns a summary dict of counts."""
+        summary = {
+            'targets': len(targets), 'failed': 0, 'pages': 0, 'requests': 0,
+            'known': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0,
+            'failed_mappings': {},
+        }
+        pending = []
+        finished = []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='scanner') as pool:
+            futures = [pool.submit(self.scan_target, target) for target in targets]
+            for future in as_completed(futures):
+                result = future.result()
+                self.record(result, summary)
+                pending.extend(result.rows)
+                finished.append(result)
+                if len(pending) >= self.batch_size:
+                    self.store(pending, summary, finished)
+                    pending, finished = [], []
+        self.store(pending, summary, finished)
+        return summary
+
+    def record(self, result, summary):
+        summary['pages'] += result.pages
+        summary['requests'] += result.requests
+        summary['known'] += result.known
+        if result.error:
+            summary['failed'] += 1
+            summary['failed_mappings'][result.target.mapping_id] = result.error
+            logger.warning(
+                'Scan of "%s" in %s failed: %s',
+                result.target.query, result.target.location_slug, result.error,
+            )
+
+    def scan_target(self, target):
+        """Fetch a target's result pages (and item pages); runs on a worker thread."""
+        result = ScanResult(target=target)
+        url = target.search_url(self.search_url)
+        known_keys = set(target.known_keys)
+        try:
+            while url and result.pages < self.max_pages:
+                response = self.fetcher.get(url)
+                result.requests += 1
+                result.pages += 1
+                items, url = parse_search_page(response)
+                reached_known = False
+                for item in items:
+                    url_key = normalize_listing_url(item.get('url'))
+                    if url_key:
+                        result.seen_keys.append(url_key)
+                    if url_key in known_keys and not target.full_scan:
+                        # Already stored by an earlier scan
+                        reached_known = True
+                        result.known += 1
+                        continue
+                    if self.fetch_details and item.get('url') and not item.get('description'):
+                        item.update(self.fetch_detail(item['url'], result))
+                    result.rows.append(self.to_row(item, target))
+                if reached_known:
+                    # Everything on later pages is older still
+                    break
+        except (requests.RequestException, RetryableResponse, ValueError) as exc:
+            result.error = str(exc)
+        return result
+
+    def fetch_detail(self, url, result):
+        try:
+            response = self.fetcher.get(url)
+        except (requests.RequestException, RetryableResponse) as exc:
+            logger.info('Skipping details for %s: %s', url, exc)
+            return {}
+        finally:
+            result.requests += 1
+        return {key: value for key, value in parse_detail_page(response).items() if key in LISTING_KEYS}
+
+    def to_row(self, item, target):
+        row = {key: item[key] for key in LISTING_KEYS if item.get(key) is not None}
+        row.update(
+            query=target.query,
+            search_title=target.category,
+            scanner_id=target.scanner_id,
+            search_location=target.location_name,
+        )
+        return row
+
+    def store(self, rows, summary, results=()):
+        """Ingest scraped rows, then advance the marks of the scans they came from."""
+        valid_rows = []
+        for row in rows:
+            try:
+                valid_rows.append(self.serializer.run_validation(row))
+            except ValidationError as exc:
+                summary['skipped'] += 1
+                logger.info('Dropping scraped listing %s: %s', row.get('url'), exc.detail)
+        if valid_rows:
+            counts = ingest_listings(valid_rows)
+            for key in ('inserted', 'updated', 'unchanged', 'skipped'):
+                summary[key] += counts[key]
+        for result in results:
+            save_high_water_mark(result)
+
+    def close(self):
+        self.fetcher.close()
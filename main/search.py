@@ -0,0 +1,177 @@
+"""
+Full-text search over Listing.title and Listing.description.
+
+On PostgreSQL a trigger keeps Listing.search_vector (weighted title A,
+description B) current on every insert/update, and a GIN index serves the
+matches. On SQLite, used for tests and local development, an external-content
+FTS5 table kept in sync by triggers plays the same role.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+
+POSTGRES_INSTALL = [
+    f"""
+    CREATE OR REPLACE FUNCTION listings_search_vector_trigger() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DROP TRIGGER IF EXISTS listings_search_vector_update ON listings
+    """,
+    """
+    CREATE TRIGGER listings_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description ON listings
+    FOR EACH ROW EXECUTE FUNCTION listings_search_vector_trigger()
+    """,
+]
+
+POSTGRES_BACKFILL = f"""
+    UPDATE listings SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')
+    WHERE listing_idx > %s AND listing_idx <= %s
+"""
+
+POSTGRES_INDEX = """
+    CREATE INDEX IF NOT EXISTS listings_search_vector_idx ON listings USING gin (search_vector)
+"""
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS listings_search_vector_idx",
+    "DROP TRIGGER IF EXISTS listings_search_vector_update ON listings",
+    "DROP FUNCTION IF EXISTS listings_search_vector_trigger()",
+]
+
+SQLITE_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts
+    USING fts5(title, description, content='listings', content_rowid='listing_idx')
+"""
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_insert AFTER INSERT ON listings BEGIN
+        INSERT INTO listings_fts(rowid, title, description)
+        VALUES (new.listing_idx, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_delete AFTER DELETE ON listings BEGIN
+        INSERT INTO listings_fts(listings_fts, rowid, title, description)
+        VALUES ('delete', old.listing_idx, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_update AFTER UPDATE ON listings BEGIN
+        INSERT INTO listings_fts(listings_fts, rowid, title, description)
+        VALUES ('delete', old.listing_idx, old.title, old.description);
+        INSERT INTO listings_fts(rowid, title, description)
+        VALUES (new.listing_idx, new.title, new.description);
+    END
+    """,
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS listings_fts_insert",
+    "DROP TRIGGER IF EXISTS listings_fts_delete",
+    "DROP TRIGGER IF EXISTS listings_fts_update",
+    "DROP TABLE IF EXISTS listings_fts",
+]
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def install_search(connection):
+    """Create the triggers and index backing full-text search and fill them in."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for statement in POSTGRES_INSTALL:
+                cursor.execute(statement)
+            cursor.execute('SELECT coalesce(max(listing_idx), 0) FROM listings')
+            max_pk = cursor.fetchone()[0]
+            for start in range(0, max_pk, BACKFILL_BATCH_SIZE):
+                cursor.execute(POSTGRES_BACKFILL, [start, start + BACKFILL_BATCH_SIZE])
+            cursor.execute(POSTGRES_INDEX)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(SQLITE_TABLE)
+            for statement in SQLITE_TRIGGERS:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO listings_fts(listings_fts) VALUES ('rebuild')")
+
+
+def uninstall_search(connection):
+    statements = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def ensure_sqlite_triggers(connection):
+    """
+    Recreate the FTS5 sync triggers on SQLite.
+
+    SQLite migrations that alter the listings table rebuild it, which drops
+    its triggers; this runs after every migrate to put them back.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listings_fts'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'listings_fts_insert'")
+        if cursor.fetchone() is not None:
+            return
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO listings_fts(listings_fts) VALUES ('rebuild')")
+
+
+def fts5_query(text):
+    """Quote each term so user input can't be parsed as FTS5 query syntax."""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"' for term in terms if term)
+
+
+def search_listings(queryset, text):
+    """
+    Filter `queryset` to listings matching `text`, best matches first.
+
+    Matches are annotated with `search_rank`; ties fall back to newest first.
+    """
+    text = text.strip()
+    if not text:
+        return queryset
+
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+    elif connection.vendor == 'sqlite':
+        match = fts5_query(text)
+        if not match:
+            return queryset.none()
+        queryset = queryset.filter(
+            listing_idx__in=RawSQL('SELECT rowid FROM listings_fts WHERE listings_fts MATCH %s', [match])
+        ).annotate(
+            # bm25() is lower for better matches; title hits weigh ten times
+            # as much as description hits, like the A/B weights on PostgreSQL
+            search_rank=RawSQL(
+                'SELECT -bm25(listings_fts, 10.0, 1.0) FROM listings_fts '
+                'WHERE listings_fts MATCH %s AND listings_fts.rowid = listings.listing_idx',
+                [match],
+            )
+        )
+    else:
+        return queryset.filter(Q(title__icontains=text) | Q(description__icontains=text))
+
+    return queryset.order_by('-search_rank', '-created_at')
@@ -1,10 +1,11 @@
 from rest_framework import serializers
 from .models import ActiveScanner, Keyword, Listing, Location, ScannerLocationMapping
+from .normalization import normalize_listing_url
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
-        fields = ['id', 'name', 'marketplace_url_slug']
+        fields = ['id', 'name', 'marketplace_url_slug', 'latitude', 'longitude']
 
 class ScannerLocationMappingSerializer(serializers.ModelSerializer):
     location_name = serializers.CharField(source='location.name', read_only=True)
@@ -22,8 +23,13 @@ class ActiveScannerSerializer(serializers.ModelSerializer):
         fields = ['id', 'category', 'query', 'status', 'locations_data']
         
     def get_locations_data(self, obj):
-        # Get all location mappings for this scanner
-        mappings = ScannerLocationMapping.objects.filter(scanner=obj, is_active=True)
+        # Use the mappings prefetched by ActiveScannerViewSet.get_queryset when
+        # available, otherwise load them with their locations in one query
+        mappings = getattr(obj, 'active_mappings', None)
+        if mappings is None:
+            mappings = ScannerLocationMapping.objects.filter(
+                scanner=obj, is_active=True
+            ).select_related('location')
         
         # Format the location data
         return [
@@ -43,6 +49,81 @@ class KeywordSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class ListingSerializer(serializers.ModelSerializer):
+    # Oldest listing of this listing's near-duplicate cluster (see main/dedup.py)
+    canonical_listing_id = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Listing
+        exclude = Listing.INTERNAL_FIELDS
+
+    def get_canonical_listing_id(self, obj):
+        return obj.duplicate_of_id or obj.pk
+
+    def validate_url(self, value):
+        # Listings are deduplicated on their normalized URL (Listing.url_key)
+        url_key = normalize_listing_url(value)
+        if url_key:
+            duplicates = Listing.objects.filter(url_key=url_key)
+            if self.instance is not None:
+                duplicates = duplicates.exclude(pk=self.instance.pk)
+            if duplicates.exists():
+                raise serializers.ValidationError('A listing with this URL already exists.')
+        return value
+
+class ListingRowSerializer:
+    """
+    Fast list representation of listings read with QuerySet.values().
+
+    Gives the same output as ListingSerializer for the chosen fields, but
+    converts plain row dicts with one precomputed function per field instead
+    of building a model instance and a serializer per row. `columns` are the
+    only database columns the fields need.
+    """
+    # Heavy columns left out of list responses unless asked for with ?fields=
+    DEFAULT_EXCLUDE = ['description']
+
+    def __init__(self, fields=None):
+        serializer_fields = ListingSerializer().fields
+        if fields is None:
+            fields = [name for name in serializer_fields if name not in self.DEFAULT_EXCLUDE]
+        unknown = [name for name in fields if name not in serializer_fields]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown fields: {', '.join(unknown)}")
+
+        # Keep the order ListingSerializer uses
+        self.fields = [name for name in serializer_fields if name in fields]
+        self.columns = []
+        self.converters = []
+        for name in self.fields:
+            if name == 'canonical_listing_id':
+                self.columns.extend(['duplicate_of', 'listing_idx'])
+                convert = self.canonical_listing_id
+            else:
+                self.columns.append(name)
+                convert = self.column_converter(name, serializer_fields[name])
+            self.converters.append((name, convert))
+        self.columns = list(dict.fromkeys(self.columns))
+
+    @staticmethod
+    def column_converter(name, field):
+        if isinstance(field, serializers.DateTimeField):
+            to_representation = field.to_representation
+            return lambda row: None if row[name] is None else to_representation(row[name])
+        return lambda row: row[name]
+
+    @staticmethod
+    def canonical_listing_id(row):
+        return row['duplicate_of'] or row['listing_idx']
+
+    def to_representation(self, rows):
+        converters = self.converters
+        return [{name: convert(row) for name, convert in converters} for row in rows]
+
+class ListingIngestSerializer(serializers.ModelSerializer):
+    """Scraped listing fields accepted by the bulk ingestion endpoint."""
     class Meta:
         model = Listing
-        fields = '__all__' 
\ No newline at end of file
+        fields = [
+            'price', 'title', 'location', 'description', 'distance', 'latitude', 'longitude', 'url', 'img',
+            'query', 'search_title', 'scanner_id', 'search_location',
+        ]
@@ -0,0 +1,88 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .dedup import store_fingerprints
+from .facets import apply_facet_deltas, facet_deltas, facet_values, listing_facet_values
+from .live import publish_new_listings
+from .matching import invalidate_matcher, store_matches
+from .models import Keyword, Listing, ListingPriceHistory
+from .pricing import is_price_change
+from .search import ensure_sqlite_triggers
+from .versions import VERSIONED_MODELS, bump_versions
+
+
+@receiver(post_save, sender=Listing)
+def record_price_change(sender, instance, created, raw=False, **kwargs):
+    # Runs before update_facets_on_save, which replaces the loaded values
+    old_cents = instance.loaded_value('price_cents')
+    if not created and not raw and is_price_change(old_cents, instance.price_cents):
+        ListingPriceHistory.objects.create(
+            listing=instance,
+            old_price_cents=old_cents,
+            new_price_cents=instance.price_cents,
+            price_currency=instance.price_currency,
+        )
+
+
+@receiver(post_save, sender=Listing)
+def fingerprint_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        store_fingerprints([instance])
+    elif instance.loaded_value('simhash') != instance.simhash:
+        store_fingerprints([instance], replace=True)
+
+
+@receiver(post_save, sender=Listing)
+def update_facets_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        old_pairs = []
+    elif hasattr(instance, '_loaded_values'):
+        old_pairs = facet_values(instance._loaded_values)
+    else:
+        # Saved without having been loaded (e.g. Listing(pk=...).save()); the
+        # previous values are unknown, leave the counts to rebuild_listing_facets
+        return
+    apply_facet_deltas(facet_deltas(old_pairs, listing_facet_values(instance)))
+    instance.remember_loaded_values()
+
+
+@receiver(post_save, sender=Listing)
+def match_keywords_on_create(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        store_matches([instance])
+
+
+@receiver(post_save, sender=Listing)
+def publish_new_listing(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish_new_listings([instance.pk])
+
+
+@receiver(post_delete, sender=Listing)
+def update_facets_on_delete(sender, instance, **kwargs):
+    old_values = getattr(instance, '_loaded_values', instance.__dict__)
+    apply_facet_deltas(facet_deltas(facet_values(old_values), []))
+
+
+@receiver(post_save, sender=Keyword)
+@receiver(post_delete, sender=Keyword)
+def invalidate_keyword_matcher(sender, instance, **kwargs):
+    invalidate_matcher(instance.filterID)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_model_version(sender, **kwargs):
+    if sender in VERSIONED_MODELS:
+        bump_versions(sender)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == 'main':
+        ensure_sqlite_triggers(connections[using])
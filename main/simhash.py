@@ -0,0 +1,74 @@
+"""
+64-bit SimHash fingerprints of listings (see main/dedup.py).
+
+Similar listings get hashes that differ in few bits: every feature votes on
+every bit, so changing a word or two only flips the bits where the vote
+was close.
+"""
+import hashlib
+import math
+import re
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+HASH_MASK = (1 << BITS) - 1
+MAX_DISTANCE = 3
+
+# Feature weights: the title and price say more about the item than the
+# free-form description
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+PRICE_WEIGHT = 3
+
+# Prices within ~10% of each other share a bucket
+PRICE_BUCKET_BASE = math.log(1.1)
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokens(text):
+    return WORD_RE.findall(text.lower()) if text else []
+
+
+def feature_hash(feature):
+    digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+    return format(int.from_bytes(digest, 'big'), '064b')
+
+
+def simhash(title, description, price_cents):
+    """
+    Signed 64-bit SimHash of a listing, or None if it has no text.
+
+    Stored signed so it fits a BIGINT column.
+    """
+    features = {}
+    for token in tokens(description):
+        features[token] = DESCRIPTION_WEIGHT
+    for token in tokens(title):
+        features[f't:{token}'] = TITLE_WEIGHT
+    if not features:
+        return None
+    if price_cents is not None:
+        bucket = 'free' if price_cents <= 0 else round(math.log(price_cents) / PRICE_BUCKET_BASE)
+        features[f'p:{bucket}'] = PRICE_WEIGHT
+
+    # One bit string per unit of weight; counting '1's down each column
+    # gives every bit's weighted vote without per-bit Python arithmetic
+    rows = []
+    for feature, weight in features.items():
+        rows.extend([feature_hash(feature)] * weight)
+    half = len(rows) / 2
+    value = int(''.join('1' if column.count('1') > half else '0' for column in zip(*rows)), 2)
+    return value - (1 << BITS) if value >> (BITS - 1) else value
+
+
+def hamming_distance(a, b):
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+def fingerprint_bands(value):
+    """The (band, value) pairs of a SimHash."""
+    value &= HASH_MASK
+    return [(band, (value >> (band * BAND_BITS)) & BAND_MASK) for band in range(BANDS)]
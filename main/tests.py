@@ -1,3 +1,1382 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import random
+import threading
+from base64 import b64encode
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from inspect import iscoroutinefunction
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .benchmarks import benchmark_client, build_scenarios, regressions, run_scenario
+from .facets import rebuild_facets
+from .ingest import existing_listings, ingest_listings
+from .live import ListingEvent, hub
+from .matching import KeywordMatcher, get_matcher, invalidate_matcher
+from .metrics import HISTOGRAMS
+from .models import ActiveScanner, Keyword, Listing, ListingFacet, ListingFingerprintBand, ListingPriceHistory, Location, ModelVersion, ScannerLocationMapping, ScanWorkUnit
+from .pagination import StandardResultsSetPagination
+from .pricing import parse_price
+from .renderers import FastJSONRenderer, orjson
+from .scanner import Fetcher, RetryableResponse, ScanEngine, active_targets
+from .serializers import ListingSerializer
+from .simhash import fingerprint_bands, simhash
+from .versions import increment
+from .views import ActiveScannerViewSet, ListingViewSet
+from .workqueue import claim_work_units, renew_leases, run_worker, sync_work_units
+
+
+class PriceParsingTests(SimpleTestCase):
+    def test_parse_price(self):
+        cases = {
+            '$1,250': (125000, 'USD', False),
+            'CA$40': (4000, 'CAD', False),
+            '€ 99.50 obo': (9950, 'EUR', False),
+            '1.5k': (150000, None, False),
+            '$2K firm': (200000, 'USD', False),
+            'Free': (0, None, True),
+            'FREE pickup': (0, None, True),
+            '$0': (0, 'USD', True),
+            # "free" inside a word, or next to an actual amount
+            'Freezer $50': (5000, 'USD', False),
+            '$50 free delivery': (5000, 'USD', False),
+            'Carefree': (None, None, False),
+            'Make an offer': (None, None, False),
+            '': (None, None, False),
+            None: (None, None, False),
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                self.assertEqual(parse_price(raw), expected)
+
+
+class PriceReparseMigrationTests(TestCase):
+    def test_reparse_updates_prices_and_fingerprints(self):
+        migration = import_module('main.migrations.0020_reparse_free_and_k_prices')
+        listing = Listing.objects.create(title='Chest freezer', price='Freezer $50', url='https://example.com/1')
+        # As the old parser stored it
+        stale = simhash(listing.title, listing.description, 0)
+        Listing.objects.filter(pk=listing.pk).update(price_cents=0, price_currency=None, price_is_free=True, simhash=stale)
+        ListingFingerprintBand.objects.filter(listing=listing).delete()
+        ListingFingerprintBand.objects.bulk_create([
+            ListingFingerprintBand(listing=listing, band=band, value=value) for band, value in fingerprint_bands(stale)
+        ])
+
+        migration.reparse_prices(django_apps, None)
+        listing.refresh_from_db()
+        self.assertEqual((listing.price_cents, listing.price_currency, listing.price_is_free), (5000, 'USD', False))
+        self.assertEqual(listing.simhash, simhash(listing.title, listing.description, 5000))
+        self.assertEqual(
+            sorted(ListingFingerprintBand.objects.filter(listing=listing).values_list('band', 'value')),
+            fingerprint_bands(listing.simhash),
+        )
+
+class ListingQueryPlanTests(TestCase):
+    """
+    Every supported ListingViewSet filter combination must be served by the
+    index meant for it, on a table big enough and analyzed so that the
+    planner prefers it to a full scan. Where two indexes are both good plans
+    (a prefix of a wider index, or an early LIMIT hit on the created_at
+    order), either is accepted. On PostgreSQL the plans are checked again
+    with sequential scans disabled, which only a missing index can force.
+    """
+    ROWS = 3000
+
+    FILTER_COMBINATIONS = [
+        ({}, ['listings_created_idx']),
+        ({'query': 'q3'}, ['listings_query_created_idx', 'listings_query_loc_created_idx']),
+        ({'query': 'q3', 'search_location': 'loc4'}, ['listings_query_loc_created_idx']),
+        ({'category': 'cat2'}, ['listings_title_created_idx']),
+        ({'search_location': 'loc4'}, ['listings_loc_created_idx']),
+        ({'search_location': 'loc4', 'max_distance': '5'}, ['listings_loc_distance_idx', 'listings_loc_created_idx']),
+        ({'watchlist': 'true'}, ['listings_watchlist_created_idx']),
+        ({'min_price': '990'}, ['listings_price_cents_idx', 'listings_created_idx']),
+        ({'min_price': '100', 'max_price': '101'}, ['listings_price_cents_idx']),
+        ({'query': 'q3', 'search_location': 'loc4', 'watchlist': 'true'}, [
+            'listings_query_loc_created_idx', 'listings_watchlist_created_idx',
+        ]),
+        ({'price_dropped': 'true'}, ['listings_price_dropped_idx']),
+        ({'collapse_duplicates': 'true'}, ['listings_created_idx']),
+        ({'query': 'q3', 'collapse_duplicates': 'true'}, [
+            'listings_query_created_idx', 'listings_query_loc_created_idx',
+        ]),
+        ({'near': '39.74,-104.99', 'radius_km': '30'}, ['listings_geohash_created_idx']),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        listings = []
+        for i in range(cls.ROWS):
+            price = rng.randint(1, 1000)
+            listing = Listing(
+                price=f'${price}', title=f'Listing {i}', url=f'https://example.com/item/{i}/',
+                query=f'q{i % 100}', search_title=f'cat{i % 60}', search_location=f'loc{i % 40}',
+                distance=rng.randint(0, 100), watchlist=i % 50 == 0,
+                latitude=rng.uniform(25, 49), longitude=rng.uniform(-124, -67),
+            )
+            listing.refresh_derived_fields()
+            if i % 50 == 1:
+                listing.previous_price_cents = listing.price_cents + 1000
+            listings.append(listing)
+        Listing.objects.bulk_create(listings)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_plan(self, params):
+        view = ListingViewSet()
+        view.request = Request(APIRequestFactory().get('/api/listings/', params))
+        view.format_kwarg = None
+        # A page of results, as the view reads it
+        return view.get_queryset()[:StandardResultsSetPagination.page_size].explain()
+
+    def test_filter_combinations_use_their_index(self):
+        for params, indexes in self.FILTER_COMBINATIONS:
+            with self.subTest(params=params):
+                plan = self.get_plan(params)
+                self.assertTrue(any(index in plan for index in indexes), plan)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Checks PostgreSQL plans')
+    def test_no_filter_combination_scans_the_table_on_postgresql(self):
+        # A sequential scan is still chosen, at any cost, when no index fits
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for params, indexes in self.FILTER_COMBINATIONS:
+            with self.subTest(params=params):
+                plan = self.get_plan(params)
+                self.assertNotIn(f'Seq Scan on {Listing._meta.db_table}', plan)
+                # Rules out a full scan of the created_at index standing in
+                self.assertTrue(any(index in plan for index in indexes), plan)
+
+
+class ScannerQueryCountTests(TestCase):
+    """Listing scanners must cost the same number of queries however many there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.locations = [
+            Location.objects.create(name=f'City {i}', marketplace_url_slug=f'city{i}')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def create_scanners(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                scanner = ActiveScanner.objects.create(category='Electronics', query=f'item {i}')
+                for location in self.locations:
+                    ScannerLocationMapping.objects.create(scanner=scanner, location=location)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_scanner_list_query_count_is_constant(self):
+        self.create_scanners(1)
+        baseline = self.count_queries('/api/scanners/')
+        self.create_scanners(20)
+        self.assertEqual(self.count_queries('/api/scanners/'), baseline)
+
+    def test_mappings_by_scanner_query_count_is_constant(self):
+        self.create_scanners(1)
+        scanner = ActiveScanner.objects.get()
+        baseline = self.count_queries(f'/api/scanner-locations/by_scanner/?scanner_id={scanner.id}')
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(20):
+                location = Location.objects.create(name=f'Town {i}', marketplace_url_slug=f'town{i}')
+                ScannerLocationMapping.objects.create(scanner=scanner, location=location)
+        self.assertEqual(
+            self.count_queries(f'/api/scanner-locations/by_scanner/?scanner_id={scanner.id}'),
+            baseline,
+        )
+
+
+class ScannerLocationSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.denver, cls.boulder, cls.aurora = [
+            Location.objects.create(name=name, marketplace_url_slug=name.lower())
+            for name in ['Denver', 'Boulder', 'Aurora']
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def mappings(self, scanner_id):
+        return dict(
+            ScannerLocationMapping.objects.filter(scanner_id=scanner_id).values_list('location_id', 'is_active')
+        )
+
+    def test_create_maps_the_given_locations(self):
+        response = self.client.post(
+            '/api/scanners/',
+            {'category': 'Video Games', 'query': 'ps5', 'location_ids': [self.denver.id, str(self.boulder.id), self.denver.id]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(location['location_name'] for location in response.json()['locations_data']), ['Boulder', 'Denver']
+        )
+        self.assertEqual(self.mappings(response.json()['id']), {self.denver.id: True, self.boulder.id: True})
+
+    def test_unknown_or_malformed_location_ids_are_rejected(self):
+        for location_ids, error in [
+            ([self.denver.id, 9999], 'Unknown location ids: [9999]'),
+            (['denver'], 'Location ids must be integers.'),
+            (self.denver.id, 'Expected a list of location ids.'),
+        ]:
+            response = self.client.post(
+                '/api/scanners/', {'category': 'Video Games', 'query': 'ps5', 'location_ids': location_ids},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'location_ids': [error]})
+        self.assertFalse(ActiveScanner.objects.exists())
+
+        scanner = ActiveScanner.objects.create(category='Video Games', query='ps5')
+        ScannerLocationMapping.objects.create(scanner=scanner, location=self.denver)
+        response = self.client.patch(
+            f'/api/scanners/{scanner.id}/', {'query': 'xbox', 'location_ids': [9999]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        scanner.refresh_from_db()
+        self.assertEqual(scanner.query, 'ps5')
+        self.assertEqual(self.mappings(scanner.id), {self.denver.id: True})
+
+    def test_update_activates_deactivates_and_creates_mappings(self):
+        scanner = ActiveScanner.objects.create(category='Video Games', query='ps5')
+        denver = ScannerLocationMapping.objects.create(scanner=scanner, location=self.denver)
+        boulder = ScannerLocationMapping.objects.create(scanner=scanner, location=self.boulder)
+
+        def update(data):
+            response = self.client.patch(f'/api/scanners/{scanner.id}/', data, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            return sorted(location['location_name'] for location in response.json()['locations_data'])
+
+        self.assertEqual(update({'location_ids': [self.boulder.id, self.aurora.id]}), ['Aurora', 'Boulder'])
+        self.assertEqual(
+            self.mappings(scanner.id), {self.denver.id: False, self.boulder.id: True, self.aurora.id: True}
+        )
+
+        # Deactivated mappings are re-activated, not duplicated
+        self.assertEqual(update({'location_ids': [self.denver.id]}), ['Denver'])
+        self.assertEqual(
+            self.mappings(scanner.id), {self.denver.id: True, self.boulder.id: False, self.aurora.id: False}
+        )
+        self.assertEqual(ScannerLocationMapping.objects.get(scanner=scanner, location=self.denver).id, denver.id)
+        self.assertEqual(ScannerLocationMapping.objects.get(scanner=scanner, location=self.boulder).id, boulder.id)
+
+        # Without location_ids the mappings are left alone
+        self.assertEqual(update({'query': 'xbox'}), ['Denver'])
+        self.assertEqual(update({'location_ids': []}), [])
+        self.assertFalse(ScannerLocationMapping.objects.filter(scanner=scanner, is_active=True).exists())
+
+class ListingIngestTests(TestCase):
+    ROWS = [
+        {'url': 'https://www.facebook.com/marketplace/item/1/', 'title': 'PS5', 'price': '$400', 'query': 'ps5'},
+        {'url': 'https://www.facebook.com/marketplace/item/2/', 'title': 'Desk', 'price': '$80', 'query': 'desk'},
+    ]
+
+    def price_dropped_ids(self):
+        request = Request(APIRequestFactory().get('/api/listings/', {'price_dropped': 'true'}))
+        return list(ListingViewSet(request=request).get_queryset().values_list('title', flat=True))
+
+    def test_unchanged_listings_are_not_rewritten(self):
+        ingest_listings(self.ROWS)
+        with CaptureQueriesContext(connection) as queries:
+            result = ingest_listings(self.ROWS)
+        self.assertEqual(result, {'inserted': 0, 'updated': 0, 'unchanged': 2, 'skipped': 0})
+        self.assertFalse([query for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+
+    def test_price_changes_are_recorded(self):
+        ingest_listings(self.ROWS)
+        result = ingest_listings([dict(self.ROWS[0], price='$350'), dict(self.ROWS[1], price='$90')])
+        self.assertEqual(result['updated'], 2)
+
+        history = ListingPriceHistory.objects.order_by('-old_price_cents')
+        self.assertEqual(
+            [(change.old_price_cents, change.new_price_cents) for change in history],
+            [(40000, 35000), (8000, 9000)],
+        )
+        self.assertEqual(self.price_dropped_ids(), ['PS5'])
+
+        # Saving through the model records the change too
+        listing = Listing.objects.get(title='Desk')
+        listing.price = '$60'
+        listing.save()
+        self.assertEqual(listing.price_history.latest('changed_at').old_price_cents, 9000)
+        self.assertEqual(sorted(self.price_dropped_ids()), ['Desk', 'PS5'])
+
+
+class ListingBulkTests(TestCase):
+    ROWS = ListingIngestTests.ROWS
+
+    def post(self, data):
+        return self.client.post('/api/listings/bulk/', data, content_type='application/json')
+
+    def test_bulk_upsert_counts_and_row_errors(self):
+        rows = [self.ROWS[0], dict(self.ROWS[1], url='https://www.facebook.com/marketplace/item/9/', distance='far'),
+                self.ROWS[1]]
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([error['index'] for error in body.pop('errors')], [1])
+        self.assertEqual(body, {'inserted': 2, 'updated': 0, 'unchanged': 0, 'skipped': 1})
+
+        # Posting the same listings again writes nothing
+        body = self.post(rows).json()
+        self.assertEqual(body['errors'][0]['errors'], {'distance': ['A valid integer is required.']})
+        del body['errors']
+        self.assertEqual(body, {'inserted': 0, 'updated': 0, 'unchanged': 2, 'skipped': 1})
+        self.assertEqual(Listing.objects.count(), 2)
+
+        # A changed listing is updated in place, matched on its normalized URL
+        changed = dict(self.ROWS[0], url='https://facebook.com/marketplace/item/1?ref=feed', price='$380')
+        body = self.post({'listings': [changed, self.ROWS[1]]}).json()
+        self.assertEqual(body, {'inserted': 0, 'updated': 1, 'unchanged': 1, 'skipped': 0, 'errors': []})
+        self.assertEqual(Listing.objects.get(title='PS5').price_cents, 38000)
+
+    def test_bulk_rejects_non_lists(self):
+        response = self.post({'listings': 'PS5'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Expected a list of listings'})
+
+
+class ListingExportTests(TestCase):
+    def setUp(self):
+        ingest_listings(ListingIngestTests.ROWS)
+
+    def export(self, **params):
+        response = self.client.get('/api/listings/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export_applies_the_list_filters(self):
+        response, content = self.export(query='ps5')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        [row] = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual((row['title'], row['price'], row['price_cents']), ('PS5', '$400', 40000))
+        self.assertFalse(set(row) & set(Listing.INTERNAL_FIELDS))
+
+    def test_csv_export(self):
+        response, content = self.export(export_format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="listings.csv"')
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(sorted(row['title'] for row in rows), ['Desk', 'PS5'])
+        self.assertNotIn('url_key', rows[0])
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get('/api/listings/export/', {'export_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ListingFacetTests(TestCase):
+    ROWS = [
+        {'url': 'https://www.facebook.com/marketplace/item/1/', 'title': 'PS5', 'price': '$400',
+         'query': 'ps5', 'search_title': 'Video Games', 'search_location': 'Denver'},
+        {'url': 'https://www.facebook.com/marketplace/item/2/', 'title': 'PS5 digital', 'price': '$350',
+         'query': 'ps5', 'search_title': 'Video Games', 'search_location': 'Boulder'},
+    ]
+
+    def setUp(self):
+        cache.clear()
+
+    def facet_counts(self):
+        return dict(
+            ((facet, value), listing_count) for facet, value, listing_count
+            in ListingFacet.objects.filter(listing_count__gt=0).values_list('facet', 'value', 'listing_count')
+        )
+
+    def test_counts_follow_creates_updates_and_deletes(self):
+        ingest_listings(self.ROWS)
+        self.assertEqual(self.facet_counts(), {
+            ('query', 'ps5'): 2, ('category', 'Video Games'): 2,
+            ('search_location', 'Denver'): 1, ('search_location', 'Boulder'): 1,
+        })
+
+        # A changed listing moves between values
+        ingest_listings([dict(self.ROWS[1], price='$300', search_title='Consoles', search_location='Denver')])
+        self.assertEqual(self.facet_counts(), {
+            ('query', 'ps5'): 2, ('category', 'Video Games'): 1, ('category', 'Consoles'): 1,
+            ('search_location', 'Denver'): 2,
+        })
+
+        listing = Listing.objects.get(title='PS5')
+        listing.search_title = 'Consoles'
+        listing.save()
+        Listing.objects.get(title='PS5 digital').delete()
+        expected = {('query', 'ps5'): 1, ('category', 'Consoles'): 1, ('search_location', 'Denver'): 1}
+        self.assertEqual(self.facet_counts(), expected)
+
+        # The incremental counts agree with a full rebuild
+        rebuild_facets()
+        self.assertEqual(self.facet_counts(), expected)
+
+    def test_listing_inserted_by_a_concurrent_ingest_counts_once(self):
+        ingest_listings(self.ROWS)
+
+        # This ingest looked the URLs up before the first one committed
+        stale = [{}]
+        with mock.patch('main.ingest.existing_listings', lambda keys: stale.pop() if stale else existing_listings(keys)):
+            result = ingest_listings([dict(self.ROWS[1], price='$300', search_location='Denver')])
+        self.assertEqual(result, {'inserted': 0, 'updated': 1, 'unchanged': 0, 'skipped': 0})
+        self.assertEqual(self.facet_counts(), {
+            ('query', 'ps5'): 2, ('category', 'Video Games'): 2, ('search_location', 'Denver'): 2,
+        })
+
+    def test_filter_options_reads_the_facet_table(self):
+        ingest_listings(self.ROWS)
+        # Never derived from the listings themselves
+        ListingFacet.objects.create(facet='query', value='xbox', listing_count=3)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/listings/filter_options/')
+        self.assertEqual(response.json(), {
+            'queries': ['ps5', 'xbox'],
+            'categories': ['Video Games'],
+            'search_locations': ['Boulder', 'Denver'],
+            'counts': {
+                'queries': {'ps5': 2, 'xbox': 3},
+                'categories': {'Video Games': 2},
+                'search_locations': {'Boulder': 1, 'Denver': 1},
+            },
+        })
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite serializes writing transactions')
+class ConcurrentIngestTests(TransactionTestCase):
+    def test_concurrent_ingests_insert_a_listing_once(self):
+        results = {}
+        first_inserted = threading.Event()
+        commit_first = threading.Event()
+
+        published = {}
+
+        def publish(listing_ids):
+            published[threading.current_thread().name] = list(listing_ids)
+
+        def ingest(name, hold=False):
+            try:
+                with transaction.atomic():
+                    results[name] = ingest_listings(ListingFacetTests.ROWS)
+                    if hold:
+                        first_inserted.set()
+                        commit_first.wait(5)
+            finally:
+                connection.close()
+
+        with mock.patch('main.ingest.publish_new_listings', publish):
+            first = threading.Thread(target=ingest, args=('first', True), name='first')
+            first.start()
+            self.assertTrue(first_inserted.wait(5))
+            second = threading.Thread(target=ingest, args=('second',), name='second')
+            second.start()
+            # Waits for the first ingest's locks instead of reading stale rows
+            second.join(0.3)
+            self.assertTrue(second.is_alive())
+            commit_first.set()
+            first.join(5)
+            second.join(5)
+
+        self.assertEqual(results['first']['inserted'], 2)
+        self.assertEqual(results['second'], {'inserted': 0, 'updated': 0, 'unchanged': 2, 'skipped': 0})
+        self.assertEqual(len(published['first']), 2)
+        self.assertNotIn('second', published)
+        self.assertEqual(ListingFacet.objects.get(facet='query', value='ps5').listing_count, 2)
+
+class ListingDuplicateTests(TestCase):
+    DESCRIPTION = 'Barely used disc edition with two controllers and three games. Pickup only, cash, price is firm.'
+
+    def list_locations(self, **params):
+        request = Request(APIRequestFactory().get('/api/listings/', params))
+        return sorted(ListingViewSet(request=request).get_queryset().values_list('search_location', flat=True))
+
+    def test_reposts_collapse_to_the_oldest_listing(self):
+        ingest_listings([
+            {'url': 'https://facebook.com/marketplace/item/1/', 'title': 'Sony PS5 bundle', 'price': '$400',
+             'description': self.DESCRIPTION, 'search_location': 'Denver'},
+            {'url': 'https://facebook.com/marketplace/item/3/', 'title': 'IKEA standing desk', 'price': '$80',
+             'description': 'White adjustable desk', 'search_location': 'Denver'},
+        ])
+        ingest_listings([
+            {'url': 'https://facebook.com/marketplace/item/2/', 'title': 'Sony PS5 bundle!!', 'price': '$410',
+             'description': self.DESCRIPTION, 'search_location': 'Boulder'},
+        ])
+        original = Listing.objects.get(url_key='facebook.com/marketplace/item/1')
+        repost = Listing.objects.get(url_key='facebook.com/marketplace/item/2')
+        self.assertEqual(repost.duplicate_of_id, original.pk)
+        self.assertIsNone(Listing.objects.get(url_key='facebook.com/marketplace/item/3').duplicate_of_id)
+        self.assertEqual(ListingSerializer(repost).data['canonical_listing_id'], original.pk)
+
+        self.assertEqual(self.list_locations(collapse_duplicates='true'), ['Denver', 'Denver'])
+        # A repost stays visible when its canonical listing is filtered out
+        self.assertEqual(self.list_locations(collapse_duplicates='true', search_location='Boulder'), ['Boulder'])
+
+    def test_collapse_respects_search(self):
+        ingest_listings([
+            {'url': 'https://facebook.com/marketplace/item/1/', 'title': 'Sony PS5 bundle', 'price': '$400',
+             'description': self.DESCRIPTION, 'search_location': 'Denver'},
+        ])
+        ingest_listings([
+            {'url': 'https://facebook.com/marketplace/item/2/', 'title': 'Sony PS5 bundle', 'price': '$400',
+             'description': self.DESCRIPTION + ' Venmo accepted.', 'search_location': 'Boulder'},
+        ])
+        self.assertIsNotNone(Listing.objects.get(url_key='facebook.com/marketplace/item/2').duplicate_of_id)
+
+        self.assertEqual(self.list_locations(q='venmo'), ['Boulder'])
+        # Only the repost matches, so it stands in for its cluster
+        self.assertEqual(self.list_locations(q='venmo', collapse_duplicates='true'), ['Boulder'])
+        self.assertEqual(self.list_locations(q='controllers', collapse_duplicates='true'), ['Denver'])
+
+
+class ListingSearchTests(TestCase):
+    def search(self, text):
+        request = Request(APIRequestFactory().get('/api/listings/', {'q': text}))
+        return list(ListingViewSet(request=request).get_queryset().values_list('title', flat=True))
+
+    def test_search_matches_and_ranks_title_hits_first(self):
+        ingest_listings([
+            {'url': 'https://facebook.com/marketplace/item/1/', 'title': 'Walnut bookshelf', 'description': 'Desk'},
+            {'url': 'https://facebook.com/marketplace/item/2/', 'title': 'Oak desk solid',
+             'description': 'Moving sale, everything must go this weekend. Pickup only.'},
+            {'url': 'https://facebook.com/marketplace/item/3/', 'title': 'PS5', 'description': 'Disc edition'},
+        ])
+        self.assertEqual(self.search('desk'), ['Oak desk solid', 'Walnut bookshelf'])
+        self.assertEqual(self.search('disc edition'), ['PS5'])
+        self.assertEqual(self.search('sofa'), [])
+
+
+class KeywordMatchingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_matcher(1)
+
+    def matched_titles(self, keyword):
+        return sorted(
+            Listing.objects.filter(keyword_matches__keyword__keyword=keyword).values_list('title', flat=True)
+        )
+
+    def test_keywords_match_whole_words(self):
+        matcher = KeywordMatcher([(1, 'oak'), (2, 'PS5'), (3, '4k tv'), (4, 'c++')])
+        self.assertEqual(matcher.match('Solid OAK desk'), {1})
+        self.assertEqual(matcher.match('oak'), {1})
+        self.assertEqual(matcher.match('Soak tub, cloak, oaken chest'), set())
+        self.assertEqual(matcher.match('ps5 + 4K TV bundle'), {2, 3})
+        self.assertEqual(matcher.match('ps55 or 44k tv'), set())
+        self.assertEqual(matcher.match('Learn C++ book'), {4})
+        self.assertEqual(matcher.match(''), set())
+
+    def test_ingest_stores_matches(self):
+        Keyword.objects.bulk_create([Keyword(keyword='oak', filterID=1), Keyword(keyword='ps5', filterID=1)])
+        ingest_listings([
+            {'url': 'https://facebook.com/marketplace/item/1/', 'title': 'Oak desk', 'scanner_id': 1},
+            {'url': 'https://facebook.com/marketplace/item/2/', 'title': 'Cloak rack', 'scanner_id': 1},
+            {'url': 'https://facebook.com/marketplace/item/3/', 'title': 'Bookshelf',
+             'description': 'Comes with a PS5', 'scanner_id': 1},
+            {'url': 'https://facebook.com/marketplace/item/4/', 'title': 'Oak chair', 'scanner_id': 2},
+        ])
+        self.assertEqual(self.matched_titles('oak'), ['Oak desk'])
+        self.assertEqual(self.matched_titles('ps5'), ['Bookshelf'])
+
+    def test_bulk_update_keeps_unchanged_keywords_and_their_matches(self):
+        oak = Keyword.objects.create(keyword='oak', filterID=1)
+        Keyword.objects.create(keyword='ps5', filterID=1)
+        ingest_listings([{'url': 'https://facebook.com/marketplace/item/1/', 'title': 'Oak desk', 'scanner_id': 1}])
+        match_ids = list(Listing.objects.get().keyword_matches.values_list('id', flat=True))
+
+        response = self.client.post(
+            '/api/keywords/bulk-update/', {'scannerId': 1, 'keywords': ['desk', ' oak ', 'oak', '']},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([keyword['keyword'] for keyword in response.json()], ['oak', 'desk'])
+        self.assertEqual(response.json()[0]['id'], oak.id)
+        self.assertEqual(list(Listing.objects.get().keyword_matches.values_list('id', flat=True)), match_ids)
+        self.assertEqual(self.matched_titles('oak'), ['Oak desk'])
+
+    def test_bulk_update_rejects_a_non_integer_scanner_id(self):
+        for scanner_id in ['abc', [1], {'id': 1}]:
+            response = self.client.post(
+                '/api/keywords/bulk-update/', {'scannerId': scanner_id, 'keywords': ['x']},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Keyword.objects.exists())
+
+    def test_matchers_follow_keyword_edits_made_in_other_processes(self):
+        oak = Keyword.objects.create(keyword='oak', filterID=1)
+        self.assertEqual(get_matcher(1).match('oak desk'), {oak.id})
+
+        # Another process: no signals here, only the shared version moves
+        desk = Keyword.objects.bulk_create([Keyword(keyword='desk', filterID=1)])[0]
+        self.assertEqual(get_matcher(1).match('oak desk'), {oak.id})
+        increment([Keyword._meta.label_lower])
+        self.assertEqual(get_matcher(1).match('oak desk'), {oak.id, desk.id})
+
+    def test_bulk_update_with_a_string_scanner_id_drops_the_cached_matcher(self):
+        Keyword.objects.create(keyword='oak', filterID=1)
+        get_matcher(1)
+        response = self.client.post(
+            '/api/keywords/bulk-update/', {'scannerId': '1', 'keywords': ['desk']}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_matcher(1).match('oak desk'), {Keyword.objects.get(keyword='desk').id})
+
+    def test_matcher_built_before_an_invalidation_is_not_cached(self):
+        Keyword.objects.create(keyword='oak', filterID=1)
+        build = KeywordMatcher
+
+        def build_then_edit(keywords):
+            matcher = build(keywords)
+            # Another request changes the keywords while this matcher is built
+            Keyword.objects.create(keyword='desk', filterID=1)
+            return matcher
+
+        with mock.patch('main.matching.KeywordMatcher', build_then_edit):
+            stale = get_matcher(1)
+        self.assertEqual(stale.match('oak desk'), {Keyword.objects.get(keyword='oak').id})
+        self.assertEqual(
+            get_matcher(1).match('oak desk'),
+            set(Keyword.objects.filter(filterID=1).values_list('id', flat=True)),
+        )
+
+class ListingGeoTests(TestCase):
+    def titles_near(self, near, radius_km):
+        request = Request(APIRequestFactory().get('/api/listings/', {'near': near, 'radius_km': radius_km}))
+        return sorted(ListingViewSet(request=request).get_queryset().values_list('title', flat=True))
+
+    def test_radius_filter_over_scraped_and_geocoded_coordinates(self):
+        Location.objects.create(name='Denver', marketplace_url_slug='denver', latitude=39.7392, longitude=-104.9903)
+        Location.objects.create(name='Boulder', marketplace_url_slug='boulder', latitude=40.015, longitude=-105.2705)
+        ingest_listings([
+            {'url': 'https://facebook.com/marketplace/item/1/', 'title': 'Golden', 'location': 'Golden, CO',
+             'latitude': 39.7555, 'longitude': -105.2211},
+            {'url': 'https://facebook.com/marketplace/item/2/', 'title': 'Denver', 'location': 'Denver, CO'},
+            {'url': 'https://facebook.com/marketplace/item/3/', 'title': 'Boulder', 'location': 'boulder, co'},
+            {'url': 'https://facebook.com/marketplace/item/4/', 'title': 'Unknown', 'location': 'Nowhere, XX'},
+            {'url': 'https://facebook.com/marketplace/item/5/', 'title': 'Fiji', 'latitude': -16.5, 'longitude': 179.95},
+        ])
+        self.assertEqual(Listing.objects.get(title='Denver').geohash, '9xj64fk3s')
+        self.assertIsNone(Listing.objects.get(title='Unknown').geohash)
+
+        # Boulder is ~39 km from Denver, Golden ~20 km
+        self.assertEqual(self.titles_near('39.7392,-104.9903', '25'), ['Denver', 'Golden'])
+        self.assertEqual(self.titles_near('39.7392,-104.9903', '50'), ['Boulder', 'Denver', 'Golden'])
+        # Across the antimeridian
+        self.assertEqual(self.titles_near('-16.5,-179.95', '20'), ['Fiji'])
+        # Invalid points are ignored like the other filters
+        self.assertEqual(len(self.titles_near('north', '10')), 5)
+
+
+class ListingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for index in range(3):
+            Listing.objects.create(
+                title=f'PS5 {index}', price='$400', description='x' * 1000,
+                url=f'https://facebook.com/marketplace/item/{index}/', query='ps5',
+            )
+
+    def test_list_matches_serializer_without_heavy_fields(self):
+        response = self.client.get('/api/listings/')
+        expected = [
+            {name: value for name, value in ListingSerializer(listing).data.items() if name != 'description'}
+            for listing in Listing.objects.order_by('-created_at')
+        ]
+        self.assertEqual(response.json()['results'], expected)
+
+        detail = self.client.get(f"/api/listings/{expected[0]['listing_idx']}/").json()
+        self.assertEqual(detail['description'], 'x' * 1000)
+
+    def test_fields_projection_reads_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/listings/', {'fields': 'title,canonical_listing_id', 'pagination': 'cursor', 'limit': 2}
+            )
+        self.assertEqual(set(response.json()['results'][0]), {'title', 'canonical_listing_id'})
+        self.assertNotIn('description', queries[-1]['sql'])
+
+        older = self.client.get(response.json()['next'])
+        self.assertEqual([row['title'] for row in older.json()['results']], ['PS5 0'])
+
+        response = self.client.get('/api/listings/', {'fields': 'title,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ListingCursorPaginationTests(TestCase):
+    START = timezone.now() - timedelta(days=1)
+
+    def add_listings(self, *indexes, minutes=None):
+        for index in indexes:
+            listing = Listing.objects.create(title=f'L{index}', url=f'https://facebook.com/marketplace/item/{index}/')
+            created_at = self.START + timedelta(minutes=index if minutes is None else minutes)
+            Listing.objects.filter(pk=listing.pk).update(created_at=created_at)
+
+    def page(self, url=None):
+        if url is None:
+            response = self.client.get('/api/listings/', {'pagination': 'cursor', 'limit': 2})
+        else:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['title'] for row in data['results']], data['next'], data['previous']
+
+    def test_forward_paging_is_stable_while_listings_are_added(self):
+        self.add_listings(0, 1, 2, 3, 4)
+        titles, next_url, _ = self.page()
+        self.assertEqual(titles, ['L4', 'L3'])
+
+        # New listings land before the first page and don't shift the rest
+        self.add_listings(5, 6)
+        titles, next_url, _ = self.page(next_url)
+        self.assertEqual(titles, ['L2', 'L1'])
+        titles, next_url, _ = self.page(next_url)
+        self.assertEqual(titles, ['L0'])
+        self.assertIsNone(next_url)
+
+    def test_previous_pages_back_and_polls_for_newer_listings(self):
+        self.add_listings(0, 1, 2, 3, 4)
+        titles, next_url, first_previous = self.page()
+        self.assertEqual(titles, ['L4', 'L3'])
+        titles, _, previous_url = self.page(next_url)
+        self.assertEqual(titles, ['L2', 'L1'])
+
+        titles, _, previous_url = self.page(previous_url)
+        self.assertEqual(titles, ['L4', 'L3'])
+        # Nothing newer than the first page yet
+        self.assertEqual(self.page(previous_url), ([], None, None))
+        self.assertEqual(self.page(first_previous), ([], None, None))
+
+        self.add_listings(5, 6, 7)
+        titles, next_url, previous_url = self.page(first_previous)
+        self.assertEqual(titles, ['L6', 'L5'])
+        self.assertEqual(self.page(previous_url)[0], ['L7'])
+        self.assertEqual(self.page(next_url)[0], ['L4', 'L3'])
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        self.add_listings(0, 1, 2, 3, 4, minutes=0)
+        expected = [f'L{index}' for index in sorted(
+            range(5), key=lambda index: Listing.objects.get(title=f'L{index}').pk, reverse=True
+        )]
+        titles, next_url, _ = self.page()
+        seen = titles
+        while next_url:
+            titles, next_url, _ = self.page(next_url)
+            seen += titles
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursors_are_not_found(self):
+        self.add_listings(0)
+        for cursor in [
+            'not base64!',
+            b64encode(b'garbage').decode(),
+            b64encode(b't=yesterday&i=1').decode(),
+            b64encode(b't=2026-01-01T00:00:00%2B00:00&i=abc').decode(),
+            b64encode(b'i=1').decode(),
+            b64encode('t=2026-01-01T00:00:00%2B00:00&i=1&r=é'.encode()).decode(),
+        ]:
+            response = self.client.get('/api/listings/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+class ConditionalGetTests(TestCase):
+    ROWS = ListingIngestTests.ROWS
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_reads_answer_not_modified(self):
+        response = self.client.get('/api/locations/')
+        etag = response['ETag']
+        # The model versions are cached too
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/locations/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/locations/', {'name': 'Denver', 'marketplace_url_slug': 'denver'})
+        response = self.client.get('/api/locations/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Denver')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified_waits_until_the_second_is_over(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Location.objects.create(name='Denver', marketplace_url_slug='denver')
+        # A second write could still land in the same second
+        response = self.client.get('/api/locations/', HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        ModelVersion.objects.update(changed_at=timezone.now() - timedelta(seconds=5))
+        cache.clear()
+        last_modified = self.client.get('/api/locations/')['Last-Modified']
+        self.assertEqual(
+            self.client.get('/api/locations/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Location.objects.create(name='Boulder', marketplace_url_slug='boulder')
+        self.assertEqual(
+            self.client.get('/api/locations/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200
+        )
+
+    def test_listing_validators_follow_bulk_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_listings(self.ROWS)
+        etag = self.client.get('/api/listings/')['ETag']
+        self.assertNotEqual(self.client.get('/api/listings/', {'query': 'ps5'})['ETag'], etag)
+
+        # Re-scanning unchanged listings writes nothing and keeps the version
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_listings(self.ROWS)
+        self.assertEqual(self.client.get('/api/listings/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_listings([dict(self.ROWS[0], price='$350')])
+        self.assertEqual(self.client.get('/api/listings/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CachedReadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            location = Location.objects.create(name='Denver', marketplace_url_slug='denver')
+            self.scanner = ActiveScanner.objects.create(category='Video Games', query='ps5', status='active')
+            ScannerLocationMapping.objects.create(scanner=self.scanner, location=location)
+            Keyword.objects.create(keyword='mint', filterID=self.scanner.id)
+
+    def keywords(self):
+        response = self.client.get('/api/keywords/by-scanner/', {'scannerId': self.scanner.id})
+        return [keyword['keyword'] for keyword in response.json()]
+
+    def test_reads_are_served_from_the_cache_until_an_edit(self):
+        first = self.client.get('/api/scanners/').json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/scanners/').json(), first)
+        self.assertEqual(first[0]['locations_data'][0]['location_name'], 'Denver')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/locations/{first[0]['locations_data'][0]['location']}/",
+                              {'name': 'Boulder'}, content_type='application/json')
+        self.assertEqual(self.client.get('/api/scanners/').json()[0]['locations_data'][0]['location_name'], 'Boulder')
+
+        self.assertEqual(self.keywords(), ['mint'])
+        with self.assertNumQueries(0):
+            self.keywords()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/keywords/bulk-update/', {'scannerId': self.scanner.id, 'keywords': ['mint', 'obo']},
+                             content_type='application/json')
+        self.assertEqual(self.keywords(), ['mint', 'obo'])
+
+
+class AsyncViewTests(TestCase):
+    """The ASGI views (ASYNC_VIEWS) must answer exactly like the sync ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        ingest_listings(ListingIngestTests.ROWS)
+        location = Location.objects.create(name='Denver', marketplace_url_slug='denver')
+        scanner = ActiveScanner.objects.create(category='Video Games', query='ps5', status='active')
+        ScannerLocationMapping.objects.create(scanner=scanner, location=location)
+
+    def setUp(self):
+        cache.clear()
+
+    def call(self, viewset, actions, request, **kwargs):
+        with override_settings(ASYNC_VIEWS=True):
+            view = viewset.as_view(actions)
+        self.assertTrue(iscoroutinefunction(view))
+        response = async_to_sync(view)(request, **kwargs)
+        # 304s are plain HttpResponses with nothing to render
+        return response.render() if hasattr(response, 'render') else response
+
+    def test_async_reads_match_sync_reads(self):
+        listing = Listing.objects.get(title='PS5')
+        cases = [
+            (ListingViewSet, 'list', '/api/listings/?query=ps5', {}),
+            (ListingViewSet, 'list', '/api/listings/?limit=1&page=2', {}),
+            (ListingViewSet, 'list', '/api/listings/?pagination=cursor&limit=1', {}),
+            (ListingViewSet, 'retrieve', f'/api/listings/{listing.pk}/', {'pk': str(listing.pk)}),
+            (ListingViewSet, 'filter_options', '/api/listings/filter_options/', {}),
+            (ActiveScannerViewSet, 'list', '/api/scanners/', {}),
+        ]
+        for viewset, action, path, kwargs in cases:
+            with self.subTest(path=path):
+                response = self.call(viewset, {'get': action}, AsyncRequestFactory().get(path), **kwargs)
+                cache.clear()
+                expected = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.content), expected.json())
+                self.assertEqual(response['ETag'], expected['ETag'])
+
+    def test_async_errors_and_sync_fallback(self):
+        factory = AsyncRequestFactory()
+        retrieve = {'get': 'retrieve'}
+        self.assertEqual(self.call(ListingViewSet, retrieve, factory.get('/api/listings/0/'), pk='0').status_code, 404)
+        self.assertEqual(self.call(ListingViewSet, retrieve, factory.get('/api/listings/x/'), pk='x').status_code, 404)
+        self.assertEqual(self.call(ListingViewSet, {'get': 'list'}, factory.get('/api/listings/?page=9')).status_code, 404)
+
+        etag = self.call(ListingViewSet, {'get': 'list'}, factory.get('/api/listings/'))['ETag']
+        response = self.call(ListingViewSet, {'get': 'list'}, factory.get('/api/listings/', headers={'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+
+        # Actions without an async variant run synchronously in a thread
+        request = factory.post('/api/scanners/', {'category': 'Furniture', 'query': 'desk'}, content_type='application/json')
+        self.assertEqual(self.call(ActiveScannerViewSet, {'post': 'create'}, request).status_code, 201)
+        self.assertTrue(ActiveScanner.objects.filter(query='desk').exists())
+
+
+@override_settings(LIVE_FEED_BACKEND='local')
+class LiveFeedTests(TestCase):
+    def subscribe(self, loop, filters):
+        async def subscribe():
+            return hub.subscribe(filters)
+        subscription = loop.run_until_complete(subscribe())
+        self.addCleanup(hub.unsubscribe, subscription)
+        return subscription
+
+    def test_new_listings_reach_matching_subscribers(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        Keyword.objects.create(keyword='oak', filterID=7)
+        ps5 = self.subscribe(loop, {'query': 'ps5'})
+        oak = self.subscribe(loop, {'scanner_id': 7, 'keyword': 'oak'})
+
+        rows = ListingIngestTests.ROWS + [
+            {'url': 'https://www.facebook.com/marketplace/item/3/', 'title': 'Oak desk', 'scanner_id': 7},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_listings(rows)
+        # Re-scanned listings aren't new
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_listings(rows)
+        loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(json.loads(ps5.queue.get_nowait().data)['title'], 'PS5')
+        self.assertTrue(ps5.queue.empty())
+        event = oak.queue.get_nowait()
+        self.assertEqual(json.loads(event.data)['keywords'], ['oak'])
+        self.assertTrue(oak.queue.empty())
+
+    def test_listing_inserted_by_a_concurrent_ingest_is_published_once(self):
+        with mock.patch('main.ingest.publish_new_listings') as publish:
+            ingest_listings(ListingIngestTests.ROWS)
+            # This ingest looked the URLs up before the first one committed
+            stale = [{}]
+            with mock.patch(
+                'main.ingest.existing_listings', lambda keys: stale.pop() if stale else existing_listings(keys)
+            ):
+                ingest_listings([dict(row, price='$1') for row in ListingIngestTests.ROWS])
+        self.assertEqual(
+            [sorted(call.args[0]) for call in publish.call_args_list],
+            [sorted(Listing.objects.values_list('pk', flat=True)), []],
+        )
+
+    async def test_stream_sends_events_and_resyncs_slow_clients(self):
+        response = await self.async_client.get('/api/listings/stream/', {'query': 'ps5'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertIn(b': connected', await anext(chunks))
+
+        event = ListingEvent(1, 7, 'ps5', 'Denver', [], b'{"listing_idx":1}')
+        [subscription] = hub.subscriptions
+        # A client with room for one event; the second ps5 event overflows it
+        subscription.queue = asyncio.Queue(1)
+        hub.deliver([event, ListingEvent(2, 7, 'desk', 'Denver', [], b'{}'), event])
+        await asyncio.sleep(0)
+        self.assertEqual(await anext(chunks), b'event: resync\ndata: {"dropped": 1}\n\n')
+        self.assertEqual(await anext(chunks), b'id: 1\nevent: listing\ndata: {"listing_idx":1}\n\n')
+
+        # A client disconnect cancels the waiting stream, which unsubscribes
+        waiting = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertFalse(hub.subscriptions)
+
+    def test_stream_needs_asgi(self):
+        self.assertEqual(self.client.get('/api/listings/stream/').status_code, 501)
+
+
+class ResponseEncodingTests(TestCase):
+    @skipUnless(orjson, 'orjson is not installed')
+    def test_fast_renderer_matches_drf_output(self):
+        listing = Listing.objects.create(title='Caf\u00e9 table \u2028', price='$40', url='https://example.com/1')
+        data = {'results': [ListingSerializer(listing).data], 'created': timezone.now(), 1: 'x'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @override_settings(COMPRESSION_MIN_SIZE=1024)
+    def test_large_responses_are_compressed(self):
+        for index in range(20):
+            Listing.objects.create(title=f'PS5 {index}', url=f'https://example.com/{index}')
+        response = self.client.get('/api/listings/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['count'], 20)
+
+        small = self.client.get('/api/listings/', {'limit': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+        identity = self.client.get('/api/listings/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(identity.has_header('Content-Encoding'))
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+
+    @override_settings(METRICS_QUERY_BUDGET=0)
+    def test_requests_are_recorded_per_route(self):
+        Listing.objects.create(title='PS5', url='https://example.com/1')
+        with self.assertLogs('main.metrics', 'WARNING') as logs:
+            self.client.get('/api/listings/')
+        self.assertIn('listing-list', logs.output[0])
+
+        with override_settings(METRICS_PUBLIC=True):
+            body = self.client.get('/metrics').content.decode()
+        labels = 'route="listing-list",method="GET",status="200"'
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 1', body)
+        # The model versions for the ETag, a count query and a page query
+        self.assertIn(f'http_request_db_queries_sum{{{labels}}} 3', body)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="2"}} 0', body)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="5"}} 1', body)
+
+
+    @override_settings(METRICS_AUTH_TOKEN='s3cret')
+    def test_metrics_need_the_token_or_a_staff_session(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+        user = User.objects.create_user('viewer')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_AUTH_TOKEN='')
+    def test_metrics_are_closed_without_a_token(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+class BenchmarkSuiteTests(TestCase):
+    def test_scenarios_run_against_synthetic_data(self):
+        call_command('generate_synthetic_data', listings=300, locations=3, scanners=2, stdout=StringIO())
+        self.assertEqual(Listing.objects.filter(url_key__startswith='synthetic.example/').count(), 300)
+        self.assertFalse(ActiveScanner.objects.exclude(status='stopped').exists())
+
+        client = benchmark_client()
+        keywords = set(Keyword.objects.values_list('filterID', 'keyword'))
+        for scenario in build_scenarios(client, page_depth=3):
+            result = run_scenario(client, scenario, iterations=2, warmup=0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'], scenario.name)
+        # The keyword scenario puts the scanner's keywords back afterwards
+        self.assertEqual(set(Keyword.objects.values_list('filterID', 'keyword')), keywords)
+
+        call_command('generate_synthetic_data', clear=True, listings=0, stdout=StringIO())
+        self.assertFalse(Listing.objects.exists())
+        self.assertFalse(ActiveScanner.objects.exists())
+
+    def test_keyword_scenario_leaves_real_scanners_alone(self):
+        location = Location.objects.create(name='Denver', marketplace_url_slug='denver')
+        scanner = ActiveScanner.objects.create(category='Video Games', query='ps5')
+        ScannerLocationMapping.objects.create(scanner=scanner, location=location)
+        Keyword.objects.create(keyword='mint', filterID=scanner.id)
+        names = [scenario.name for scenario in build_scenarios(benchmark_client(), page_depth=1)]
+        self.assertNotIn('keywords_bulk_update', names)
+
+    def test_regressions_flag_slower_or_chattier_scenarios(self):
+        baseline = {'listings': {'p95_ms': 10.0, 'queries': 2}, 'scanners': {'p95_ms': 10.0, 'queries': 2}}
+        results = {
+            'listings': {'p95_ms': 12.4, 'queries': 2},
+            'scanners': {'p95_ms': 13.0, 'queries': 3},
+            'new': {'p95_ms': 99.0, 'queries': 9},
+        }
+        self.assertEqual(regressions(results, baseline, threshold=0.25), [
+            'scanners: p95 13.0 ms, baseline 10.0 ms',
+            'scanners: 3 queries, baseline 2',
+        ])
+
+
+class StubMarketplaceHandler(BaseHTTPRequestHandler):
+    """
+    Minimal marketplace stand-in: two JSON result pages per location and a
+    JSON page per item. The first request for the "flaky" location fails
+    with a 503 to exercise retries; locations in `bodies` get that JSON
+    body instead of their results.
+    """
+    failures_left = {}
+    bodies = {}
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        params = parse_qs(url.query)
+
+        if parts[:2] == ['marketplace', 'item']:
+            return self.send_json({'description': f'Details for item {parts[2]}'})
+
+        slug = parts[1]
+        if self.failures_left.get(slug):
+            self.failures_left[slug] -= 1
+            return self.send_json({'error': 'try again'}, status=503)
+        if slug in self.bodies:
+            return self.send_json(self.bodies[slug])
+
+        page = int(params.get('page', ['1'])[0])
+        base = f'http://{self.headers["Host"]}/marketplace/item'
+        if page == 1:
+            return self.send_json({
+                'listings': [
+                    {'url': f'{base}/{slug}1/', 'title': f'PS5 in {slug}', 'price': '$400'},
+                    {'url': f'{base}/{slug}2/', 'title': 'PS5 controller', 'price': '$40'},
+                ],
+                'next': f'/marketplace/{slug}/search?query=ps5&page=2',
+            })
+        return self.send_json({
+            'listings': [{'url': f'{base}/{slug}3/', 'title': 'PS5 games', 'price': 'Free'}],
+        })
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubMarketplaceTestCase(TestCase):
+    """Runs StubMarketplaceHandler on a local port with one running scanner in two locations."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubMarketplaceHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.search_url = f'http://127.0.0.1:{cls.server.server_port}/marketplace/{{location}}/search?query={{query}}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        scanner = ActiveScanner.objects.create(category='Video Games', query='ps5', status='running')
+        stopped = ActiveScanner.objects.create(category='Furniture', query='desk', status='stopped')
+        for slug in ('denver', 'flaky'):
+            location = Location.objects.create(name=slug.title(), marketplace_url_slug=slug)
+            ScannerLocationMapping.objects.create(scanner=scanner, location=location)
+            ScannerLocationMapping.objects.create(scanner=stopped, location=location)
+
+    def make_engine(self):
+        return ScanEngine(search_url=self.search_url, concurrency=4, backoff=0.01)
+
+
+class ScanEngineTests(StubMarketplaceTestCase):
+    def setUp(self):
+        StubMarketplaceHandler.bodies = {}
+
+    def run_engine(self):
+        engine = self.make_engine()
+        try:
+            return engine.run(active_targets())
+        finally:
+            engine.close()
+
+    def test_scans_every_active_pair_with_retries(self):
+        StubMarketplaceHandler.failures_left = {'flaky': 1}
+        summary = self.run_engine()
+
+        self.assertEqual(summary['targets'], 2)
+        self.assertEqual(summary['failed'], 0)
+        self.assertEqual(summary['pages'], 4)
+        self.assertEqual(summary['inserted'], 6)
+        self.assertEqual(Listing.objects.count(), 6)
+        listing = Listing.objects.get(title='PS5 in flaky')
+        self.assertEqual(listing.description, 'Details for item flaky1')
+        self.assertEqual(listing.price_cents, 40000)
+        self.assertEqual(listing.search_location, 'Flaky')
+        self.assertEqual(listing.search_title, 'Video Games')
+
+    def test_malformed_search_pages_fail_only_their_pair(self):
+        StubMarketplaceHandler.failures_left = {}
+        for body in [None, 'oops', 42, {'listings': 'oops'}, {'listings': [], 'next': 3}]:
+            StubMarketplaceHandler.bodies = {'flaky': body}
+            summary = self.run_engine()
+            self.assertEqual(summary['failed'], 1, body)
+            self.assertIn('Unexpected search page', list(summary['failed_mappings'].values())[0])
+        self.assertEqual(Listing.objects.count(), 3)
+
+    def test_rescan_stops_at_known_listings(self):
+        StubMarketplaceHandler.failures_left = {}
+        self.run_engine()
+        unit = ScanWorkUnit.objects.get(mapping__location__marketplace_url_slug='denver', mapping__scanner__status='running')
+        self.assertEqual(unit.high_water_keys[0], '127.0.0.1/marketplace/item/denver1')
+        self.assertIsNotNone(unit.last_full_scan_at)
+
+        summary = self.run_engine()
+        # Only the first page is fetched, and none of its items' details
+        self.assertEqual(summary['pages'], 2)
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual(summary['known'], 4)
+        self.assertEqual(summary['inserted'] + summary['updated'], 0)
+
+    def test_full_rescan_after_interval(self):
+        StubMarketplaceHandler.failures_left = {}
+        self.run_engine()
+        ScanWorkUnit.objects.update(last_full_scan_at=timezone.now() - timedelta(days=2))
+        summary = self.run_engine()
+        self.assertEqual(summary['pages'], 4)
+        self.assertEqual(summary['inserted'], 0)
+        # Nothing changed since the first scan, so nothing is rewritten
+        self.assertEqual(summary['unchanged'], 6)
+        self.assertEqual(Listing.objects.count(), 6)
+
+
+class FetcherRetryDelayTests(SimpleTestCase):
+    def setUp(self):
+        self.fetcher = Fetcher(concurrency=1, per_host=1, retries=3, backoff=1.0, timeout=1, max_backoff=30)
+
+    def tearDown(self):
+        self.fetcher.close()
+
+    def delay(self, retry_after, attempt=0):
+        response = mock.Mock(status_code=429, url='http://marketplace.test/', headers={'Retry-After': retry_after})
+        return self.fetcher.retry_delay(attempt, RetryableResponse(response))
+
+    def test_retry_after_is_honoured_up_to_the_max_backoff(self):
+        self.assertEqual(self.delay('5'), 5)
+        self.assertEqual(self.delay('2.5'), 2.5)
+        self.assertEqual(self.delay('0'), 0)
+        self.assertEqual(self.delay('86400'), 30)
+
+    def test_unusable_retry_after_falls_back_to_capped_backoff(self):
+        for retry_after in ['', '-5', 'nan', 'inf', 'Wed, 21 Oct 2015 07:28:00 GMT']:
+            self.assertLessEqual(self.delay(retry_after), 1.0)
+        self.assertLessEqual(self.delay('', attempt=20), 30)
+
+
+class ScanWorkQueueTests(StubMarketplaceTestCase):
+    def setUp(self):
+        StubMarketplaceHandler.failures_left = {}
+        sync_work_units()
+
+    def test_only_active_mappings_get_work_units(self):
+        self.assertEqual(ScanWorkUnit.objects.count(), 2)
+        self.assertFalse(ScanWorkUnit.objects.exclude(mapping__scanner__status='running').exists())
+
+    def test_deactivated_mappings_keep_their_units(self):
+        mapping = ScannerLocationMapping.objects.filter(scanner__status='running').first()
+        ScanWorkUnit.objects.filter(mapping=mapping).update(high_water_keys=['127.0.0.1/marketplace/item/1'])
+
+        ScannerLocationMapping.objects.filter(id=mapping.id).update(is_active=False)
+        sync_work_units()
+        unit = ScanWorkUnit.objects.get(mapping=mapping)
+        self.assertFalse(unit.is_active)
+        self.assertEqual(len(claim_work_units('worker-a', limit=5, lease_seconds=60)), 1)
+
+        ScannerLocationMapping.objects.filter(id=mapping.id).update(is_active=True)
+        sync_work_units()
+        unit.refresh_from_db()
+        self.assertTrue(unit.is_active)
+        self.assertEqual(unit.high_water_keys, ['127.0.0.1/marketplace/item/1'])
+        self.assertEqual([claimed.id for claimed in claim_work_units('worker-b', limit=5, lease_seconds=60)], [unit.id])
+
+    def run_one_unit_at_a_time(self, between_units=None):
+        cache.clear()
+        engine = self.make_engine()
+        scan = engine.run
+
+        def run(targets):
+            summary = scan(targets)
+            if between_units:
+                between_units(targets)
+            return summary
+
+        try:
+            with mock.patch.object(engine, 'run', run), \
+                    mock.patch('main.workqueue.sync_work_units', wraps=sync_work_units) as sync:
+                summary = run_worker(engine, owner='worker-a', batch_size=1, once=True, sync_seconds=3600)
+        finally:
+            engine.close()
+        return summary, sync.call_count
+
+    def test_worker_only_resyncs_when_mappings_change(self):
+        summary, syncs = self.run_one_unit_at_a_time()
+        self.assertEqual((summary['targets'], syncs), (2, 1))
+
+        ScanWorkUnit.objects.update(next_due_at=timezone.now())
+
+        def deactivate_the_other_mapping(targets):
+            with self.captureOnCommitCallbacks(execute=True):
+                mapping = ScannerLocationMapping.objects.filter(
+                    scanner__status='running', is_active=True
+                ).exclude(id=targets[0].mapping_id).get()
+                mapping.is_active = False
+                mapping.save()
+
+        summary, syncs = self.run_one_unit_at_a_time(deactivate_the_other_mapping)
+        self.assertEqual((summary['targets'], syncs), (1, 2))
+        self.assertEqual(ScanWorkUnit.objects.filter(is_active=False).count(), 1)
+
+    def test_claims_are_exclusive_until_the_lease_expires(self):
+        first = claim_work_units('worker-a', limit=1, lease_seconds=60)
+        second = claim_work_units('worker-b', limit=5, lease_seconds=60)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first[0].id, second[0].id)
+        self.assertEqual(claim_work_units('worker-c', limit=5, lease_seconds=60), [])
+
+        # worker-a dies: once its lease runs out the unit is claimed again
+        ScanWorkUnit.objects.filter(lease_owner='worker-a').update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        reclaimed = claim_work_units('worker-c', limit=5, lease_seconds=60)
+        self.assertEqual([unit.id for unit in reclaimed], [first[0].id])
+        self.assertEqual(renew_leases('worker-a', [first[0].id], 60), 0)
+
+    def test_worker_scans_due_units_and_reschedules_them(self):
+        engine = self.make_engine()
+        try:
+            summary = run_worker(engine, owner='worker-a', once=True, interval_seconds=300)
+        finally:
+            engine.close()
+
+        self.assertEqual(summary['inserted'], 6)
+        unit = ScanWorkUnit.objects.first()
+        self.assertIsNone(unit.lease_owner)
+        self.assertGreater(unit.next_due_at, timezone.now() + timedelta(seconds=250))
+        self.assertEqual(claim_work_units('worker-b', limit=5, lease_seconds=60), [])
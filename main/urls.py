@@ -10,7 +10,10 @@ router.register(r'locations', views.LocationViewSet)
 router.register(r'scanner-locations', views.ScannerLocationMappingViewSet)
 
 urlpatterns = [
+    # Before the router, whose listing detail route would match "stream"
+    path('api/listings/stream/', views.listing_stream, name='listing-stream'),
     path('api/', include(router.urls)),
     path('api/keywords/by_scanner/', views.KeywordViewSet.as_view({'get': 'by_scanner'})),
     path('api/keywords/update_for_scanner/', views.KeywordViewSet.as_view({'post': 'update_for_scanner'})),
+    path('metrics', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""
+Per-model version counters and the conditional GETs built on them.
+
+Every committed write to a versioned model bumps its ModelVersion row: the
+save/delete signal handlers do it for single objects, and the bulk paths
+(ingest_listings, keyword and mapping bulk updates, management commands)
+call bump_versions() themselves. Bumps run on commit, so concurrent writers
+don't queue on the counter row and a version never moves before the data
+it stands for is visible.
+
+Read endpoints derive an ETag from the versions of the models their
+responses depend on and answer a matching If-None-Match (or
+If-Modified-Since) with 304 Not Modified before running their query.
+Last-Modified only has one-second resolution, so it is left out until the
+newest change is over a second old; otherwise a write later in the same
+second would leave the date unchanged and If-Modified-Since would answer
+304 with stale data.
+Endpoints of rarely changing models also keep their response data in the
+cache under that ETag, so an edit moves them to a new key at once.
+
+The versions themselves are cached for MODEL_VERSION_CACHE_TTL seconds and
+dropped on every bump. With a shared cache (CACHE_BACKEND) edits show up
+everywhere immediately; with the default per-process local memory cache
+other processes see them within the TTL.
+"""
+import hashlib
+from calendar import timegm
+from datetime import timedelta
+from functools import partial, wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .models import ActiveScanner, Keyword, Listing, Location, ModelVersion, ScannerLocationMapping
+
+VERSIONED_MODELS = (Listing, Location, ActiveScanner, ScannerLocationMapping, Keyword)
+
+VERSION_KEY_PREFIX = 'model-version:'
+RESPONSE_KEY_PREFIX = 'versioned-response:'
+
+LAST_MODIFIED_RESOLUTION = timedelta(seconds=1)
+
+
+def bump_versions(*models):
+    """Bump the versions of `models` once the current transaction commits."""
+    names = [model._meta.label_lower for model in models]
+    transaction.on_commit(lambda: increment(names))
+
+
+def increment(names):
+    now = timezone.now()
+    rows = ModelVersion.objects.filter(name__in=names)
+    if rows.update(version=F('version') + 1, changed_at=now) < len(names):
+        # First bump of a model: create its row, then count this write
+        existing = set(rows.values_list('name', flat=True))
+        missing = [name for name in names if name not in existing]
+        ModelVersion.objects.bulk_create([ModelVersion(name=name) for name in missing], ignore_conflicts=True)
+        ModelVersion.objects.filter(name__in=missing).update(version=F('version') + 1, changed_at=now)
+    cache.delete_many([VERSION_KEY_PREFIX + name for name in names])
+
+
+def model_versions(models):
+    """
+    [(name, version, changed_at)] for `models`, from the cache or else in one
+    query; models never bumped are version 0.
+    """
+    names = sorted(model._meta.label_lower for model in models)
+    cached = cache.get_many([VERSION_KEY_PREFIX + name for name in names])
+    rows = {name[len(VERSION_KEY_PREFIX):]: value for name, value in cached.items()}
+    missing = [name for name in names if name not in rows]
+    if missing:
+        loaded = {name: (0, None) for name in missing}
+        loaded.update(
+            (name, (version, changed_at))
+            for name, version, changed_at in ModelVersion.objects.filter(name__in=missing)
+            .values_list('name', 'version', 'changed_at')
+        )
+        cache.set_many(
+            {VERSION_KEY_PREFIX + name: value for name, value in loaded.items()},
+            settings.MODEL_VERSION_CACHE_TTL,
+        )
+        rows.update(loaded)
+    return [(name, *rows[name]) for name in names]
+
+
+def validators(request, versions):
+    """(ETag, Last-Modified timestamp) of a response to `request` given the model versions."""
+    # The URL carries the filters and page, Accept picks the renderer
+    key = '|'.join([request.get_full_path(), request.META.get('HTTP_ACCEPT', '')] + [
+        f'{name}:{version}' for name, version, _ in versions
+    ])
+    etag = '"%s"' % hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+    changed = [changed_at for _, _, changed_at in versions if changed_at is not None]
+    last_modified = None
+    # A change within the last second may be followed by another in the
+    # same second (see the module docstring)
+    if changed and timezone.now() - max(changed) > LAST_MODIFIED_RESOLUTION:
+        last_modified = timegm(max(changed).utctimetuple())
+    return etag, last_modified
+
+
+def conditional_response(request, models, handler, args, kwargs, cached=False):
+    """
+    Call `handler` unless the client's copy is current, in which case answer
+    304 without running it. With `cached`, the response data is also kept in
+    the cache and reused until one of `models` changes.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return handler(request, *args, **kwargs)
+
+    etag, last_modified = validators(request, model_versions(models))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if cached:
+            response = cached_response(request, etag, handler, args, kwargs)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+    return add_validators(response, etag, last_modified)
+
+
+async def aconditional_response(request, models, handler, args, kwargs, cached=False):
+    """conditional_response() for a coroutine `handler`."""
+    if request.method not in ('GET', 'HEAD'):
+        return await handler(request, *args, **kwargs)
+
+    etag, last_modified = validators(request, await sync_to_async(model_versions)(models))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if cached:
+            response = await acached_response(request, etag, handler, args, kwargs)
+        else:
+            response = await handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+    return add_validators(response, etag, last_modified)
+
+
+def add_validators(response, etag, last_modified):
+    response.headers.setdefault('ETag', etag)
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(last_modified)
+    # Without this browsers may reuse a response heuristically, for a
+    # fraction of its age, instead of revalidating it
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def cached_response(request, etag, handler, args, kwargs):
+    key = RESPONSE_KEY_PREFIX + etag.strip('"')
+    data = cache.get(key)
+    if data is not None:
+        return Response(data)
+    response = handler(request, *args, **kwargs)
+    if response.status_code == 200 and isinstance(response, Response):
+        cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+    return response
+
+
+async def acached_response(request, etag, handler, args, kwargs):
+    key = RESPONSE_KEY_PREFIX + etag.strip('"')
+    data = await cache.aget(key)
+    if data is not None:
+        return Response(data)
+    response = await handler(request, *args, **kwargs)
+    if response.status_code == 200 and isinstance(response, Response):
+        await cache.aset(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+    return response
+
+
+def conditional(*models, cached=False):
+    """
+    Decorate a view method, sync or async, to answer 304 (or reuse cached
+    data) while none of `models` changed.
+    """
+    def decorator(method):
+        if iscoroutinefunction(method):
+            @wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                return await aconditional_response(
+                    request, models, partial(method, view), args, kwargs, cached=cached
+                )
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            return conditional_response(request, models, partial(method, view), args, kwargs, cached=cached)
+        return wrapper
+    return decorator
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin: conditional list and retrieve, keyed on `version_models`,
+    with their data cached when `cache_responses` is set.
+    """
+    version_models = ()
+    cache_responses = False
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.version_models, super().list, args, kwargs, cached=self.cache_responses
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.version_models, super().retrieve, args, kwargs, cached=self.cache_responses
+        )
@@ -1,50 +1,76 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from django.db.models import Q, F
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Q
+from django.utils.crypto import constant_time_compare
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import ActiveScanner, Keyword, Listing, Location, ScannerLocationMapping
-from .serializers import ActiveScannerSerializer, KeywordSerializer, ListingSerializer, LocationSerializer, ScannerLocationMappingSerializer
-from rest_framework.pagination import PageNumberPagination
+from .async_views import AsyncViewSetMixin
+from .exports import stream_csv, stream_ndjson
+from .geo import DEFAULT_RADIUS_KM, filter_near, parse_point
+from .ingest import ingest_listings
+from .live import event_stream, hub, parse_filters
+from .matching import invalidate_matcher
+from .metrics import exposition
+from .models import ActiveScanner, Keyword, Listing, ListingFacet, ListingKeywordMatch, Location, ScannerLocationMapping
+from .pricing import to_cents
+from .search import search_listings
+from .versions import ConditionalGetMixin, bump_versions, conditional
+from .serializers import ActiveScannerSerializer, KeywordSerializer, ListingIngestSerializer, ListingRowSerializer, ListingSerializer, LocationSerializer, ScannerLocationMappingSerializer
+from .pagination import ListingCursorPagination, StandardResultsSetPagination
 
 # Create your views here.
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'limit'
-    max_page_size = 100
-
-class LocationViewSet(viewsets.ModelViewSet):
+class LocationViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Location.objects.all()
+    version_models = (Location,)
+    cache_responses = True
     serializer_class = LocationSerializer
     permission_classes = [AllowAny]  # Change this to IsAuthenticated in production
 
-class ActiveScannerViewSet(viewsets.ModelViewSet):
+class ActiveScannerViewSet(AsyncViewSetMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = ActiveScanner.objects.all()
+    version_models = (ActiveScanner, ScannerLocationMapping, Location)
+    cache_responses = True
     serializer_class = ActiveScannerSerializer
     permission_classes = [AllowAny]  # Change this to IsAuthenticated in production
+
+    def get_queryset(self):
+        # Load every scanner's active mappings and their locations in one extra
+        # query instead of one per scanner plus one per mapping
+        return ActiveScanner.objects.prefetch_related(
+            Prefetch(
+                'scannerlocationmapping_set',
+                queryset=ScannerLocationMapping.objects.filter(is_active=True).select_related('location'),
+                to_attr='active_mappings',
+            )
+        )
+
+    @conditional(ActiveScanner, ScannerLocationMapping, Location, cached=True)
+    async def alist(self, request, *args, **kwargs):
+        """list() through the async ORM, under ASGI (see main/async_views.py)."""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        scanners = [scanner async for scanner in queryset]
+        return Response(self.get_serializer(scanners, many=True).data)
     
     def create(self, request, *args, **kwargs):
-        # Extract location_ids from request data
-        location_ids = request.data.pop('location_ids', [])
+        # Extract and check location_ids from request data
+        location_ids = self.validate_location_ids(request.data.pop('location_ids', []))
         
-        # Create the scanner
+        # Create the scanner and its location mappings together
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        scanner = serializer.save()
-        
-        # Create location mappings
-        for location_id in location_ids:
-            try:
-                location = Location.objects.get(id=location_id)
-                ScannerLocationMapping.objects.create(
-                    scanner=scanner,
-                    location=location,
-                    is_active=True
-                )
-            except Location.DoesNotExist:
-                pass
+        with transaction.atomic():
+            scanner = serializer.save()
+            self.sync_location_mappings(scanner, location_ids, created=True)
         
         # Return the created scanner with location data
         return Response(
@@ -53,44 +79,93 @@ class ActiveScannerViewSet(viewsets.ModelViewSet):
         )
     
     def update(self, request, *args, **kwargs):
-        # Extract location_ids from request data
+        # Extract and check location_ids from request data
         location_ids = request.data.pop('location_ids', None)
+        if location_ids is not None:
+            location_ids = self.validate_location_ids(location_ids)
         
         # Update the scanner
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-        
-        # Update location mappings if provided
-        if location_ids is not None:
-            # Deactivate all existing mappings
-            ScannerLocationMapping.objects.filter(scanner=instance).update(is_active=False)
+        with transaction.atomic():
+            self.perform_update(serializer)
             
-            # Create or activate mappings for the provided location_ids
-            for location_id in location_ids:
-                try:
-                    location = Location.objects.get(id=location_id)
-                    mapping, created = ScannerLocationMapping.objects.get_or_create(
-                        scanner=instance,
-                        location=location,
-                        defaults={'is_active': True}
-                    )
-                    if not created:
-                        mapping.is_active = True
-                        mapping.save()
-                except Location.DoesNotExist:
-                    pass
+            # Replace the active location set if provided
+            if location_ids is not None:
+                self.sync_location_mappings(instance, location_ids)
         
+        # The mappings prefetched by get_object() may be stale now
+        instance.__dict__.pop('active_mappings', None)
+
         # Return the updated scanner with location data
         return Response(ActiveScannerSerializer(instance).data)
 
-class ListingViewSet(viewsets.ModelViewSet):
+    def validate_location_ids(self, location_ids):
+        """Return the de-duplicated location ids, rejecting unknown ones."""
+        if not isinstance(location_ids, list):
+            raise ValidationError({'location_ids': ['Expected a list of location ids.']})
+        try:
+            location_ids = list(dict.fromkeys(int(location_id) for location_id in location_ids))
+        except (TypeError, ValueError):
+            raise ValidationError({'location_ids': ['Location ids must be integers.']})
+
+        known = set(Location.objects.filter(id__in=location_ids).values_list('id', flat=True))
+        unknown = [location_id for location_id in location_ids if location_id not in known]
+        if unknown:
+            raise ValidationError({'location_ids': [f'Unknown location ids: {unknown}']})
+        return location_ids
+
+    def sync_location_mappings(self, scanner, location_ids, created=False):
+        """
+        Make `location_ids` the scanner's active locations with a fixed number
+        of queries: deactivate the rest, re-activate existing mappings and
+        bulk create the missing ones.
+        """
+        existing = {}
+        if not created:
+            existing = dict(
+                ScannerLocationMapping.objects.filter(scanner=scanner).values_list('location_id', 'is_active')
+            )
+            ScannerLocationMapping.objects.filter(scanner=scanner, is_active=True).exclude(
+                location_id__in=location_ids
+            ).update(is_active=False)
+
+            inactive = [location_id for location_id in location_ids if existing.get(location_id) is False]
+            if inactive:
+                ScannerLocationMapping.objects.filter(scanner=scanner, location_id__in=inactive).update(is_active=True)
+
+        ScannerLocationMapping.objects.bulk_create([
+            ScannerLocationMapping(scanner=scanner, location_id=location_id, is_active=True)
+            for location_id in location_ids if location_id not in existing
+        ])
+        bump_versions(ScannerLocationMapping)
+
+class ListingViewSet(AsyncViewSetMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Listing.objects.all().order_by('-created_at')
+    # ?keyword= and ?matched= also depend on the keywords
+    version_models = (Listing, Keyword)
     serializer_class = ListingSerializer
     permission_classes = [AllowAny]  # Change this to IsAuthenticated in production
     pagination_class = StandardResultsSetPagination
+    cursor_pagination_class = ListingCursorPagination
+    bulk_max_listings = 5000
+    export_chunk_size = 2000
+
+    @property
+    def paginator(self):
+        """
+        Page-number pagination by default; keyset pagination when the client
+        opts in with ?pagination=cursor or sends a cursor.
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or ListingCursorPagination.cursor_query_param in params:
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
     
     def get_queryset(self):
         queryset = Listing.objects.all().order_by('-created_at')
@@ -102,7 +177,14 @@ class ListingViewSet(viewsets.ModelViewSet):
         min_price = self.request.query_params.get('min_price', None)
         max_price = self.request.query_params.get('max_price', None)
         max_distance = self.request.query_params.get('max_distance', None)
+        near = self.request.query_params.get('near', None)
+        radius_km = self.request.query_params.get('radius_km', None)
         watchlist = self.request.query_params.get('watchlist', None)
+        q = self.request.query_params.get('q', None)
+        matched = self.request.query_params.get('matched', None)
+        keyword = self.request.query_params.get('keyword', None)
+        price_dropped = self.request.query_params.get('price_dropped', None)
+        collapse_duplicates = self.request.query_params.get('collapse_duplicates', None)
         
         if query:
             queryset = queryset.filter(query=query)
@@ -117,79 +199,225 @@ class ListingViewSet(viewsets.ModelViewSet):
         # Apply distance filter if provided
         if max_distance and max_distance.isdigit():
             queryset = queryset.filter(distance__lte=int(max_distance))
+
+        # Radius around a lat,lon point, over the listings' own coordinates
+        # (see main/geo.py); listings without coordinates never match
+        if near:
+            try:
+                latitude, longitude = parse_point(near)
+                radius = float(radius_km) if radius_km else DEFAULT_RADIUS_KM
+                if not 0 < radius <= 20000:
+                    raise ValueError(radius_km)
+            except ValueError:
+                # If near or radius_km is not valid, ignore this filter
+                pass
+            else:
+                queryset = filter_near(queryset, latitude, longitude, radius)
         
-        # Simplified price filtering without REGEXP_REPLACE
+        # Price filters are range predicates on the parsed, indexed price_cents
+        # column; listings without a parseable price never match a price filter
         if min_price:
-            # Filter listings with numeric prices that are >= min_price
-            # This is a simpler approach that will work with SQL Server
-            # It may not catch all valid prices but should work for most cases
             try:
-                min_price_value = float(min_price)
-                # First filter out listings with no price or non-numeric prices
-                queryset = queryset.filter(
-                    price__regex=r'[$]?[0-9]+'
-                )
-                # Then do a string comparison which works for basic "$123" format
-                queryset = queryset.filter(
-                    Q(price__regex=fr'[$]?[0-9][0-9][0-9]+') |  # $100 or more
-                    Q(price__regex=fr'[$]?[0-9][0-9]') & Q(price__regex=fr'[^0-9][{min_price_value}][^0-9]') |  # $XX where XX >= min
-                    Q(price__regex=fr'[$]?[0-9]') & Q(price__gte=fr'${min_price_value}')  # Single digit that's >= min
-                )
+                queryset = queryset.filter(price_cents__gte=to_cents(min_price))
             except (ValueError, TypeError):
                 # If min_price is not a valid number, ignore this filter
                 pass
             
         if max_price:
-            # Similar approach for max_price
             try:
-                max_price_value = float(max_price)
-                # First filter for listings with prices
-                queryset = queryset.filter(
-                    price__regex=r'[$]?[0-9]+'
-                )
-                # Basic string comparison - will work for most common price formats
-                queryset = queryset.exclude(
-                    price__regex=fr'[$][0-9][0-9][0-9][0-9]+')  # Exclude prices with 4+ digits after $
-                queryset = queryset.exclude(
-                    price__regex=fr'[$][{max_price_value+1}-9][0-9][0-9]')  # Exclude $X00 where X > max_price_value/100
+                queryset = queryset.filter(price_cents__lte=to_cents(max_price))
             except (ValueError, TypeError):
                 # If max_price is not a valid number, ignore this filter
                 pass
             
         if watchlist and watchlist.lower() == 'true':
             queryset = queryset.filter(watchlist=True)
-            
+
+        # Listings whose latest price change was a drop (see ListingPriceHistory)
+        if price_dropped and price_dropped.lower() == 'true':
+            queryset = queryset.filter(price_cents__lt=F('previous_price_cents'))
+
+        # Keyword matches stored at ingest time (see main/matching.py)
+        if matched and matched.lower() in ('true', 'false'):
+            has_match = Exists(ListingKeywordMatch.objects.filter(listing=OuterRef('pk')))
+            queryset = queryset.filter(has_match if matched.lower() == 'true' else ~has_match)
+
+        if keyword:
+            queryset = queryset.filter(Exists(ListingKeywordMatch.objects.filter(
+                listing=OuterRef('pk'), keyword__keyword__iexact=keyword
+            )))
+
+        # Full-text search over title and description, best matches first
+        if q:
+            queryset = search_listings(queryset, q)
+
+        # One listing per near-duplicate cluster (see main/dedup.py): drop
+        # reposts whose canonical listing also passes the filters and the
+        # search above.
+        # Unfiltered, every canonical listing passes, which reduces to a
+        # plain column check instead of a subquery over the whole table
+        if collapse_duplicates and collapse_duplicates.lower() == 'true':
+            if queryset.query.has_filters():
+                queryset = queryset.filter(
+                    Q(duplicate_of__isnull=True) | ~Exists(queryset.filter(pk=OuterRef('duplicate_of_id')))
+                )
+            else:
+                queryset = queryset.filter(duplicate_of__isnull=True)
+
         return queryset
     
+    @conditional(Listing, Keyword)
+    def list(self, request, *args, **kwargs):
+        """
+        List listings in their slim representation (no description), or with
+        just the comma-separated ?fields= asked for.
+
+        Rows are read with values() limited to the columns those fields need
+        and converted by ListingRowSerializer; the detail route keeps the full
+        ListingSerializer representation.
+        """
+        try:
+            row_serializer, queryset = self.list_rows(request)
+        except ValidationError as exc:
+            return Response({"error": exc.detail[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(row_serializer.to_representation(page))
+        return Response(row_serializer.to_representation(queryset))
+
+    @conditional(Listing, Keyword)
+    async def alist(self, request, *args, **kwargs):
+        """list() through the async ORM, under ASGI (see main/async_views.py)."""
+        try:
+            row_serializer, queryset = self.list_rows(request)
+        except ValidationError as exc:
+            return Response({"error": exc.detail[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(row_serializer.to_representation(page))
+        return Response(row_serializer.to_representation([row async for row in queryset]))
+
+    def list_rows(self, request):
+        """
+        The row serializer for ?fields= and the values() queryset it reads;
+        raises ValidationError for unknown fields.
+        """
+        fields = request.query_params.get('fields')
+        row_serializer = ListingRowSerializer(
+            [name.strip() for name in fields.split(',') if name.strip()] if fields else None
+        )
+        # Pagination positions need the primary key and creation time
+        columns = list(dict.fromkeys(row_serializer.columns + ['listing_idx', 'created_at']))
+        return row_serializer, self.filter_queryset(self.get_queryset()).values(*columns)
+
+    @conditional(Listing, Keyword)
+    async def aretrieve(self, request, *args, **kwargs):
+        """retrieve() through the async ORM, under ASGI (see main/async_views.py)."""
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Upsert many scraped listings at once, deduplicated on normalized URL.
+
+        Accepts a list of listings or {"listings": [...]}. Invalid rows are
+        reported by index and skipped; the rest are written in one transaction.
+        """
+        rows = request.data.get('listings') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list):
+            return Response({"error": "Expected a list of listings"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.bulk_max_listings:
+            return Response(
+                {"error": f"At most {self.bulk_max_listings} listings per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Validate every row in one pass, keeping the valid ones
+        serializer = ListingIngestSerializer()
+        valid_rows = []
+        errors = []
+        for index, row in enumerate(rows):
+            try:
+                valid_rows.append(serializer.run_validation(row))
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+
+        result = ingest_listings(valid_rows)
+        result['skipped'] += len(errors)
+        result['errors'] = errors
+        return Response(result)
+
     @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every listing matching the list filters as NDJSON (default) or
+        CSV (?export_format=csv), read through a server-side cursor.
+        """
+        export_format = request.query_params.get('export_format', 'ndjson').lower()
+        if export_format not in ('ndjson', 'csv'):
+            return Response({"error": "export_format must be 'ndjson' or 'csv'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = [
+            field.name for field in Listing._meta.concrete_fields
+            if field.name not in Listing.INTERNAL_FIELDS
+        ]
+        rows = self.get_queryset().values_list(*fields).iterator(chunk_size=self.export_chunk_size)
+
+        if export_format == 'csv':
+            content = stream_csv(fields, rows)
+            content_type = 'text/csv'
+        else:
+            content = stream_ndjson(fields, rows)
+            content_type = 'application/x-ndjson'
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="listings.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    @conditional(Listing)
     def filter_options(self, request):
-        """Return available filter options"""
-        # Get unique queries from listings
-        queries = list(Listing.objects.values_list('query', flat=True).distinct())
-        
-        # Get unique categories from listings
-        categories = list(Listing.objects.values_list('search_title', flat=True).distinct())
-        
-        # Get the search locations from listings
-        search_locations = list(Listing.objects.values_list('search_location', flat=True).distinct())
-        
-        # Filter out None and empty values and ensure unique values
-        queries = sorted(list(set(q for q in queries if q)))
-        categories = sorted(list(set(c for c in categories if c)))
-        search_locations = sorted(list(set(loc for loc in search_locations if loc)))
-        
+        """Return available filter options with per-value listing counts"""
+        return self.filter_options_response(self.facet_rows())
+
+    @conditional(Listing)
+    async def afilter_options(self, request):
+        """filter_options() through the async ORM, under ASGI (see main/async_views.py)."""
+        return self.filter_options_response([row async for row in self.facet_rows()])
+
+    def facet_rows(self):
+        # One indexed read of the small, incrementally maintained facet table
+        return (
+            ListingFacet.objects.filter(listing_count__gt=0)
+            .order_by('facet', 'value')
+            .values_list('facet', 'value', 'listing_count')
+        )
+
+    def filter_options_response(self, facets):
+        options = {'queries': {}, 'categories': {}, 'search_locations': {}}
+        keys = {'query': 'queries', 'category': 'categories', 'search_location': 'search_locations'}
+        for facet, value, listing_count in facets:
+            options[keys[facet]][value] = listing_count
+
         return Response({
-            'queries': queries,
-            'categories': categories,
-            'search_locations': search_locations  # Use search_locations instead of scanner_locations
+            'queries': list(options['queries']),
+            'categories': list(options['categories']),
+            'search_locations': list(options['search_locations']),  # Use search_locations instead of scanner_locations
+            'counts': options,
         })
 
-class KeywordViewSet(viewsets.ModelViewSet):
+class KeywordViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Keyword.objects.all()
+    version_models = (Keyword,)
+    cache_responses = True
     serializer_class = KeywordSerializer
     permission_classes = [AllowAny]  # Change this to IsAuthenticated in production
     
     @action(detail=False, methods=['get'], url_path='by-scanner')
+    @conditional(Keyword, cached=True)
     def by_scanner(self, request):
         scanner_id = request.query_params.get('scannerId')
         if not scanner_id:
@@ -206,34 +434,109 @@ class KeywordViewSet(viewsets.ModelViewSet):
         
         if not scanner_id:
             return Response({"error": "Scanner ID is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            scanner_id = int(scanner_id)
+        except (TypeError, ValueError):
+            return Response({"error": "Scanner ID must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Delete existing keywords for this scanner
-        Keyword.objects.filter(filterID=scanner_id).delete()
-        
-        # Create new keywords
-        for keyword_text in keywords:
-            if keyword_text.strip():  # Only create non-empty keywords
-                Keyword.objects.create(
-                    keyword=keyword_text.strip(),
-                    filterID=scanner_id
-                )
-        
+        if not isinstance(keywords, list) or not all(isinstance(text, str) for text in keywords):
+            return Response({"error": "Keywords must be a list of strings"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Desired keywords: stripped, non-empty, first occurrence wins. The
+        # list keeps the request order for inserts, the set is for lookups
+        desired = list(dict.fromkeys(text.strip() for text in keywords if text.strip()))
+        desired_set = set(desired)
+        max_length = Keyword._meta.get_field('keyword').max_length
+        too_long = [text for text in desired if len(text) > max_length]
+        if too_long:
+            return Response(
+                {"error": f"Keywords must be at most {max_length} characters", "keywords": too_long},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Apply only the difference, atomically, so readers never see a
+        # partial keyword set and unchanged keywords keep their ids
+        with transaction.atomic():
+            existing = Keyword.objects.select_for_update().filter(filterID=scanner_id).order_by('id')
+            kept = set()
+            stale_ids = []
+            for keyword in existing:
+                if keyword.keyword in desired_set and keyword.keyword not in kept:
+                    kept.add(keyword.keyword)
+                else:
+                    stale_ids.append(keyword.id)
+
+            if stale_ids:
+                Keyword.objects.filter(id__in=stale_ids).delete()
+            Keyword.objects.bulk_create([
+                Keyword(keyword=text, filterID=scanner_id) for text in desired if text not in kept
+            ])
+
+        # bulk_create doesn't send post_save, drop the compiled matcher and
+        # bump the keyword version explicitly
+        invalidate_matcher(scanner_id)
+        bump_versions(Keyword)
+
         # Return the updated list
-        updated_keywords = Keyword.objects.filter(filterID=scanner_id)
+        updated_keywords = Keyword.objects.filter(filterID=scanner_id).order_by('id')
         serializer = self.get_serializer(updated_keywords, many=True)
         return Response(serializer.data)
 
-class ScannerLocationMappingViewSet(viewsets.ModelViewSet):
-    queryset = ScannerLocationMapping.objects.all()
+class ScannerLocationMappingViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = ScannerLocationMapping.objects.select_related('location')
+    version_models = (ScannerLocationMapping, Location)
+    cache_responses = True
     serializer_class = ScannerLocationMappingSerializer
     permission_classes = [AllowAny]  # Change to IsAuthenticated in production
     
     @action(detail=False, methods=['get'])
+    @conditional(ScannerLocationMapping, Location, cached=True)
     def by_scanner(self, request):
         scanner_id = request.query_params.get('scanner_id')
         if not scanner_id:
             return Response({"error": "Scanner ID is required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        mappings = ScannerLocationMapping.objects.filter(scanner_id=scanner_id)
+        mappings = ScannerLocationMapping.objects.filter(scanner_id=scanner_id).select_related('location')
         serializer = self.get_serializer(mappings, many=True)
         return Response(serializer.data)
+
+
+async def listing_stream(request):
+    """
+    Server-Sent Events feed of new listings, optionally filtered by
+    scanner_id, query, search_location and keyword (see main/live.py).
+    Streams only under an ASGI server.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "The live feed needs an ASGI server"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    try:
+        filters = parse_filters(request.GET)
+    except ValueError:
+        return JsonResponse({"error": "scanner_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    if hub.full():
+        return JsonResponse({"error": "Too many live feed clients"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    response = StreamingHttpResponse(event_stream(filters), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint for this process's request metrics (see
+    main/metrics.py). Needs the METRICS_AUTH_TOKEN bearer token or a staff
+    session unless METRICS_PUBLIC is set.
+    """
+    token = settings.METRICS_AUTH_TOKEN
+    allowed = (
+        settings.METRICS_PUBLIC
+        or (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'))
+        or request.user.is_staff
+    )
+    if not allowed:
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
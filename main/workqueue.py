@@ -0,0 +1,178 @@
+"""
+Distributed scan scheduling for `run_scanners --worker`.
+
+Each active scanner x location mapping has one ScanWorkUnit. Any number of
+worker processes, on any number of nodes, claim due units with
+SELECT ... FOR UPDATE SKIP LOCKED, so no two workers fetch the same pair.
+A worker extends the leases it holds from a heartbeat thread while it
+scans; if it dies, its leases expire and the units are claimed again.
+
+Workers sync the units with the mappings when a scanner or mapping changes
+(their model versions move, see main/versions.py), and at least every
+SCANNER_SYNC_INTERVAL seconds for writes that bypass the version counters.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ActiveScanner, ScannerLocationMapping, ScanWorkUnit
+from .scanner import ACTIVE_STATUSES, target_for_mapping
+from .versions import model_versions
+
+# Models whose changes can add or retire work units
+SYNC_MODELS = (ActiveScanner, ScannerLocationMapping)
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def sync_work_units():
+    """
+    Give every active mapping an active unit. Units of mappings no longer
+    active are deactivated, keeping their high-water marks for when the
+    mapping is re-activated.
+    """
+    active_ids = ScannerLocationMapping.objects.filter(
+        is_active=True, scanner__status__in=ACTIVE_STATUSES
+    ).values_list('id', flat=True)
+    ScanWorkUnit.objects.filter(is_active=True).exclude(mapping_id__in=active_ids).update(is_active=False)
+    ScanWorkUnit.objects.filter(is_active=False, mapping_id__in=active_ids).update(is_active=True)
+    missing = ScannerLocationMapping.objects.filter(id__in=active_ids, work_unit__isnull=True).values_list('id', flat=True)
+    ScanWorkUnit.objects.bulk_create(
+        [ScanWorkUnit(mapping_id=mapping_id) for mapping_id in missing],
+        ignore_conflicts=True,
+    )
+
+
+def claim_work_units(owner, limit, lease_seconds):
+    """
+    Lease up to `limit` due units to `owner`, skipping rows other workers
+    are claiming at the same moment. Returns the units with their mapping,
+    scanner and location loaded.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            ScanWorkUnit.objects.select_for_update(skip_locked=True)
+            .filter(is_active=True, next_due_at__lte=now)
+            .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+            .order_by('next_due_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        ScanWorkUnit.objects.filter(id__in=ids).update(
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            last_started_at=now,
+        )
+    return list(
+        ScanWorkUnit.objects.filter(id__in=ids, lease_owner=owner)
+        .select_related('mapping__scanner', 'mapping__location')
+    )
+
+
+def renew_leases(owner, unit_ids, lease_seconds):
+    """Extend the leases `owner` still holds; returns how many were extended."""
+    return ScanWorkUnit.objects.filter(id__in=unit_ids, lease_owner=owner).update(
+        lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds)
+    )
+
+
+def complete_work_units(owner, unit_ids, interval_seconds, error=None):
+    """Release `owner`'s leases and schedule the units' next scan."""
+    now = timezone.now()
+    return ScanWorkUnit.objects.filter(id__in=unit_ids, lease_owner=owner).update(
+        lease_owner=None,
+        lease_expires_at=None,
+        last_finished_at=now,
+        next_due_at=now + timedelta(seconds=interval_seconds),
+        last_error=error,
+    )
+
+
+class LeaseHeartbeat(threading.Thread):
+    """Renews a set of leases every third of the lease period until stopped."""
+
+    def __init__(self, owner, unit_ids, lease_seconds):
+        super().__init__(name='scan-lease-heartbeat', daemon=True)
+        self.owner = owner
+        self.unit_ids = list(unit_ids)
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                renewed = renew_leases(self.owner, self.unit_ids, self.lease_seconds)
+                if renewed < len(self.unit_ids):
+                    logger.warning('%s lost %d scan leases', self.owner, len(self.unit_ids) - renewed)
+        finally:
+            # This thread has its own database connection
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(engine, owner=None, batch_size=None, lease_seconds=None, interval_seconds=None,
+               retry_seconds=None, idle_seconds=None, sync_seconds=None, once=False, stop_event=None):
+    """
+    Claim, scan and reschedule due work units until stopped.
+
+    With `once`, returns as soon as no unit is due. Returns summed engine
+    summaries.
+    """
+    owner = owner or worker_id()
+    batch_size = batch_size or settings.SCANNER_CLAIM_BATCH
+    lease_seconds = lease_seconds or settings.SCANNER_LEASE_SECONDS
+    interval_seconds = interval_seconds or settings.SCANNER_SCAN_INTERVAL
+    retry_seconds = retry_seconds or settings.SCANNER_RETRY_INTERVAL
+    idle_seconds = idle_seconds or settings.SCANNER_IDLE_SLEEP
+    sync_seconds = sync_seconds or settings.SCANNER_SYNC_INTERVAL
+    stop_event = stop_event or threading.Event()
+
+    totals = Counter()
+    synced_versions = synced_at = None
+    while not stop_event.is_set():
+        versions = model_versions(SYNC_MODELS)
+        if versions != synced_versions or time.monotonic() - synced_at >= sync_seconds:
+            sync_work_units()
+            synced_versions, synced_at = versions, time.monotonic()
+        units = claim_work_units(owner, batch_size, lease_seconds)
+        if not units:
+            if once:
+                break
+            stop_event.wait(idle_seconds)
+            continue
+
+        unit_ids = {unit.mapping_id: unit.id for unit in units}
+        heartbeat = LeaseHeartbeat(owner, unit_ids.values(), lease_seconds)
+        heartbeat.start()
+        try:
+            summary = engine.run([target_for_mapping(unit.mapping, unit) for unit in units])
+        finally:
+            heartbeat.stop()
+
+        failed = summary.pop('failed_mappings')
+        complete_work_units(
+            owner, [unit_id for mapping_id, unit_id in unit_ids.items() if mapping_id not in failed], interval_seconds
+        )
+        for mapping_id, error in failed.items():
+            complete_work_units(owner, [unit_ids[mapping_id]], retry_seconds, error=error)
+        totals.update(summary)
+    return totals
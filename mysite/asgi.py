@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# Serve the hot read endpoints with async views (see main/async_views.py)
+os.environ.setdefault('ASYNC_VIEWS', 'true')
+# Persistent connections are per thread, and every ASGI request gets a new one
+os.environ.setdefault('CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -67,6 +67,8 @@ CORS_ALLOWED_ORIGINS = config("CORS_ALLOWED_ORIGINS").split(",")
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.CompressionMiddleware',
+    'main.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -112,14 +114,34 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 #     }
 # }
 
+DATABASE_URL = config('DATABASE_URL')  # Fetch DATABASE_URL from .env
+
 DATABASES = {
     'default': dj_database_url.parse(
-        config('DATABASE_URL'),  # Fetch DATABASE_URL from .env
-        conn_max_age=600,        # Optional: Maintain database connections
-        ssl_require=True         # Optional: Use SSL for production
+        DATABASE_URL,
+        # Optional: Maintain database connections. mysite/asgi.py sets 0: under
+        # ASGI every request runs in its own thread and would leave one behind
+        conn_max_age=config('CONN_MAX_AGE', default=600, cast=int),
+        # Optional: Use SSL for production (SQLite, used for tests, has no SSL)
+        ssl_require=not DATABASE_URL.startswith('sqlite')
     )
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory (per process) unless CACHE_BACKEND names a shared cache, e.g.
+# django.core.cache.backends.redis.RedisCache with CACHE_LOCATION=redis://...
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+MODEL_VERSION_CACHE_TTL = config('MODEL_VERSION_CACHE_TTL', default=2, cast=float)  # Seconds, see main/versions.py
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=600, cast=int)  # Seconds a cached response is kept
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -219,12 +241,66 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # orjson-backed when installed (see main/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'main.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     # Comment out or modify this line to allow unauthenticated access by default
     # 'DEFAULT_PERMISSION_CLASSES': (
     #     'rest_framework.permissions.IsAuthenticated',
     # ),
 }
 
+# Response compression (main.middleware.CompressionMiddleware): smaller bodies
+# are sent uncompressed; brotli is used when the package is installed
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)  # Bytes
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)  # 0-11
+
+# Async read endpoints (main/async_views.py); mysite/asgi.py turns them on
+ASYNC_VIEWS = config('ASYNC_VIEWS', default='False').lower() == 'true'
+
+# Live listing feed (GET /api/listings/stream/, ASGI only)
+LIVE_FEED_BACKEND = config('LIVE_FEED_BACKEND', default='auto')  # 'auto', 'local' or 'postgres', see main/live.py
+LIVE_FEED_QUEUE_SIZE = config('LIVE_FEED_QUEUE_SIZE', default=100, cast=int)  # Events buffered per client
+LIVE_FEED_HEARTBEAT = config('LIVE_FEED_HEARTBEAT', default=15, cast=float)  # Seconds between keep-alives
+LIVE_FEED_MAX_CLIENTS = config('LIVE_FEED_MAX_CLIENTS', default=1000, cast=int)  # Per process
+
+# Request metrics (main/metrics.py, served at /metrics): requests over either
+# budget are logged as warnings
+METRICS_QUERY_BUDGET = config('METRICS_QUERY_BUDGET', default=30, cast=int)
+METRICS_LATENCY_BUDGET_MS = config('METRICS_LATENCY_BUDGET_MS', default=500, cast=int)
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')  # Bearer token for /metrics (staff sessions work too)
+METRICS_PUBLIC = config('METRICS_PUBLIC', default='False').lower() == 'true'  # Serve /metrics without auth
+
+# Bulk listing ingestion (POST /api/listings/bulk/) sends thousands of rows per request
+DATA_UPLOAD_MAX_MEMORY_SIZE = config('DATA_UPLOAD_MAX_MEMORY_SIZE', default=20 * 1024 * 1024, cast=int)
+
+# Scan engine (python manage.py run_scanners, see main/scanner.py)
+SCANNER_SEARCH_URL = config(
+    'SCANNER_SEARCH_URL',
+    default='https://www.facebook.com/marketplace/{location}/search?query={query}&sortBy=creation_time_descend'
+)
+SCANNER_USER_AGENT = config('SCANNER_USER_AGENT', default='Mozilla/5.0 (compatible; FlippyScanner/1.0)')
+SCANNER_CONCURRENCY = config('SCANNER_CONCURRENCY', default=16, cast=int)  # In-flight requests overall
+SCANNER_PER_HOST_CONCURRENCY = config('SCANNER_PER_HOST_CONCURRENCY', default=4, cast=int)
+SCANNER_MAX_RETRIES = config('SCANNER_MAX_RETRIES', default=3, cast=int)
+SCANNER_BACKOFF = config('SCANNER_BACKOFF', default=1.0, cast=float)  # Seconds, doubled per retry
+SCANNER_MAX_BACKOFF = config('SCANNER_MAX_BACKOFF', default=60, cast=float)  # Seconds, also caps Retry-After
+SCANNER_TIMEOUT = config('SCANNER_TIMEOUT', default=15, cast=float)
+SCANNER_MAX_PAGES = config('SCANNER_MAX_PAGES', default=5, cast=int)
+SCANNER_FETCH_DETAILS = config('SCANNER_FETCH_DETAILS', default='True').lower() == 'true'
+SCANNER_BATCH_SIZE = config('SCANNER_BATCH_SIZE', default=500, cast=int)  # Listings per ingest transaction
+SCANNER_HIGH_WATER_KEYS = config('SCANNER_HIGH_WATER_KEYS', default=200, cast=int)  # Known listings kept per pair
+SCANNER_FULL_RESCAN_INTERVAL = config('SCANNER_FULL_RESCAN_INTERVAL', default=24 * 60 * 60, cast=int)  # Seconds
+# Distributed workers (run_scanners --worker, see main/workqueue.py)
+SCANNER_SCAN_INTERVAL = config('SCANNER_SCAN_INTERVAL', default=300, cast=int)  # Seconds between scans of a pair
+SCANNER_RETRY_INTERVAL = config('SCANNER_RETRY_INTERVAL', default=60, cast=int)  # After a failed scan
+SCANNER_LEASE_SECONDS = config('SCANNER_LEASE_SECONDS', default=120, cast=int)
+SCANNER_CLAIM_BATCH = config('SCANNER_CLAIM_BATCH', default=32, cast=int)  # Work units claimed at a time
+SCANNER_IDLE_SLEEP = config('SCANNER_IDLE_SLEEP', default=5, cast=float)  # Seconds to wait when nothing is due
+SCANNER_SYNC_INTERVAL = config('SCANNER_SYNC_INTERVAL', default=60, cast=float)  # Max seconds between work unit syncs
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),